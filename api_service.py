@@ -0,0 +1,387 @@
+# api_service.py
+#
+# Headless HTTP-API für den Reiseplaner (ASGI, Starlette). Dieselben Kernfunktionen wie die
+# Streamlit-Apps (oev_core, ojp_client, gtfs_rt_client), aber ohne Skript-Durchlauf pro Klick –
+# für Mobile-, Partner- und Lasttests.
+#
+#   python api_service.py --port 8000 --workers 4
+#   OJP_URL=http://127.0.0.1:8765/ojp2020 python api_service.py      # gegen den OJP-Stub
+#
+# Endpunkte (JSON):
+#   POST /v1/slots      {"messages": [{"role": "user", "content": "..."}]}  → LLM-Antwort + Reiseinfos
+#   GET  /v1/stops      ?name=Luzern                                       → Haltestellen
+#   POST /v1/trips      {"start": "Luzern", "ziel": "Zürich HB", "datum": ..., "uhrzeit": ...}
+#   POST /v1/map-path   wie /v1/trips, "verbindung": 0 (schnellste) … | "alle" → [[lon, lat], ...]
+#   GET  /v1/delays     ?stop_id=8505000&limit=10                          → Verspätungen
+#   GET  /healthz, GET /metrics (Prometheus, aus tracing)
+#
+# Mehrere Worker-Prozesse teilen sich Trip-Cache und Rate-Limit nur über die gemeinsamen
+# Backends: TRIP_CACHE_SQLITE bzw. TRIP_CACHE_REDIS_URL und RATE_LIMIT_SQLITE setzen.
+
+import argparse
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import anyio
+import requests
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Match, Route
+
+import gtfs_rt_client
+import ojp_client
+import tracing
+from llm_gateway import LLM_MAX_PARALLEL, LLMGateway, LLMNichtVerfuegbar
+from llm_router import EXTRAKTION, ModellRouter
+from oev_core import (
+    get_duration_and_transfers, nachrichten, normalisiere_reiseinfos, normalisiere_uhrzeit, parse_trips,
+    pfade_aus_trip_xml, reiseinfos_aus_antwort, replace_date_keywords, trip_abfrage, trip_fenster_suche,
+)
+from rate_limiter import QuotaErschoepft
+
+load_dotenv()
+OPENAI_API_KEY  = os.environ.get("OPENAI_API_KEY")
+OJP_API_KEY     = os.environ.get("OJP_API_KEY")
+GTFS_RT_API_KEY = os.environ.get("GTFS_RT_API_KEY")
+
+LLM_MODELL = os.environ.get("API_LLM_MODELL", "gpt-4o")
+# Blockierende Aufrufe (requests, XML-Parsing) laufen im Threadpool; so viele gleichzeitig pro Worker
+API_THREADS = int(os.environ.get("API_THREADS", "64"))
+# LLM-Aufrufe blockieren bis Timeout × Versuche: eigene Threads (Standard wie die Parallelitäts-
+# grenze des Gateways), damit sie den Threadpool von /v1/trips und /v1/stops nicht aushungern
+API_LLM_THREADS = int(os.environ.get("API_LLM_THREADS", str(LLM_MAX_PARALLEL)))
+# Der GTFS-RT-Feed wird pro Worker höchstens so oft neu geladen (der Anbieter aktualisiert ~30 s)
+DELAY_MAX_ALTER_S = float(os.environ.get("API_DELAY_MAX_ALTER_S", "30"))
+
+ROUTES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routes.txt")
+
+
+class Fehler(Exception):
+    """Fachlicher Fehler mit HTTP-Status, wird als {"fehler": ...} ausgeliefert."""
+
+    def __init__(self, status: int, meldung: str):
+        super().__init__(meldung)
+        self.status = status
+        self.meldung = meldung
+
+# ------------------------- 1) Geteilter Zustand pro Worker -------------------------
+
+class DelayStand:
+    """
+    Delay-Index des zuletzt geladenen GTFS-RT-Feeds (stop_id → Verspätungen).
+    Ein Feed-Download und ein Durchlauf über alle Entities bedienen beliebig viele
+    Haltestellen-Abfragen, bis der Stand älter als `max_alter_s` ist.
+    """
+
+    def __init__(self, max_alter_s: float = DELAY_MAX_ALTER_S):
+        self.max_alter_s = max_alter_s
+        self._lock = threading.Lock()
+        self._index = None
+        self._geladen = 0.0
+
+    def index(self, api_key: str) -> dict:
+        with self._lock:
+            if self._index is None or time.monotonic() - self._geladen > self.max_alter_s:
+                feed = gtfs_rt_client.fetch_feed(api_key)
+                ojp_client.trip_cache.invalidiere_aus_feed(feed)
+                self._index = gtfs_rt_client.baue_delay_index(feed)
+                self._geladen = time.monotonic()
+            return self._index
+
+
+delay_stand = DelayStand()
+route_map: dict = {}
+llm = None
+llm_threads = None   # anyio.CapacityLimiter, in lebenszyklus angelegt
+
+# ------------------------- 2) Hilfsfunktionen -------------------------
+
+async def _json_body(request: Request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise Fehler(400, "Body ist kein gültiges JSON.")
+    if not isinstance(body, dict):
+        raise Fehler(400, "Body muss ein JSON-Objekt sein.")
+    return body
+
+
+def _pflicht(werte: dict, *namen: str):
+    fehlend = [n for n in namen if not werte.get(n)]
+    if fehlend:
+        raise Fehler(400, f"Fehlende Felder: {', '.join(fehlend)}")
+
+
+def _pruefe_reise(body: dict):
+    """
+    Prüft Typ und Format der Reisefelder vom Client. Anders als beim LLM wird hier nichts
+    still korrigiert ('25:99' → 08:00, 'garbage' → heute): Ungültiges ergibt 400 mit dem Feldnamen.
+    """
+    for feld in ("start", "ziel", "start_id", "ziel_id", "datum", "uhrzeit", "uhrzeit_bis", "typ"):
+        if body.get(feld) is not None and not isinstance(body[feld], str):
+            raise Fehler(400, f"Feld '{feld}' muss ein String sein.")
+    try:
+        datetime.strptime(body["datum"], "%Y-%m-%d")
+    except ValueError:
+        raise Fehler(400, "Feld 'datum' muss ein Datum im Format YYYY-MM-DD sein.")
+    for feld in ("uhrzeit", "uhrzeit_bis"):
+        if body.get(feld) and normalisiere_uhrzeit(body[feld], standard=None) is None:
+            raise Fehler(400, f"Feld '{feld}' muss eine Uhrzeit im Format HH:MM[:SS] sein.")
+    if body.get("typ") is not None and body["typ"] not in ("abfahrt", "ankunft"):
+        raise Fehler(400, "Feld 'typ' muss 'abfahrt' oder 'ankunft' sein.")
+
+
+def _verlauf(body: dict) -> list[dict]:
+    """
+    Gesprächsverlauf aus /v1/slots: Liste von Objekten mit String-Feldern "role" und "content".
+    Andere Rollen als user/assistant werden übergangen; relative Datumsangaben der Nutzer-
+    nachrichten wie in der App vor dem LLM-Aufruf aufgelöst.
+    """
+    verlauf = body.get("messages")
+    if not isinstance(verlauf, list) or not verlauf:
+        raise Fehler(400, "Feld 'messages' muss eine nicht-leere Liste sein.")
+    bereinigt = []
+    for i, m in enumerate(verlauf):
+        if not (isinstance(m, dict) and isinstance(m.get("role"), str) and isinstance(m.get("content"), str)):
+            raise Fehler(400, f"messages[{i}] muss ein Objekt mit den Strings 'role' und 'content' sein.")
+        if m["role"] not in ("user", "assistant"):
+            continue
+        inhalt = replace_date_keywords(m["content"]) if m["role"] == "user" else m["content"]
+        bereinigt.append({"role": m["role"], "content": inhalt})
+    return bereinigt
+
+
+def _haltestelle(name: str, stop_id: str = None) -> tuple[str, str]:
+    """(stop_id, stop_name); ohne ID wird der beste Treffer der Ortssuche genommen."""
+    if not name and not stop_id:
+        raise Fehler(400, "Start und Ziel als Name oder ID angeben.")
+    if stop_id:
+        return stop_id, name or stop_id
+    treffer = ojp_client.stop_place_lookup(name, OJP_API_KEY)
+    if not treffer:
+        raise Fehler(404, f"Keine Haltestelle gefunden für {name!r}.")
+    exakt = [t for t in treffer if t[1].strip().lower() == name.strip().lower()]
+    return (exakt or treffer)[0]
+
+
+def _trip_xml(body: dict) -> tuple[str, dict]:
+    """Löst Start/Ziel auf und holt die TripResponse (über Trip-Cache, ggf. als Zeitfenster)."""
+    # Das Datum kommt hier vom Client, nicht vom LLM: ein explizit genanntes Jahr nicht "korrigieren"
+    reiseinfos = {k: body[k] for k in ("datum", "uhrzeit", "uhrzeit_bis", "typ") if k in body}
+    normalisiere_reiseinfos(reiseinfos, user_input=body["datum"])
+    start_id, start_name = _haltestelle(body.get("start"), body.get("start_id"))
+    ziel_id, ziel_name = _haltestelle(body.get("ziel"), body.get("ziel_id"))
+    args = (start_id, start_name, ziel_id, ziel_name, reiseinfos["datum"], reiseinfos["uhrzeit"])
+    if reiseinfos.get("uhrzeit_bis"):
+        xml_text = trip_fenster_suche(*args, reiseinfos["uhrzeit_bis"], OJP_API_KEY,
+                                      typ=reiseinfos["typ"], requestor_ref="API")
+    else:
+        xml_text = trip_abfrage(*args, OJP_API_KEY, typ=reiseinfos["typ"], requestor_ref="API")
+    reiseinfos.update(start_id=start_id, start=start_name, ziel_id=ziel_id, ziel=ziel_name)
+    return xml_text, reiseinfos
+
+
+def _trips(body: dict) -> dict:
+    xml_text, reiseinfos = _trip_xml(body)
+    with tracing.span("parse_trips"):
+        best, alts = parse_trips(xml_text)
+    return {
+        "reise": reiseinfos,
+        "verbindungen": [
+            {"schritte": steps, "zusammenfassung": get_duration_and_transfers(steps)}
+            for steps in ([best] if best else []) + alts
+        ],
+    }
+
+
+def _map_pfad(body: dict) -> dict:
+    xml_text, reiseinfos = _trip_xml(body)
+    # Reihenfolge wie "verbindungen" von /v1/trips: 0 = schnellste, i = Alternative i
+    pfade = [t["pfad"] for t in pfade_aus_trip_xml(xml_text)]
+    auswahl = body.get("verbindung", 0)
+    if auswahl == "alle":
+        return {"reise": reiseinfos, "pfade": pfade}
+    if not isinstance(auswahl, int) or not 0 <= auswahl < len(pfade):
+        raise Fehler(404, f"Verbindung {auswahl!r} nicht vorhanden ({len(pfade)} Verbindungen).")
+    return {"reise": reiseinfos, "verbindung": auswahl, "pfad": pfade[auswahl]}
+
+
+def _delays(stop_id: str, limit: int) -> list[dict]:
+    index = delay_stand.index(GTFS_RT_API_KEY)
+    return [
+        {
+            "linie":     gtfs_rt_client.linien_name(d["route_id"], route_map),
+            "route_id":  d["route_id"],
+            "richtung":  d["headsign"],
+            "geplant":   d["scheduled"].isoformat(),
+            "erwartet":  d["predicted"].isoformat(),
+            "delay_s":   d["delay_s"],
+        }
+        for d in index.get(stop_id, [])[:limit]
+    ]
+
+# ------------------------- 3) Endpunkte -------------------------
+
+async def slots(request: Request):
+    if llm is None:
+        raise Fehler(503, "LLM nicht konfiguriert (OPENAI_API_KEY fehlt).")
+    bereinigt = _verlauf(await _json_body(request))
+    # Statischer System-Prompt vorne, damit das Prompt-Caching des Anbieters greift
+    messages = nachrichten(bereinigt)
+    letzte_eingabe = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+
+    try:
+        # Wartende Anfragen warten asynchron auf einen LLM-Thread, nicht im allgemeinen Threadpool
+        reply = await anyio.to_thread.run_sync(llm.text, messages, EXTRAKTION, limiter=llm_threads)
+    except LLMNichtVerfuegbar as e:
+        raise Fehler(503, f"LLM nicht erreichbar: {e}") from e
+
+    reiseinfos = reiseinfos_aus_antwort(reply)
+    if reiseinfos is not None:
+        normalisiere_reiseinfos(reiseinfos, letzte_eingabe)
+    return JSONResponse({"antwort": reply, "reiseinfos": reiseinfos})
+
+
+async def stops(request: Request):
+    name = request.query_params.get("name", "").strip()
+    if not name:
+        raise Fehler(400, "Parameter 'name' fehlt.")
+    treffer = await run_in_threadpool(ojp_client.stop_place_lookup, name, OJP_API_KEY)
+    return JSONResponse({"haltestellen": [{"id": ref, "name": n} for ref, n in treffer or []]})
+
+
+async def trips(request: Request):
+    body = await _json_body(request)
+    _pflicht(body, "datum", "uhrzeit")
+    _pruefe_reise(body)
+    return JSONResponse(await run_in_threadpool(_trips, body))
+
+
+async def map_path(request: Request):
+    body = await _json_body(request)
+    _pflicht(body, "datum", "uhrzeit")
+    _pruefe_reise(body)
+    return JSONResponse(await run_in_threadpool(_map_pfad, body))
+
+
+async def delays(request: Request):
+    if not GTFS_RT_API_KEY:
+        raise Fehler(503, "GTFS-RT nicht konfiguriert (GTFS_RT_API_KEY fehlt).")
+    stop_id = request.query_params.get("stop_id", "").strip()
+    if not stop_id:
+        raise Fehler(400, "Parameter 'stop_id' fehlt.")
+    try:
+        limit = int(request.query_params.get("limit", "10"))
+    except ValueError:
+        raise Fehler(400, "Parameter 'limit' muss eine Zahl sein.")
+    return JSONResponse({"stop_id": stop_id, "verspaetungen": await run_in_threadpool(_delays, stop_id, limit)})
+
+
+async def healthz(request: Request):
+    return JSONResponse({"status": "ok", "llm": llm is not None, "gtfs_rt": bool(GTFS_RT_API_KEY)})
+
+
+async def metrics(request: Request):
+    return PlainTextResponse(tracing.registry.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+# ------------------------- 4) App & Fehlerbehandlung -------------------------
+
+async def _fachlicher_fehler(request: Request, exc: Fehler):
+    return JSONResponse({"fehler": exc.meldung}, status_code=exc.status)
+
+
+async def _quota(request: Request, exc: QuotaErschoepft):
+    return JSONResponse({"fehler": "API-Kontingent ausgeschöpft."}, status_code=429,
+                        headers={"Retry-After": "60"})
+
+
+async def _upstream(request: Request, exc: requests.HTTPError):
+    status = exc.response.status_code if exc.response is not None else None
+    return JSONResponse({"fehler": "Upstream-Fehler", "upstream_status": status}, status_code=502)
+
+
+async def _ojp_fehler(request: Request, exc: ojp_client.OJPFehler):
+    return JSONResponse({"fehler": "Upstream-Fehler", "meldung": str(exc)}, status_code=502)
+
+
+@asynccontextmanager
+async def lebenszyklus(app):
+    global llm, llm_threads
+    if not OJP_API_KEY:
+        raise RuntimeError("Umgebungsvariable OJP_API_KEY fehlt!")
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_THREADS
+    llm_threads = anyio.CapacityLimiter(API_LLM_THREADS)
+    route_map.update(gtfs_rt_client.lade_route_map(ROUTES_PATH))
+    if OPENAI_API_KEY or os.environ.get("LLM_FAKE"):
+        try:
+            # Ein Gateway pro Worker (Verbindungspool, Parallelitätsgrenze, SLO-Fallback);
+            # Slot-Filling läuft über den Router zuerst aufs kleine Modell
+            llm = ModellRouter(LLMGateway(api_key=OPENAI_API_KEY, modell=LLM_MODELL))
+        except ImportError:  # ohne openai bleibt nur /v1/slots aus
+            llm = None
+    yield
+
+
+def _span_name(scope) -> str:
+    # Span (und damit Metrik-Serie) nach der Routen-Vorlage, nie nach dem rohen Pfad:
+    # beliebige bzw. 404-Pfade würden sonst unbegrenzt viele Serien in /metrics anlegen
+    for route in routen:
+        if route.matches(scope)[0] != Match.NONE:
+            return f"api.{route.path}"
+    return "api.unbekannt"
+
+
+async def _mit_sitzung(scope, receive, send, app):
+    # Jede Anfrage bekommt eigene Trace-Sitzung (Header X-Sitzung wird übernommen)
+    sitzung = dict(scope.get("headers") or []).get(b"x-sitzung")
+    tracing.setze_sitzung(sitzung.decode() if sitzung else None)
+    with tracing.span(_span_name(scope)):
+        await app(scope, receive, send)
+
+
+routen = [
+    Route("/v1/slots", slots, methods=["POST"]),
+    Route("/v1/stops", stops, methods=["GET"]),
+    Route("/v1/trips", trips, methods=["POST"]),
+    Route("/v1/map-path", map_path, methods=["POST"]),
+    Route("/v1/delays", delays, methods=["GET"]),
+    Route("/healthz", healthz, methods=["GET"]),
+    Route("/metrics", metrics, methods=["GET"]),
+]
+
+_starlette = Starlette(
+    routes=routen,
+    lifespan=lebenszyklus,
+    exception_handlers={
+        Fehler: _fachlicher_fehler,
+        QuotaErschoepft: _quota,
+        requests.HTTPError: _upstream,
+        ojp_client.OJPFehler: _ojp_fehler,
+    },
+)
+
+
+async def app(scope, receive, send):
+    if scope["type"] != "http":
+        await _starlette(scope, receive, send)
+        return
+    await _mit_sitzung(scope, receive, send, _starlette)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Headless HTTP-API für den ÖV-Reiseplaner")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker-Prozesse (für mehr als 1 gemeinsame Cache-/Limit-Backends setzen)")
+    args = parser.parse_args()
+    uvicorn.run("api_service:app", host=args.host, port=args.port, workers=args.workers,
+                log_level="info", access_log=False)
@@ -0,0 +1,289 @@
+# benchmark.py
+#
+# Benchmarks für die Chatbot-Pipeline: jede Stufe einzeln und der ganze Durchlauf
+# (LLM → Slots → Haltestellen → Trip → Parsen → Karte), komplett offline mit
+# aufgezeichneten Fixtures, OJP-Stub und Fake-LLM.
+#
+#   python benchmark.py                  # messen und mit benchmark_baseline.json vergleichen
+#   python benchmark.py --speichern      # aktuelle Messung als neue Baseline ablegen
+#   python benchmark.py --stufen parse_trips,end_to_end -n 500
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Vor dem Import von ojp_client: kein gemeinsamer SQLite-Limiter, keine Drosselung gegen den Stub
+os.environ.setdefault("RATE_LIMIT_SQLITE", "")
+os.environ.setdefault("OJP_RATE_PRO_MIN", "1000000")
+os.environ.setdefault("OJP_TAGES_QUOTA", "100000000")
+
+import gtfs_rt_client
+import oev_core
+import ojp_client
+import ojp_stub_server
+from gtfs_rt_replay import synthetischer_feed
+from llm_gateway import FakeLLM, LLMGateway
+from llm_router import EXTRAKTION, ModellRouter
+from oev_core.geometrie import douglas_peucker, eindeutige_indizes, encode_polyline, haversine_m
+from oev_core.karte import kartenansicht
+from poi_index import PoiIndex
+
+BASIS = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PFAD = os.path.join(BASIS, "benchmark_baseline.json")
+TRIP_FIXTURE = os.path.join(BASIS, "fixtures", "ojp", "trip_luzern_zuerich.xml")
+ROUTES_PATH = os.path.join(BASIS, "routes.txt")
+
+# ------------------------- 1) Fake-LLM -------------------------
+
+# Die Slot-Antwort, wie gpt-4o sie am Ende der Rückfragen gibt
+ANTWORT = ('Alles klar! {"start":"Luzern", "ziel":"Zürich HB", "datum":"2025-06-02", '
+           '"uhrzeit":"14:00:00", "typ":"abfahrt"}')
+
+
+def fake_llm(latenz_ms: float = 0) -> ModellRouter:
+    """Router und Gateway wie in den Apps, aber mit FakeLLM statt OpenAI (misst deren Overhead mit)."""
+    return ModellRouter(LLMGateway(client=FakeLLM(ANTWORT, latenz_s=latenz_ms / 1000)))
+
+
+# ------------------------- 2) Messung -------------------------
+
+def _perzentil(werte, p):
+    return werte[min(len(werte) - 1, int(p * len(werte)))]
+
+
+def messen(fn, wiederholungen: int, aufwaermen: int = 3, alloc_laeufe: int = 5) -> dict:
+    """Laufzeit-Perzentile (ms) und Allokationen pro Aufruf (tracemalloc, separat gemessen)."""
+    for _ in range(aufwaermen):
+        fn()
+
+    # Wie timeit: GC während der Zeitmessung aus, sonst streuen die Perzentile stark
+    zeiten = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(wiederholungen):
+            t0 = time.perf_counter_ns()
+            fn()
+            zeiten.append((time.perf_counter_ns() - t0) / 1e6)
+    finally:
+        gc.enable()
+    zeiten.sort()
+
+    # tracemalloc verlangsamt stark – darum nicht während der Zeitmessung
+    spitzen, bloecke = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_laeufe):
+            tracemalloc.reset_peak()
+            vorher = tracemalloc.take_snapshot()
+            basis, _ = tracemalloc.get_traced_memory()
+            fn()
+            _, spitze = tracemalloc.get_traced_memory()
+            spitzen.append(spitze - basis)
+            diff = tracemalloc.take_snapshot().compare_to(vorher, "filename")
+            bloecke.append(sum(max(0, d.count_diff) for d in diff))
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "n": wiederholungen,
+        "p50_ms": round(_perzentil(zeiten, 0.50), 4),
+        "p95_ms": round(_perzentil(zeiten, 0.95), 4),
+        "p99_ms": round(_perzentil(zeiten, 0.99), 4),
+        "mittel_ms": round(statistics.fmean(zeiten), 4),
+        "spitze_kib": round(statistics.median(spitzen) / 1024, 1),
+        "bloecke_netto": int(statistics.median(bloecke)),
+    }
+
+def kalibrierung_ms(laeufe: int = 15) -> float:
+    """
+    Feste Referenzlast (reines Python). Baseline und aktuelle Messung werden damit
+    normalisiert, damit ein langsamerer Rechner nicht als Regression zählt.
+    """
+    def last():
+        d = {}
+        for i in range(20000):
+            d[str(i)] = i * i
+        return sorted(d.values(), reverse=True)
+    return messen(last, laeufe, alloc_laeufe=1)["p50_ms"]
+
+# ------------------------- 3) Stufen -------------------------
+
+def stufen_aufbauen(ojp_url: str, llm: ModellRouter) -> dict:
+    with open(TRIP_FIXTURE, encoding="utf-8") as f:
+        trip_xml = f.read()
+    best, alts = oev_core.parse_trips(trip_xml)
+
+    jetzt = int(datetime(2025, 6, 2, 12, 0, tzinfo=timezone.utc).timestamp())
+    feed = synthetischer_feed(1, jetzt=jetzt, seed=0)
+    stop_id = feed.entity[0].trip_update.stop_time_update[0].stop_id
+    feed_jetzt = datetime.fromtimestamp(jetzt, timezone.utc)
+
+    ojp_client.OJP_URL = ojp_url
+    api_key = "benchmark"
+    nachricht = [{"role": "user", "content": "Ich möchte morgen um 14 Uhr von Luzern nach Zürich."}]
+    eroeffnung = [{"role": "system", "content": oev_core.SYSTEM_PROMPT}]
+
+    # Streckenverlauf eines Legs wie aus IncludeLegProjection: 2000 leicht verrauschte Punkte
+    rng = random.Random(0)
+    rng_np = np.random.default_rng(0)
+    leg_track = [[8.31 + i * 2e-4 + rng.uniform(-2e-5, 2e-5), 47.05 + i * 1e-4 + rng.uniform(-2e-5, 2e-5)]
+                 for i in range(2000)]
+
+    # POIs einer dichten Innenstadt (2 km Radius um Zürich HB), ein Zehntel doppelt
+    pois = np.column_stack((8.5402 + rng_np.uniform(-0.027, 0.027, 5000),
+                            47.3782 + rng_np.uniform(-0.018, 0.018, 5000)))
+    pois[::10] = pois[1::10]
+
+    # POI-Extrakt in Grössenordnung Schweiz (200'000 Punkte) gegen die Haltestellen des Trips
+    poi_index = PoiIndex(rng_np.uniform(5.9, 10.5, 200_000), rng_np.uniform(45.8, 47.8, 200_000))
+    haltestellen = oev_core.pfad_aus_trip_xml(trip_xml)
+
+    def trip_xml_bauen():
+        return ojp_client.build_trip_xml("8505000", "Luzern", "8503000", "Zürich HB",
+                                         "2025-06-02", "14:00:00")
+
+    def parse_and_sort_trips():
+        # Wie die CLI: Datei lesen, sortieren und jede Zeile formatieren (ohne print)
+        with open(TRIP_FIXTURE, "rb") as f:
+            for steps, _ in oev_core.trips_nach_dauer(f.read()):
+                for j, s in enumerate(steps, 1):
+                    oev_core.schritt_text(j, s, ohne_gleis="–")
+
+    def stop_place_lookup():
+        # Upstream-Weg messen, nicht den Haltestellen-Cache
+        ojp_client._orte_cache.clear()
+        return ojp_client.stop_place_lookup("Luzern", api_key)
+
+    def end_to_end():
+        ojp_client._orte_cache.clear()
+        text = oev_core.replace_date_keywords(nachricht[0]["content"])
+        slots = oev_core.reiseinfos_aus_antwort(llm.text([{"role": "user", "content": text}], EXTRAKTION))
+        start = ojp_client.stop_place_lookup(slots["start"], api_key)[0]
+        ziel = ojp_client.stop_place_lookup(slots["ziel"], api_key)[0]
+        resp = ojp_client.trip_request(
+            ojp_client.build_trip_xml(start[0], start[1], ziel[0], ziel[1], slots["datum"], slots["uhrzeit"]),
+            api_key,
+        )
+        steps, alts = oev_core.parse_trips(resp.text)
+        for s in [steps] + alts:
+            oev_core.get_duration_and_transfers(s)
+        oev_core.pfad_aus_trip_xml(resp.text)
+
+    return {
+        "replace_date_keywords": lambda: oev_core.replace_date_keywords(nachricht[0]["content"]),
+        "slot_extraktion": lambda: oev_core.reiseinfos_aus_antwort(llm.text(nachricht, EXTRAKTION)),
+        # Eröffnungsfrage (nur System-Prompt) aus dem Antwort-Cache
+        "llm_eroeffnung_cache": lambda: llm.text(eroeffnung, cache_ttl_s=60),
+        "stop_place_lookup": stop_place_lookup,
+        "trip_xml_bauen": trip_xml_bauen,
+        "trip_request": lambda: ojp_client.trip_request(trip_xml_bauen(), api_key),
+        "parse_trips": lambda: oev_core.parse_trips(trip_xml),
+        "parse_and_sort_trips": parse_and_sort_trips,
+        "get_duration_and_transfers": lambda: oev_core.get_duration_and_transfers(best),
+        "trip_digest": lambda: oev_core.trip_digest(best, alts),
+        "karte_pfad": lambda: oev_core.pfad_aus_trip_xml(trip_xml),
+        "karte_pfade": lambda: oev_core.pfade_aus_trip_xml(trip_xml),
+        "leg_track_vereinfachen": lambda: encode_polyline(douglas_peucker(leg_track)),
+        "poi_ansicht": lambda: kartenansicht(pois),
+        "poi_distanzen": lambda: haversine_m(pois, (8.5402, 47.3782)),
+        "poi_duplikate": lambda: eindeutige_indizes(pois),
+        "poi_haltestellen": lambda: poi_index.umkreis(haltestellen, 500),
+        "route_map_laden": lambda: gtfs_rt_client.lade_route_map(ROUTES_PATH),
+        "parse_delays_for_stop": lambda: gtfs_rt_client.parse_delays_for_stop(feed, stop_id, jetzt=feed_jetzt),
+        "end_to_end": end_to_end,
+    }
+
+# ------------------------- 4) Baseline -------------------------
+
+def vergleichen(ergebnisse: dict, baseline: dict, toleranz: float, faktor: float = 1.0) -> list[str]:
+    """
+    Regression = p50 oder Speicherspitze mehr als `toleranz` über der Baseline.
+    `faktor` (Kalibrierung jetzt / Kalibrierung Baseline) gleicht die Rechnergeschwindigkeit aus.
+    """
+    regressionen = []
+    for name, neu in ergebnisse.items():
+        alt = baseline.get("stufen", {}).get(name)
+        if not alt:
+            continue
+        for feld, skala in (("p50_ms", faktor), ("spitze_kib", 1.0)):
+            erwartet = alt[feld] * skala
+            if erwartet and neu[feld] > erwartet * (1 + toleranz):
+                regressionen.append(f"{name}: {feld} {erwartet:.3f} → {neu[feld]} (+{neu[feld] / erwartet - 1:.0%})")
+    return regressionen
+
+
+def _tabelle(ergebnisse: dict, baseline: dict, faktor: float = 1.0):
+    print(f"{'Stufe':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'KiB':>9}{'Blöcke':>9}{'Δ p50':>9}")
+    for name, r in ergebnisse.items():
+        alt = baseline.get("stufen", {}).get(name)
+        delta = f"{r['p50_ms'] / (alt['p50_ms'] * faktor) - 1:+.0%}" if alt and alt["p50_ms"] else "–"
+        print(f"{name:<28}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+              f"{r['spitze_kib']:>9.1f}{r['bloecke_netto']:>9}{delta:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks der Chatbot-Pipeline (offline)")
+    parser.add_argument("-n", "--wiederholungen", type=int, default=200)
+    parser.add_argument("--stufen", default="", help="Kommagetrennte Auswahl (Standard: alle)")
+    parser.add_argument("--baseline", default=BASELINE_PFAD)
+    parser.add_argument("--speichern", action="store_true", help="Ergebnis als neue Baseline speichern")
+    parser.add_argument("--toleranz", type=float, default=0.25, help="Erlaubte Verschlechterung (0.25 = +25 %%)")
+    parser.add_argument("--llm-latenz-ms", type=float, default=0)
+    parser.add_argument("--ojp-latenz-ms", type=float, default=0)
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    args = parser.parse_args()
+
+    server, url = ojp_stub_server.starte_server(latenz_ms=args.ojp_latenz_ms, seed=0)
+    try:
+        stufen = stufen_aufbauen(url, fake_llm(args.llm_latenz_ms))
+        auswahl = [s.strip() for s in args.stufen.split(",") if s.strip()] or list(stufen)
+        unbekannt = set(auswahl) - stufen.keys()
+        if unbekannt:
+            raise SystemExit(f"Unbekannte Stufe(n): {', '.join(sorted(unbekannt))}")
+        kalibrierung = kalibrierung_ms()
+        ergebnisse = {name: messen(stufen[name], args.wiederholungen) for name in auswahl}
+        kalibrierung = min(kalibrierung, kalibrierung_ms())
+    finally:
+        server.shutdown()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    faktor = kalibrierung / baseline["kalibrierung_ms"] if baseline.get("kalibrierung_ms") else 1.0
+
+    if args.json:
+        print(json.dumps({"kalibrierung_ms": kalibrierung, "stufen": ergebnisse}, indent=2, ensure_ascii=False))
+    else:
+        _tabelle(ergebnisse, baseline, faktor)
+        print(f"Kalibrierung: {kalibrierung:.3f} ms (Faktor gegenüber Baseline {faktor:.2f})")
+
+    if args.speichern:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "erstellt": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "maschine": platform.machine(),
+                "kalibrierung_ms": kalibrierung,
+                "stufen": {**baseline.get("stufen", {}), **ergebnisse},
+            }, f, indent=2, ensure_ascii=False)
+        print(f"💾 Baseline gespeichert: {args.baseline}")
+    elif baseline:
+        regressionen = vergleichen(ergebnisse, baseline, args.toleranz, faktor)
+        if regressionen:
+            print("❌ Regressionen gegenüber der Baseline:")
+            for r in regressionen:
+                print(f"   {r}")
+            sys.exit(1)
+        print("✅ Keine Regression gegenüber der Baseline.")
@@ -10,6 +10,8 @@ CREATE TABLE IF NOT EXISTS Nutzerprofil (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
     adresse TEXT,
+    adresse_lat REAL,          -- einmalig geocodiert (python geocoding.py profile)
+    adresse_lon REAL,
     barrierefrei TEXT,         -- 'ja' oder 'nein'
     rasches_umsteigen TEXT,    -- 'ja' oder 'nein'
     eigenes_velo TEXT,         -- 'ja' oder 'nein'
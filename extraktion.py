@@ -1,20 +1,21 @@
 import os
-from openai import OpenAI
 from dotenv import load_dotenv
+from llm_gateway import LLMGateway
+from llm_router import EXTRAKTION, ModellRouter, pruefe_slots
 
 # .env-Datei laden
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 
-client = OpenAI(api_key=api_key)
+# Reine JSON-Extraktion: kleines Modell, grosses nur wenn die Antwort nicht passt
+llm = ModellRouter(LLMGateway(api_key=api_key))
 
 # Benutzereingabe
 eingabe = input("Wohin möchtest du reisen? ")
 
 # Anfrage an OpenAI senden
-antwort = client.chat.completions.create(
-    model="gpt-4o",
-    messages=[
+antwort = llm.chat(
+    [
         {
             "role": "system",
             "content": (
@@ -23,7 +24,9 @@ antwort = client.chat.completions.create(
             )
         },
         {"role": "user", "content": eingabe}
-    ]
+    ],
+    EXTRAKTION,
+    pruefen=lambda text: "{" in text and pruefe_slots(text, felder=("start_name", "ziel_name")),
 )
 
 # Ausgabe anzeigen
@@ -0,0 +1,222 @@
+# geocoding.py
+#
+# Adresse → (lat, lon) mit dauerhaftem Cache (SQLite, Schlüssel = normalisierte Adresse).
+# Nominatim erlaubt höchstens eine Anfrage pro Sekunde: alle Abfragen laufen über den
+# gemeinsamen Token-Bucket ("nominatim"), Batch-Läufe mit niedriger Priorität.
+#
+#   python geocoding.py suche "Bahnhofplatz 1, 3011 Bern"
+#   python geocoding.py profile --db user_data.db     # Nutzerprofil.adresse vorab geocodieren
+#
+# Mit GEOCODER=lokal wird statt Nominatim eine CSV-Datei (adresse,lat,lon) verwendet –
+# für Tests und den Offline-Betrieb (siehe fixtures/geocoding/adressen.csv).
+
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import ssl
+import tempfile
+import time
+import unicodedata
+
+import certifi
+
+from rate_limiter import BATCH, limiter_fuer, prioritaet
+
+BASIS = os.path.dirname(os.path.abspath(__file__))
+
+GEOCODER = os.environ.get("GEOCODER", "nominatim")
+GEOCODING_SQLITE = os.environ.get(
+    "GEOCODING_SQLITE", os.path.join(tempfile.gettempdir(), "oev_geocoding.db")
+)
+GEOCODING_LOKAL_CSV = os.environ.get(
+    "GEOCODING_LOKAL_CSV", os.path.join(BASIS, "fixtures", "geocoding", "adressen.csv")
+)
+
+# Nicht gefundene Adressen nur einen Tag merken – vielleicht kennt OSM sie morgen
+NEGATIV_TTL_S = 24 * 60 * 60
+
+# ------------------------- 1) Normalisierung -------------------------
+
+def normalisiere_adresse(adresse: str) -> str:
+    """
+    Cache-Schlüssel einer Adresse: Gross-/Kleinschreibung, Leerzeichen, Kommas und
+    'str.'/'ß' vereinheitlicht. 'Musterstr. 1 ,3000  Bern' → 'musterstrasse 1, 3000 bern'.
+    """
+    s = unicodedata.normalize("NFKC", adresse or "").casefold().replace("ß", "ss")
+    s = re.sub(r"str\.(?=[\s,\d]|$)", "strasse", s)
+    s = re.sub(r"\s*[,;]+\s*", ", ", s)
+    return re.sub(r"\s+", " ", s).strip(" ,")
+
+# ------------------------- 2) Backends -------------------------
+
+class NominatimBackend:
+    """OSM-Nominatim über geopy; ein Geolocator für alle Abfragen, gedrosselt auf 1/s."""
+
+    name = "nominatim"
+
+    def __init__(self, user_agent: str = "streamlit_shop_app", timeout: float = 10):
+        from geopy.geocoders import Nominatim
+
+        self.timeout = timeout
+        ssl_ctx = ssl.create_default_context(cafile=certifi.where())
+        self._geolocator = Nominatim(user_agent=user_agent, ssl_context=ssl_ctx)
+
+    def geocode(self, adresse: str):
+        limiter_fuer("", "nominatim").acquire()
+        loc = self._geolocator.geocode(adresse, timeout=self.timeout)
+        return (loc.latitude, loc.longitude) if loc else None
+
+
+class LokalBackend:
+    """Nachschlagen in einer CSV-Datei (adresse,lat,lon) – ohne Netz, für Tests."""
+
+    name = "lokal"
+
+    def __init__(self, pfad: str = GEOCODING_LOKAL_CSV):
+        self._daten = {}
+        with open(pfad, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                self._daten[normalisiere_adresse(row["adresse"])] = (float(row["lat"]), float(row["lon"]))
+
+    def geocode(self, adresse: str):
+        return self._daten.get(normalisiere_adresse(adresse))
+
+# ------------------------- 3) Geocoder mit Cache -------------------------
+
+class Geocoder:
+    """
+    Geocoding mit dauerhaftem Cache. Einzelabfragen (interaktiv) und Batch-Läufe teilen
+    denselben Cache; Backend-Fehler werden nicht gecacht, "nicht gefunden" für einen Tag.
+    """
+
+    def __init__(self, backend, sqlite_pfad: str = GEOCODING_SQLITE):
+        self.backend = backend
+        self._sqlite_pfad = sqlite_pfad
+        self.treffer = 0
+        self.abfragen = 0
+        with self._sqlite() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS geocodes (
+                    schluessel TEXT PRIMARY KEY,   -- normalisierte Adresse
+                    lat        REAL,               -- NULL = nicht gefunden
+                    lon        REAL,
+                    quelle     TEXT NOT NULL,
+                    zeit       REAL NOT NULL
+                )
+            """)
+
+    def _sqlite(self):
+        return sqlite3.connect(self._sqlite_pfad, timeout=5)
+
+    def _aus_cache(self, schluessel: str):
+        """(lat, lon), (None, None) für gecachtes "nicht gefunden" oder None ohne Eintrag."""
+        with self._sqlite() as conn:
+            row = conn.execute(
+                "SELECT lat, lon, zeit FROM geocodes WHERE schluessel = ?", (schluessel,)
+            ).fetchone()
+        if row is None or (row[0] is None and row[2] < time.time() - NEGATIV_TTL_S):
+            return None
+        return row[0], row[1]
+
+    def koordinaten(self, adresse: str) -> tuple:
+        """Gibt (lat, lon) zurück oder (None, None)."""
+        schluessel = normalisiere_adresse(adresse)
+        if not schluessel:
+            return None, None
+        gecacht = self._aus_cache(schluessel)
+        if gecacht is not None:
+            self.treffer += 1
+            return gecacht
+
+        self.abfragen += 1
+        try:
+            ergebnis = self.backend.geocode(adresse)
+        except Exception:
+            return None, None
+        lat, lon = ergebnis or (None, None)
+        with self._sqlite() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?)",
+                (schluessel, lat, lon, self.backend.name, time.time())
+            )
+        return lat, lon
+
+    def batch(self, adressen, fortschritt=None) -> dict:
+        """
+        Geocodiert viele Adressen: jede normalisierte Adresse höchstens einmal, mit
+        Batch-Priorität (interaktive Abfragen anderer Nutzer überholen in der Warteschlange).
+        `fortschritt(i, n)` wird nach jeder Adresse aufgerufen. Gibt Adresse → (lat, lon) zurück.
+        """
+        eindeutig = {}
+        for a in adressen:
+            eindeutig.setdefault(normalisiere_adresse(a), a)
+        ergebnis = {}
+        with prioritaet(BATCH):
+            for i, adresse in enumerate(eindeutig.values(), 1):
+                ergebnis[adresse] = self.koordinaten(adresse)
+                if fortschritt:
+                    fortschritt(i, len(eindeutig))
+        return {a: ergebnis[eindeutig[normalisiere_adresse(a)]] for a in adressen}
+
+    def statistik(self) -> dict:
+        with self._sqlite() as conn:
+            eintraege = conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+        return {"eintraege": eintraege, "treffer": self.treffer, "abfragen": self.abfragen,
+                "backend": self.backend.name}
+
+
+def geocoder_aus_umgebung() -> Geocoder:
+    """Backend über GEOCODER ('nominatim' oder 'lokal'), Cache-Datei über GEOCODING_SQLITE."""
+    backend = LokalBackend() if GEOCODER == "lokal" else NominatimBackend()
+    return Geocoder(backend)
+
+# ------------------------- 4) Nutzerprofile vorab geocodieren -------------------------
+
+def profile_geocodieren(db_pfad: str, geocoder: Geocoder) -> int:
+    """
+    Schreibt die Koordinaten von Nutzerprofil.adresse einmalig in adresse_lat/adresse_lon
+    (Spalten werden bei Bedarf angelegt). Nur Profile ohne Koordinaten werden abgefragt.
+    Gibt die Anzahl neu geocodierter Profile zurück.
+    """
+    conn = sqlite3.connect(db_pfad)
+    try:
+        spalten = {row[1] for row in conn.execute("PRAGMA table_info(Nutzerprofil)")}
+        for spalte in ("adresse_lat", "adresse_lon"):
+            if spalte not in spalten:
+                conn.execute(f"ALTER TABLE Nutzerprofil ADD COLUMN {spalte} REAL")
+        rows = conn.execute(
+            "SELECT id, adresse FROM Nutzerprofil "
+            "WHERE adresse IS NOT NULL AND adresse != '' AND adresse_lat IS NULL"
+        ).fetchall()
+        koord = geocoder.batch([adresse for _, adresse in rows])
+        updates = [(*koord[adresse], pid) for pid, adresse in rows if koord[adresse][0] is not None]
+        conn.executemany("UPDATE Nutzerprofil SET adresse_lat = ?, adresse_lon = ? WHERE id = ?", updates)
+        conn.commit()
+    finally:
+        conn.close()
+    return len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geocoding mit Cache")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+    suche = sub.add_parser("suche", help="Eine Adresse geocodieren")
+    suche.add_argument("adresse")
+    profile = sub.add_parser("profile", help="Nutzerprofil.adresse vorab geocodieren")
+    profile.add_argument("--db", default="user_data.db")
+    args = parser.parse_args()
+
+    geocoder = geocoder_aus_umgebung()
+    if args.befehl == "suche":
+        lat, lon = geocoder.koordinaten(args.adresse)
+        print(f"{lat}, {lon}" if lat is not None else "❌ Adresse nicht gefunden.")
+    else:
+        anzahl = profile_geocodieren(args.db, geocoder)
+        print(f"✅ {anzahl} Profile geocodiert.")
+    print(geocoder.statistik())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# gtfs_rt_client.py
+
+import csv
+import os
+from datetime import datetime, timedelta, timezone
+
+import requests
+from google.transit import gtfs_realtime_pb2
+
+import tracing
+from rate_limiter import gedrosselt
+from singleflight import SingleFlight
+
+# Per GTFS_RT_URL lässt sich der Client auf den lokalen Replay-Server umlenken (siehe gtfs_rt_replay.py)
+GTFS_RT_URL = os.environ.get("GTFS_RT_URL", "https://api.opentransportdata.swiss/la/gtfs-rt")
+
+# Keep-Alive-Verbindung für die periodischen Feed-Abrufe
+_session = requests.Session()
+
+# Mehrere Sessions, die gleichzeitig den Feed wollen, teilen sich einen Download
+_flight = SingleFlight()
+
+
+def _download(api_key: str, url: str) -> gtfs_realtime_pb2.FeedMessage:
+    headers = {"Authorization": f"Bearer {api_key}",
+               "User-Agent": "streamlit-delay-bot/1.0",
+               "Accept": "application/octet-stream"}
+    with tracing.span("gtfs_rt.download") as sp:
+        resp = gedrosselt(api_key, "gtfs_rt", _session.get, url, headers=headers)
+        sp.setze(antwort_bytes=len(resp.content), status=resp.status_code)
+    resp.raise_for_status()
+    with tracing.span("gtfs_rt.parse") as sp:
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(resp.content)
+        sp.setze(entities=len(feed.entity))
+    return feed
+
+
+def fetch_feed(api_key: str, url: str = GTFS_RT_URL) -> gtfs_realtime_pb2.FeedMessage:
+    """
+    Lädt den GTFS-RT-Feed und parst ihn als FeedMessage.
+    Wirft requests.HTTPError, wenn der Abruf nicht mit 200 beantwortet wird,
+    und QuotaErschoepft, wenn der Rate-Limiter keinen Abruf mehr zulässt.
+    Den zurückgegebenen Feed nur lesen – er wird zwischen gleichzeitigen Aufrufern geteilt.
+    """
+    return _flight.do(url, _download, api_key, url)
+
+
+def lade_route_map(pfad: str) -> dict[str, dict[str, str]]:
+    """route_id → {'short', 'long'} aus einer GTFS routes.txt (Spaltennamen robust normalisiert)."""
+    route_map = {}
+    with open(pfad, newline='', encoding='utf-8-sig') as csvfile:
+        reader = csv.DictReader(csvfile)
+        # 1) normalize header names
+        if reader.fieldnames:
+            reader.fieldnames = [fn.strip() for fn in reader.fieldnames]
+
+        for row in reader:
+            # 2) finde das "route_id"-Feld case‐insensitive
+            key = next((k for k in row if k.strip().lower() == 'route_id'), None)
+            if not key:
+                continue
+            rid = row[key].strip()
+            if not rid:
+                continue
+
+            # 3) short bzw. long name
+            short = row.get('route_short_name', '').strip()
+            longn = row.get('route_long_name', '').strip()
+            route_map[rid] = {
+                'short': short or '',
+                'long':  longn  or ''
+            }
+    return route_map
+
+
+def linien_name(route_id: str, route_map: dict) -> str:
+    """Anzeigename der Linie, z. B. 'S1 (Luzern–Sursee)'; Fallback auf die rohe route_id."""
+    # Ursprüngliche route_id evtl. im Format 'prefix:ID'
+    raw_id = route_id.split(':', 1)[1] if ':' in route_id else route_id
+    info = route_map.get(raw_id, {'short': raw_id, 'long': ''})
+    s, l = info['short'], info['long']
+    if s and l:
+        return f"{s} ({l})"
+    return s or l or raw_id
+
+
+def _delay_eintrag(tu, ev, pred_dt):
+    return {
+        'route_id':  tu.trip.route_id,
+        'headsign':  getattr(tu.trip, 'trip_headsign', 'unbekannt'),
+        'scheduled': pred_dt - timedelta(seconds=ev.delay),
+        'predicted': pred_dt,
+        'delay_s':   ev.delay
+    }
+
+
+def parse_delays_for_stop(feed: gtfs_realtime_pb2.FeedMessage, stop_id: str, jetzt: datetime = None):
+    """
+    Extrahiert nur Departure-Updates mit delay>0 für eine stop_id und zukünftige Ereignisse.
+    `jetzt` erlaubt reproduzierbare Auswertungen aufgezeichneter Feeds.
+    """
+    now_utc = jetzt or datetime.now(timezone.utc)
+    delays = []
+    for entity in feed.entity:
+        if not entity.HasField('trip_update'):
+            continue
+        tu = entity.trip_update
+        for stu in tu.stop_time_update:
+            if stu.stop_id != stop_id:
+                continue
+            if not stu.HasField('departure') or not stu.departure.time:
+                continue
+            ev = stu.departure
+            pred_dt = datetime.fromtimestamp(ev.time, timezone.utc)
+            if pred_dt < now_utc or not ev.HasField('delay') or ev.delay <= 0:
+                continue
+            delays.append(_delay_eintrag(tu, ev, pred_dt))
+    return sorted(delays, key=lambda x: x['scheduled'])
+
+
+def baue_delay_index(feed: gtfs_realtime_pb2.FeedMessage, jetzt: datetime = None) -> dict:
+    """
+    Ein Durchlauf über den ganzen Feed: stop_id → sortierte Liste der Verspätungen
+    (gleiches Format wie parse_delays_for_stop). Lohnt sich, sobald mehrere
+    Haltestellen gegen denselben Feed abgefragt werden.
+    """
+    now_ts = (jetzt or datetime.now(timezone.utc)).timestamp()
+    index = {}
+    for entity in feed.entity:
+        if not entity.HasField('trip_update'):
+            continue
+        tu = entity.trip_update
+        for stu in tu.stop_time_update:
+            if not stu.HasField('departure'):
+                continue
+            ev = stu.departure
+            if not ev.time or ev.time < now_ts or not ev.HasField('delay') or ev.delay <= 0:
+                continue
+            pred_dt = datetime.fromtimestamp(ev.time, timezone.utc)
+            index.setdefault(stu.stop_id, []).append(_delay_eintrag(tu, ev, pred_dt))
+    for delays in index.values():
+        delays.sort(key=lambda x: x['scheduled'])
+    return index
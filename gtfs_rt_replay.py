@@ -0,0 +1,241 @@
+# gtfs_rt_replay.py
+#
+# GTFS-RT offline: Snapshots aufnehmen, lokal wieder abspielen und synthetische
+# Feeds in beliebiger Grösse erzeugen.
+#
+#   python gtfs_rt_replay.py aufnehmen --ziel fixtures/gtfs_rt --intervall 60 --anzahl 30
+#   python gtfs_rt_replay.py synthetisch --ziel fixtures/gtfs_rt/synthetisch.pb --faktor 10
+#   python gtfs_rt_replay.py abspielen --quelle fixtures/gtfs_rt --tempo 10 --port 8766
+#   GTFS_RT_URL=http://127.0.0.1:8766/la/gtfs-rt streamlit run streamlit_echtzeit.py
+
+import argparse
+import csv
+import glob
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.transit import gtfs_realtime_pb2
+
+ROUTES_PATH = os.path.join(os.path.dirname(__file__), 'routes.txt')
+
+# Grössenordnung des nationalen Feeds (Trip-Updates pro Snapshot)
+NATIONAL_ENTITIES = 4000
+
+# ------------------------- 1) Aufnehmen -------------------------
+
+def aufnehmen(api_key: str, ziel: str, intervall_s: float = 60, anzahl: int = 10):
+    """Speichert `anzahl` Snapshots des Live-Feeds als <header.timestamp>.pb in `ziel`."""
+    from gtfs_rt_client import fetch_feed
+    from rate_limiter import BATCH, prioritaet
+
+    os.makedirs(ziel, exist_ok=True)
+    for i in range(anzahl):
+        with prioritaet(BATCH):
+            feed = fetch_feed(api_key)
+        ts = feed.header.timestamp or int(time.time())
+        pfad = os.path.join(ziel, f"{ts}.pb")
+        with open(pfad, 'wb') as f:
+            f.write(feed.SerializeToString())
+        print(f"📥 {pfad}: {len(feed.entity)} Entities")
+        if i < anzahl - 1:
+            time.sleep(intervall_s)
+
+
+def lade_snapshots(quelle: str) -> list[gtfs_realtime_pb2.FeedMessage]:
+    """Alle .pb-Dateien (Datei oder Verzeichnis), sortiert nach header.timestamp."""
+    pfade = [quelle] if os.path.isfile(quelle) else glob.glob(os.path.join(quelle, '*.pb'))
+    feeds = []
+    for pfad in pfade:
+        feed = gtfs_realtime_pb2.FeedMessage()
+        with open(pfad, 'rb') as f:
+            feed.ParseFromString(f.read())
+        feeds.append(feed)
+    return sorted(feeds, key=lambda f: f.header.timestamp)
+
+# ------------------------- 2) Synthetische Feeds -------------------------
+
+def _route_ids(limit=2000):
+    with open(ROUTES_PATH, newline='', encoding='utf-8-sig') as f:
+        return [row['route_id'] for _, row in zip(range(limit), csv.DictReader(f))]
+
+
+def synthetischer_feed(faktor: float = 10, basis=None, jetzt: int = None, seed: int = 0,
+                       stops_pro_trip=(5, 30)) -> gtfs_realtime_pb2.FeedMessage:
+    """
+    Erzeugt einen Feed mit `faktor` × so vielen Trip-Updates wie der nationale Feed.
+    Mit `basis` (aufgezeichneter Snapshot) werden dessen Entities vervielfältigt und
+    die Verspätungen leicht variiert, sonst entstehen Trips aus routes.txt.
+    """
+    rng = random.Random(seed)
+    jetzt = jetzt or int(time.time())
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = jetzt
+
+    if basis is not None and len(basis.entity):
+        ziel_anzahl = int(len(basis.entity) * faktor)
+        for i in range(ziel_anzahl):
+            vorlage = basis.entity[i % len(basis.entity)]
+            entity = feed.entity.add()
+            entity.CopyFrom(vorlage)
+            entity.id = f"{vorlage.id}-{i}"
+            if entity.HasField('trip_update'):
+                for stu in entity.trip_update.stop_time_update:
+                    for ev in (stu.arrival, stu.departure):
+                        if ev.HasField('delay'):
+                            ev.delay = max(0, ev.delay + rng.randint(-60, 60))
+        return feed
+
+    routen = _route_ids()
+    for i in range(int(NATIONAL_ENTITIES * faktor)):
+        entity = feed.entity.add()
+        entity.id = f"syn-{i}"
+        tu = entity.trip_update
+        tu.trip.trip_id = f"syn-trip-{i}"
+        tu.trip.route_id = rng.choice(routen)
+        t = jetzt + rng.randint(-1800, 3 * 3600)
+        delay = int(rng.expovariate(1 / 90)) if rng.random() < 0.4 else 0
+        for seq in range(rng.randint(*stops_pro_trip)):
+            stu = tu.stop_time_update.add()
+            stu.stop_sequence = seq + 1
+            # UIC-Nummern der Schweiz: 85xxxxx, mit Steig-Suffix wie im Live-Feed
+            stu.stop_id = f"85{rng.randint(0, 9999):05d}:0:{rng.randint(1, 12)}"
+            t += rng.randint(60, 300)
+            delay = max(0, delay + rng.randint(-30, 45))
+            stu.arrival.time = t + delay
+            stu.arrival.delay = delay
+            stu.departure.time = t + delay + 30
+            stu.departure.delay = delay
+    return feed
+
+# ------------------------- 3) Abspielen -------------------------
+
+class Abspieler:
+    """
+    Spielt Snapshots im `tempo`-fachen Echtzeittakt ab. Mit `zeit_verschieben` werden
+    alle Zeitstempel so verschoben, dass der erste Snapshot "jetzt" entspricht –
+    sonst lägen aufgezeichnete Abfahrten in der Vergangenheit.
+    """
+
+    def __init__(self, feeds, tempo: float = 1.0, schleife: bool = True, zeit_verschieben: bool = True):
+        self.tempo = tempo
+        self.schleife = schleife
+        self.start_wand = time.time()
+        self.t0 = feeds[0].header.timestamp
+        versatz = int(self.start_wand - self.t0) if zeit_verschieben else 0
+        self.dauer = max(1, feeds[-1].header.timestamp - self.t0)
+        # Vorab serialisieren, damit eine Anfrage nur noch Bytes kopiert
+        self.snapshots = [(f.header.timestamp - self.t0, self._verschoben(f, versatz)) for f in feeds]
+        self.abrufe = 0
+
+    @staticmethod
+    def _verschoben(feed, versatz) -> bytes:
+        if not versatz:
+            return feed.SerializeToString()
+        kopie = gtfs_realtime_pb2.FeedMessage()
+        kopie.CopyFrom(feed)
+        kopie.header.timestamp += versatz
+        for entity in kopie.entity:
+            if entity.HasField('trip_update'):
+                for stu in entity.trip_update.stop_time_update:
+                    for ev in (stu.arrival, stu.departure):
+                        if ev.time:
+                            ev.time += versatz
+        return kopie.SerializeToString()
+
+    def aktuell(self) -> bytes:
+        self.abrufe += 1
+        feed_zeit = (time.time() - self.start_wand) * self.tempo
+        if self.schleife:
+            feed_zeit %= self.dauer + 1
+        aktuell = self.snapshots[0][1]
+        for rel, daten in self.snapshots:
+            if rel > feed_zeit:
+                break
+            aktuell = daten
+        return aktuell
+
+
+def starte_server(abspieler: Abspieler, host="127.0.0.1", port=0):
+    """Startet den Replay-Server im Hintergrund. Gibt (server, url) zurück."""
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Header und Body gehen als zwei Writes raus – ohne TCP_NODELAY hängt jede
+        # Keep-Alive-Antwort ~40 ms im Delayed-ACK des Clients (pooled requests.Session)
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            body = abspieler.aktuell()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), ReplayHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/la/gtfs-rt"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GTFS-RT aufnehmen, abspielen und synthetisch erzeugen")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+
+    p_auf = sub.add_parser("aufnehmen", help="Snapshots des Live-Feeds speichern (GTFS_RT_API_KEY aus .env)")
+    p_auf.add_argument("--ziel", default="fixtures/gtfs_rt")
+    p_auf.add_argument("--intervall", type=float, default=60)
+    p_auf.add_argument("--anzahl", type=int, default=10)
+
+    p_syn = sub.add_parser("synthetisch", help="Synthetischen Feed erzeugen")
+    p_syn.add_argument("--ziel", default="fixtures/gtfs_rt/synthetisch.pb")
+    p_syn.add_argument("--faktor", type=float, default=10, help="Vielfaches des nationalen Feeds")
+    p_syn.add_argument("--basis", default=None, help="Aufgezeichneter Snapshot als Vorlage")
+    p_syn.add_argument("--seed", type=int, default=0)
+
+    p_ab = sub.add_parser("abspielen", help="Snapshots per HTTP ausliefern")
+    p_ab.add_argument("--quelle", default="fixtures/gtfs_rt")
+    p_ab.add_argument("--tempo", type=float, default=1.0)
+    p_ab.add_argument("--host", default="127.0.0.1")
+    p_ab.add_argument("--port", type=int, default=8766)
+    p_ab.add_argument("--originalzeiten", action="store_true", help="Zeitstempel nicht auf jetzt verschieben")
+    p_ab.add_argument("--einmal", action="store_true", help="Nach dem letzten Snapshot nicht von vorn beginnen")
+
+    args = parser.parse_args()
+
+    if args.befehl == "aufnehmen":
+        from dotenv import load_dotenv
+        load_dotenv()
+        try:
+            GTFS_RT_API_KEY = os.environ["GTFS_RT_API_KEY"]
+        except KeyError as e:
+            raise RuntimeError(f"Umgebungsvariable {e.args[0]} fehlt!") from None
+        aufnehmen(GTFS_RT_API_KEY, args.ziel, args.intervall, args.anzahl)
+
+    elif args.befehl == "synthetisch":
+        basis = lade_snapshots(args.basis)[0] if args.basis else None
+        feed = synthetischer_feed(args.faktor, basis=basis, seed=args.seed)
+        os.makedirs(os.path.dirname(args.ziel) or ".", exist_ok=True)
+        with open(args.ziel, 'wb') as f:
+            f.write(feed.SerializeToString())
+        print(f"🧪 {args.ziel}: {len(feed.entity)} Entities")
+
+    else:
+        feeds = lade_snapshots(args.quelle)
+        if not feeds:
+            raise SystemExit(f"Keine .pb-Snapshots in {args.quelle} gefunden.")
+        abspieler = Abspieler(feeds, args.tempo, schleife=not args.einmal,
+                              zeit_verschieben=not args.originalzeiten)
+        server, url = starte_server(abspieler, args.host, args.port)
+        print(f"▶️ Replay von {len(feeds)} Snapshots auf {url} (Tempo {args.tempo}×)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
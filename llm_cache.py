@@ -0,0 +1,128 @@
+# llm_cache.py
+#
+# Antwort-Cache für LLM-Aufrufe mit deterministischen Eingaben (z. B. Eröffnungsfrage:
+# immer nur der System-Prompt). Schlüssel = Hash über Modell, Parameter und Nachrichten
+# (exakt, Leerzeichen am Rand normalisiert). Stufe 1 ist ein LRU im Prozess, optional
+# teilen mehrere Prozesse eine SQLite-Datei (LLM_CACHE_SQLITE).
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def prompt_schluessel(modell: str, messages: list, **kwargs) -> str:
+    """SHA-256 über Modell, Parameter und (role, content) aller Nachrichten."""
+    nachrichten = [(m.get("role"), str(m.get("content", "")).strip()) for m in messages]
+    roh = json.dumps([modell, sorted(kwargs.items()), nachrichten], ensure_ascii=False, default=str)
+    return hashlib.sha256(roh.encode("utf-8")).hexdigest()
+
+
+def cachebar(kwargs: dict) -> bool:
+    """
+    Nur deterministische Aufrufe dürfen aus dem Cache kommen: ein ausdrücklich gesetztes
+    temperature > 0 verlangt eine neue Stichprobe pro Aufruf. Ohne temperature entscheidet
+    der Aufrufer mit der TTL.
+    """
+    return not (kwargs.get("temperature") or 0) > 0
+
+
+class LLMAntwortCache:
+    """
+    Prompt-Hash → Antworttext mit TTL pro Eintrag und Obergrenze der Einträge (LRU).
+    Gecacht wird nur, was der Aufrufer ausdrücklich mit einer TTL anfragt.
+    """
+
+    def __init__(self, max_eintraege: int = 256, sqlite_pfad: str = None):
+        self.max_eintraege = max_eintraege
+        self._lru: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.treffer = 0
+        self.fehlschlaege = 0
+
+        self._sqlite_pfad = sqlite_pfad
+        if sqlite_pfad:
+            with self._sqlite() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        key     TEXT PRIMARY KEY,
+                        antwort TEXT NOT NULL,
+                        ablauf  REAL NOT NULL
+                    )
+                """)
+
+    @classmethod
+    def aus_umgebung(cls) -> "LLMAntwortCache":
+        """Konfiguration über LLM_CACHE_MAX und LLM_CACHE_SQLITE."""
+        return cls(
+            max_eintraege=int(os.environ.get("LLM_CACHE_MAX", "256")),
+            sqlite_pfad=os.environ.get("LLM_CACHE_SQLITE") or None,
+        )
+
+    def _sqlite(self):
+        return sqlite3.connect(self._sqlite_pfad, timeout=5)
+
+    # ---------- Lesen / Schreiben ----------
+
+    def get(self, key: str):
+        jetzt = time.time()
+        with self._lock:
+            eintrag = self._lru.get(key)
+            if eintrag and eintrag[0] > jetzt:
+                self._lru.move_to_end(key)
+                self.treffer += 1
+                return eintrag[1]
+            self._lru.pop(key, None)
+
+        eintrag = None
+        if self._sqlite_pfad:
+            with self._sqlite() as conn:
+                row = conn.execute(
+                    "SELECT ablauf, antwort FROM llm_cache WHERE key = ? AND ablauf > ?", (key, jetzt)
+                ).fetchone()
+            eintrag = tuple(row) if row else None
+        with self._lock:
+            if eintrag:
+                self._lru[key] = eintrag
+                self._lru_kuerzen()
+                self.treffer += 1
+                return eintrag[1]
+            self.fehlschlaege += 1
+        return None
+
+    def put(self, key: str, antwort: str, ttl_s: float):
+        eintrag = (time.time() + ttl_s, antwort)
+        with self._lock:
+            self._lru[key] = eintrag
+            self._lru.move_to_end(key)
+            self._lru_kuerzen()
+        if self._sqlite_pfad:
+            with self._sqlite() as conn:
+                conn.execute("DELETE FROM llm_cache WHERE ablauf < ?", (time.time(),))
+                conn.execute("INSERT OR REPLACE INTO llm_cache (key, antwort, ablauf) VALUES (?, ?, ?)",
+                             (key, antwort, eintrag[0]))
+
+    def _lru_kuerzen(self):
+        while len(self._lru) > self.max_eintraege:
+            self._lru.popitem(last=False)
+
+    def leeren(self):
+        with self._lock:
+            self._lru.clear()
+        if self._sqlite_pfad:
+            with self._sqlite() as conn:
+                conn.execute("DELETE FROM llm_cache")
+
+    def statistik(self) -> dict:
+        with self._lock:
+            eintraege = len(self._lru)
+        anfragen = self.treffer + self.fehlschlaege
+        return {
+            "eintraege": eintraege,
+            "treffer": self.treffer,
+            "fehlschlaege": self.fehlschlaege,
+            "trefferquote": self.treffer / anfragen if anfragen else 0.0,
+        }
@@ -0,0 +1,328 @@
+# llm_gateway.py
+#
+# Ein Zugang für alle LLM-Aufrufe (Streamlit-Apps, CLIs, API-Dienst):
+#   - ein OpenAI-Client mit Verbindungspool pro Gateway
+#   - Timeout pro Aufruf, Wiederholung mit Jitter (Full Jitter, Retry-After wird beachtet)
+#   - Obergrenze gleichzeitiger Aufrufe
+#   - Ausweichen auf ein kleineres/schnelleres Modell, solange das Hauptmodell das
+#     Latenz-SLO verletzt oder nach allen Versuchen nicht antwortet
+#   - Prompt-Caching beim Anbieter: stabiler prompt_cache_key pro System-Prompt, gecachte
+#     und ungecachte Prompt-Tokens pro Aufruf (Span) und kumuliert (statistik)
+#   - Antwort-Cache (llm_cache.py) für Aufrufe mit deterministischen Eingaben, nur auf Wunsch
+#     des Aufrufers (cache_ttl_s); gleichzeitige identische Aufrufe teilen sich eine Anfrage
+#   - LLM_FAKE=1 bzw. FakeLLM als lokaler Ersatz für Tests und Benchmarks
+
+import hashlib
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from collections import deque
+
+import tracing
+from llm_cache import LLMAntwortCache, cachebar, prompt_schluessel
+from singleflight import SingleFlight
+
+LLM_MODELL          = os.environ.get("LLM_MODELL", "gpt-4o")
+LLM_FALLBACK_MODELL = os.environ.get("LLM_FALLBACK_MODELL", "gpt-4o-mini")
+LLM_TIMEOUT_S       = float(os.environ.get("LLM_TIMEOUT_S", "30"))
+LLM_SLO_S           = float(os.environ.get("LLM_SLO_S", "10"))
+LLM_MAX_PARALLEL    = int(os.environ.get("LLM_MAX_PARALLEL", "8"))
+LLM_VERSUCHE        = int(os.environ.get("LLM_VERSUCHE", "3"))
+LLM_PROMPT_CACHE_KEY = os.environ.get("LLM_PROMPT_CACHE_KEY", "1") not in ("", "0")
+
+# OpenAI cacht Präfixe erst ab 1024 Tokens, danach in Schritten von 128 Tokens
+PRAEFIX_MIN_TOKENS = 1024
+PRAEFIX_SCHRITT_TOKENS = 128
+
+
+class LLMNichtVerfuegbar(Exception):
+    """Kein Modell hat geantwortet oder alle Plätze waren zu lange belegt."""
+
+
+def _wiederholbare_fehler() -> tuple:
+    """Transiente Fehler: Timeout, Verbindungsabbruch, 429 und 5xx."""
+    fehler = [TimeoutError, ConnectionError]
+    try:
+        import openai
+
+        fehler += [openai.APITimeoutError, openai.APIConnectionError,
+                   openai.RateLimitError, openai.InternalServerError]
+    except ImportError:
+        pass
+    return tuple(fehler)
+
+
+WIEDERHOLBAR = _wiederholbare_fehler()
+
+
+def praefix_schluessel(messages: list):
+    """
+    prompt_cache_key für den Anbieter: Hash des System-Prompts am Anfang. Aufrufe mit
+    demselben statischen Präfix landen so auf denselben Cache-Knoten; None ohne System-Prompt.
+    """
+    if not messages or messages[0].get("role") != "system":
+        return None
+    return "oev-" + hashlib.sha256(str(messages[0].get("content", "")).encode("utf-8")).hexdigest()[:16]
+
+
+def gecachte_tokens(response) -> int:
+    """Vom Anbieter aus dem Prompt-Cache gelesene Tokens (usage.prompt_tokens_details)."""
+    details = getattr(getattr(response, "usage", None), "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
+
+# ------------------------- 1) Fake für Tests -------------------------
+
+class _Objekt:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+def _antwort(modell: str, text: str, usage=None):
+    """Antwortobjekt mit derselben Form wie bei OpenAI (für FakeLLM und Cache-Treffer)."""
+    return _Objekt(
+        model=modell,
+        choices=[_Objekt(message=_Objekt(role="assistant", content=text))],
+        usage=usage,
+    )
+
+
+class FakeLLM:
+    """
+    Lokaler Ersatz für den OpenAI-Client (gleiche Schnittstelle chat.completions.create).
+    `antwort` ist ein Text oder eine Funktion messages → Text; `fehler` eine Folge von
+    Exceptions, die die nächsten Aufrufe der Reihe nach werfen (None = normal antworten).
+    Prompt-Caching wird nachgebildet: gecacht ist der längste schon gesehene Präfix
+    ganzer Nachrichten (ab 1024 Tokens, in 128er-Schritten; ~4 Zeichen pro Token).
+    """
+
+    def __init__(self, antwort="OK", latenz_s: float = 0.0, fehler=()):
+        self.antwort = antwort
+        self.latenz_s = latenz_s
+        self.fehler = deque(fehler)
+        self.aufrufe = []
+        self.chat = _Objekt(completions=_Objekt(create=self.create))
+        self._praefixe = set()
+
+    def create(self, model, messages, **kwargs):
+        self.aufrufe.append({"model": model, "messages": messages, **kwargs})
+        if self.latenz_s:
+            time.sleep(self.latenz_s)
+        if self.fehler:
+            f = self.fehler.popleft()
+            if f is not None:
+                raise f
+        text = self.antwort(messages) if callable(self.antwort) else self.antwort
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        usage = _Objekt(prompt_tokens=prompt_tokens, completion_tokens=len(text) // 4,
+                        prompt_tokens_details=_Objekt(cached_tokens=self._praefix_cache(model, messages)))
+        return _antwort(model, text, usage)
+
+    def _praefix_cache(self, model: str, messages: list) -> int:
+        h, zeichen, gecacht = hashlib.sha256(model.encode("utf-8")), 0, 0
+        for m in messages:
+            h.update(json.dumps([m.get("role"), m.get("content")], ensure_ascii=False).encode("utf-8"))
+            zeichen += len(str(m.get("content", "")))
+            if h.hexdigest() in self._praefixe:
+                gecacht = zeichen // 4
+            self._praefixe.add(h.hexdigest())
+        if gecacht < PRAEFIX_MIN_TOKENS:
+            return 0
+        return gecacht - gecacht % PRAEFIX_SCHRITT_TOKENS
+
+# ------------------------- 2) Gateway -------------------------
+
+class LLMGateway:
+    """
+    Chat-Completions mit Timeout, Wiederholung, Parallelitätsgrenze und Fallback-Modell.
+    `client` ist ein OpenAI-Client oder FakeLLM; ohne `client` wird aus `api_key` ein
+    OpenAI-Client mit eigenem Verbindungspool gebaut (eigene Wiederholungen, daher max_retries=0).
+    `cache` ist ein LLMAntwortCache (Standard: aus LLM_CACHE_MAX/LLM_CACHE_SQLITE).
+    """
+
+    def __init__(self, api_key: str = None, client=None, modell: str = LLM_MODELL,
+                 fallback_modell: str = LLM_FALLBACK_MODELL, timeout_s: float = LLM_TIMEOUT_S,
+                 slo_s: float = LLM_SLO_S, max_parallel: int = LLM_MAX_PARALLEL,
+                 versuche: int = LLM_VERSUCHE, abkuehlen_s: float = 60.0, warte_s: float = 30.0,
+                 cache: LLMAntwortCache = None):
+        if client is None:
+            client = FakeLLM() if os.environ.get("LLM_FAKE") else self._openai_client(api_key)
+        self.client = client
+        self.modell = modell
+        self.fallback_modell = fallback_modell
+        self.timeout_s = timeout_s
+        self.slo_s = slo_s
+        self.versuche = versuche
+        self.abkuehlen_s = abkuehlen_s
+        self.warte_s = warte_s
+        self.cache = cache if cache is not None else LLMAntwortCache.aus_umgebung()
+        self._singleflight = SingleFlight()
+
+        self._plaetze = threading.BoundedSemaphore(max_parallel)
+        # Schützt Latenzverlauf und Zähler: das Gateway wird von allen Sitzungen geteilt
+        self._lock = threading.Lock()
+        self._latenzen = deque(maxlen=20)      # Hauptmodell, erfolgreiche Aufrufe
+        self._fallback_bis = 0.0
+        self.aufrufe = 0
+        self.wiederholungen = 0
+        self.fallbacks = 0
+        self.fehler = 0
+        self.prompt_tokens = 0
+        self.gecachte_tokens = 0
+
+    @staticmethod
+    def _openai_client(api_key: str):
+        import openai
+
+        # Der Client hält seinen eigenen Verbindungspool; die Parallelität begrenzt das Gateway
+        return openai.OpenAI(api_key=api_key, max_retries=0)
+
+    def _zaehlen(self, feld: str):
+        with self._lock:
+            setattr(self, feld, getattr(self, feld) + 1)
+
+    # ---------- SLO ----------
+
+    def _slo_verletzt(self) -> bool:
+        """Median der letzten Aufrufe über dem SLO → eine Weile aufs Fallback-Modell ausweichen."""
+        with self._lock:
+            if time.monotonic() < self._fallback_bis:
+                return True
+            if len(self._latenzen) >= 5 and statistics.median(self._latenzen) > self.slo_s:
+                self._fallback_bis = time.monotonic() + self.abkuehlen_s
+                self._latenzen.clear()
+                return True
+        return False
+
+    def _wartezeit(self, versuch: int, fehler: Exception) -> float:
+        antwort = getattr(fehler, "response", None)
+        retry_after = getattr(antwort, "headers", {}).get("retry-after", "") if antwort is not None else ""
+        if retry_after.replace(".", "", 1).isdigit():
+            return min(float(retry_after), 20.0)
+        # Full Jitter: zufällig zwischen 0 und exponentieller Obergrenze
+        return random.uniform(0, min(8.0, 0.5 * 2 ** versuch))
+
+    # ---------- Aufruf ----------
+
+    def _aufruf(self, modell: str, messages: list, timeout_s: float, versuche: int, **kwargs):
+        schluessel = praefix_schluessel(messages) if LLM_PROMPT_CACHE_KEY else None
+        if schluessel and "extra_body" not in kwargs:
+            # Über extra_body, damit auch ältere openai-Versionen ohne Parameter funktionieren
+            kwargs["extra_body"] = {"prompt_cache_key": schluessel}
+        letzter = None
+        for versuch in range(versuche):
+            if versuch:
+                self._zaehlen("wiederholungen")
+                time.sleep(self._wartezeit(versuch, letzter))
+            try:
+                return self.client.chat.completions.create(
+                    model=modell, messages=messages, timeout=timeout_s, **kwargs)
+            except WIEDERHOLBAR as e:
+                letzter = e
+        raise letzter
+
+    def chat(self, messages: list, modell: str = None, timeout_s: float = None,
+             cache_ttl_s: float = None, **kwargs):
+        """
+        Chat-Completion wie client.chat.completions.create; gibt die Antwort des Clients zurück.
+        Mit `cache_ttl_s` wird die Antwort so lange für identische Eingaben wiederverwendet
+        (nur für Aufrufe, deren Antwort nicht vom Verlauf einer einzelnen Sitzung abhängen muss;
+        mit temperature > 0 nie).
+        Wirft LLMNichtVerfuegbar, wenn weder Haupt- noch Fallback-Modell antworten.
+        """
+        modell = modell or self.modell
+        timeout_s = timeout_s or self.timeout_s
+        if not cache_ttl_s or not cachebar(kwargs):
+            return self._chat(messages, modell, timeout_s, **kwargs)[0]
+
+        key = prompt_schluessel(modell, messages, **kwargs)
+        text = self.cache.get(key)
+        if text is not None:
+            with tracing.span("llm.cache", modell=modell) as sp:
+                sp.setze(treffer=True, antwort_bytes=len(text.encode("utf-8")))
+            return _antwort(modell, text)
+
+        def laden():
+            response, fallback = self._chat(messages, modell, timeout_s, **kwargs)
+            # Fallback-Antworten nicht cachen: sie sollen nicht das Hauptmodell verdrängen
+            if not fallback:
+                self.cache.put(key, response.choices[0].message.content or "", cache_ttl_s)
+            return response
+
+        # Viele Sitzungen starten gleichzeitig mit derselben Eröffnung: ein Aufruf für alle
+        return self._singleflight.do(key, laden)
+
+    def _chat(self, messages: list, modell: str, timeout_s: float, **kwargs) -> tuple:
+        """Ein Aufruf mit Wiederholung und Fallback; gibt (Antwort, Fallback benutzt) zurück."""
+        fallback = modell == self.modell and self.fallback_modell and self._slo_verletzt()
+        ziel = self.fallback_modell if fallback else modell
+
+        anfrage_bytes = len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+        with tracing.span("llm.chat", modell=ziel, anfrage_bytes=anfrage_bytes) as sp:
+            if not self._plaetze.acquire(timeout=self.warte_s):
+                self._zaehlen("fehler")
+                raise LLMNichtVerfuegbar(f"Alle {self.modell}-Plätze seit {self.warte_s:.0f} s belegt.")
+            try:
+                self._zaehlen("aufrufe")
+                start = time.monotonic()
+                try:
+                    response = self._aufruf(ziel, messages, timeout_s, self.versuche, **kwargs)
+                except WIEDERHOLBAR as e:
+                    if fallback or ziel != self.modell or not self.fallback_modell:
+                        self._zaehlen("fehler")
+                        raise LLMNichtVerfuegbar(str(e)) from e
+                    # Hauptmodell antwortet nicht: ein Versuch mit dem Fallback-Modell
+                    with self._lock:
+                        self._fallback_bis = time.monotonic() + self.abkuehlen_s
+                    fallback, ziel = True, self.fallback_modell
+                    sp.setze(modell=ziel)
+                    try:
+                        response = self._aufruf(ziel, messages, timeout_s, 1, **kwargs)
+                    except WIEDERHOLBAR as e2:
+                        self._zaehlen("fehler")
+                        raise LLMNichtVerfuegbar(str(e2)) from e2
+                dauer = time.monotonic() - start
+            finally:
+                self._plaetze.release()
+
+            with self._lock:
+                if fallback:
+                    self.fallbacks += 1
+                elif ziel == self.modell:
+                    self._latenzen.append(dauer)
+            sp.setze(fallback=bool(fallback),
+                     antwort_bytes=len((response.choices[0].message.content or "").encode("utf-8")))
+            if getattr(response, "usage", None):
+                gecacht = gecachte_tokens(response)
+                sp.setze(prompt_tokens=response.usage.prompt_tokens, gecachte_tokens=gecacht,
+                         completion_tokens=response.usage.completion_tokens)
+                with self._lock:
+                    self.prompt_tokens += response.usage.prompt_tokens or 0
+                    self.gecachte_tokens += gecacht
+        return response, bool(fallback)
+
+    def text(self, messages: list, **kwargs) -> str:
+        """Nur der Antworttext (ohne führende/abschliessende Leerzeichen)."""
+        return (self.chat(messages, **kwargs).choices[0].message.content or "").strip()
+
+    def statistik(self) -> dict:
+        with self._lock:
+            latenzen = list(self._latenzen)
+            fallback_aktiv = time.monotonic() < self._fallback_bis
+        return {
+            "modell": self.modell,
+            "fallback_modell": self.fallback_modell,
+            "fallback_aktiv": fallback_aktiv,
+            "aufrufe": self.aufrufe,
+            "wiederholungen": self.wiederholungen,
+            "fallbacks": self.fallbacks,
+            "fehler": self.fehler,
+            "latenz_median_s": statistics.median(latenzen) if latenzen else 0.0,
+            "prompt_tokens": self.prompt_tokens,
+            "gecachte_tokens": self.gecachte_tokens,
+            "praefix_cache_anteil": self.gecachte_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            "cache_treffer": self.cache.treffer,
+            "cache_trefferquote": self.cache.statistik()["trefferquote"],
+        }
@@ -0,0 +1,141 @@
+# llm_router.py
+#
+# Wählt pro LLM-Aufruf das Modell nach Aufgabe:
+#   extraktion    Slot-Filling (Rückfrage oder JSON mit den Reiseinfos)  → kleines Modell
+#   bestaetigung  kurze Bestätigung / Abschied nach den Verbindungen     → kleines Modell
+#   dialog        offene Gesprächsrunde                                  → grosses Modell
+# Antworten des kleinen Modells werden geprüft (Form der Antwort und mittlere Token-
+# Wahrscheinlichkeit aus logprobs); fällt die Prüfung durch, geht derselbe Aufruf ans
+# grosse Modell. Latenz pro Route als Span "llm.route.<route>" (Debug-Sidebar, /metrics).
+
+import math
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+import tracing
+from llm_gateway import LLMGateway, LLMNichtVerfuegbar
+from oev_core.reiseinfos import reiseinfos_aus_antwort
+
+LLM_KLEIN_MODELL  = os.environ.get("LLM_KLEIN_MODELL", "gpt-4o-mini")
+# Mittlere Token-Wahrscheinlichkeit, ab der eine Antwort des kleinen Modells gilt
+LLM_MIN_KONFIDENZ = float(os.environ.get("LLM_MIN_KONFIDENZ", "0.75"))
+LLM_LOGPROBS      = os.environ.get("LLM_LOGPROBS", "1") not in ("", "0")
+
+EXTRAKTION   = "extraktion"
+BESTAETIGUNG = "bestaetigung"
+DIALOG       = "dialog"
+
+# Nutzereingaben ab dieser Länge (oder mit Frage) sind keine kurze Bestätigung mehr
+KURZ_MAX_ZEICHEN = 160
+
+SLOT_FELDER = ("start", "ziel", "datum", "uhrzeit")
+
+# ------------------------- 1) Prüfungen -------------------------
+
+def pruefe_slots(text: str, felder=SLOT_FELDER) -> bool:
+    """Rückfrage ohne JSON oder ein JSON-Objekt mit allen Feldern – halbe JSONs nicht."""
+    if "{" not in text:
+        return bool(text.strip())
+    reiseinfos = reiseinfos_aus_antwort(text)
+    return reiseinfos is not None and all(reiseinfos.get(f) for f in felder)
+
+
+def pruefe_kurz(text: str) -> bool:
+    """Kurze Antwort ohne JSON (nach den Verbindungen gibt der Bot keines mehr aus)."""
+    return bool(text.strip()) and "{" not in text and len(text) <= 4 * KURZ_MAX_ZEICHEN
+
+
+PRUEFUNGEN = {EXTRAKTION: pruefe_slots, BESTAETIGUNG: pruefe_kurz}
+
+
+def konfidenz(response):
+    """exp(mittlerer Logprob) der Antwort-Tokens, None ohne logprobs (z. B. Cache-Treffer)."""
+    logprobs = getattr(response.choices[0], "logprobs", None)
+    tokens = getattr(logprobs, "content", None) if logprobs is not None else None
+    if not tokens:
+        return None
+    return math.exp(sum(t.logprob for t in tokens) / len(tokens))
+
+# ------------------------- 2) Router -------------------------
+
+class ModellRouter:
+    """
+    Verteilt Aufrufe eines LLMGateway auf kleines und grosses Modell. Das grosse Modell
+    ist das Hauptmodell des Gateways (mit dessen Fallback); das kleine wird direkt gewählt.
+    """
+
+    def __init__(self, gateway: LLMGateway, klein: str = LLM_KLEIN_MODELL,
+                 min_konfidenz: float = LLM_MIN_KONFIDENZ, logprobs: bool = LLM_LOGPROBS):
+        self.gateway = gateway
+        self.klein = klein
+        self.gross = gateway.modell
+        self.min_konfidenz = min_konfidenz
+        self.logprobs = logprobs
+        self._lock = threading.Lock()
+        self._routen = {r: {"aufrufe": 0, "eskalationen": 0, "latenzen": deque(maxlen=200)}
+                        for r in (EXTRAKTION, BESTAETIGUNG, DIALOG)}
+
+    def route(self, aufgabe: str, messages: list) -> str:
+        """Aufgabe → Route; eine "Bestätigung" mit offener Frage des Nutzers wird zum Dialog."""
+        if aufgabe == BESTAETIGUNG:
+            letzte = next((str(m.get("content", "")) for m in reversed(messages) if m.get("role") == "user"), "")
+            if "?" in letzte or len(letzte) > KURZ_MAX_ZEICHEN:
+                return DIALOG
+        return aufgabe if aufgabe in self._routen else DIALOG
+
+    def chat(self, messages: list, aufgabe: str = DIALOG, pruefen=None, **kwargs):
+        """
+        Wie LLMGateway.chat, aber mit Modellwahl nach `aufgabe`. `pruefen(text) -> bool`
+        ersetzt die Standardprüfung der Route (z. B. für andere JSON-Felder).
+        """
+        route = self.route(aufgabe, messages)
+        pruefen = pruefen or PRUEFUNGEN.get(route)
+        start = time.monotonic()
+        with tracing.span(f"llm.route.{route}", route=route) as sp:
+            response, eskaliert = None, False
+            if route != DIALOG:
+                extra = {"logprobs": True} if self.logprobs else {}
+                try:
+                    response = self.gateway.chat(messages, modell=self.klein, **extra, **kwargs)
+                except LLMNichtVerfuegbar:
+                    response = None
+                if response is not None:
+                    text = response.choices[0].message.content or ""
+                    k = konfidenz(response)
+                    sp.setze(konfidenz=round(k, 3) if k is not None else None)
+                    if not (pruefen is None or pruefen(text)) or (k is not None and k < self.min_konfidenz):
+                        response = None
+                eskaliert = response is None
+            if response is None:
+                response = self.gateway.chat(messages, **kwargs)
+            sp.setze(modell=response.model, eskaliert=eskaliert)
+
+        with self._lock:
+            r = self._routen[route]
+            r["aufrufe"] += 1
+            r["eskalationen"] += eskaliert
+            r["latenzen"].append(time.monotonic() - start)
+        return response
+
+    def text(self, messages: list, aufgabe: str = DIALOG, **kwargs) -> str:
+        """Nur der Antworttext (ohne führende/abschliessende Leerzeichen)."""
+        return (self.chat(messages, aufgabe, **kwargs).choices[0].message.content or "").strip()
+
+    def statistik(self) -> list[dict]:
+        """Eine Zeile pro Route: Aufrufe, Eskalationen ans grosse Modell, Latenz p50/p95."""
+        zeilen = []
+        with self._lock:
+            for route, r in self._routen.items():
+                latenzen = sorted(r["latenzen"])
+                zeilen.append({
+                    "route": route,
+                    "modell": self.gross if route == DIALOG else self.klein,
+                    "aufrufe": r["aufrufe"],
+                    "eskalationen": r["eskalationen"],
+                    "latenz_p50_s": statistics.median(latenzen) if latenzen else 0.0,
+                    "latenz_p95_s": latenzen[min(len(latenzen) - 1, int(0.95 * len(latenzen)))] if latenzen else 0.0,
+                })
+        return zeilen
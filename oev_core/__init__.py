@@ -0,0 +1,35 @@
+# oev_core/__init__.py
+#
+# Gemeinsame Kernfunktionen für alle Chatbots und CLIs: Datumserkennung, Reiseinfos aus
+# der LLM-Antwort, OJP-Anfragen (Cache, Single-Flight, Rate-Limit) und Trip-Parsing.
+# Neue Optimierungen gehören hierher bzw. in die Client-Module – nicht in die Skripte.
+
+from ojp_client import (
+    OJPFehler,
+    build_trip_xml,
+    stop_place_lookup,
+    trip_abfrage,
+    trip_fenster_suche,
+    trip_request,
+)
+from gtfs_rt_client import baue_delay_index, fetch_feed, lade_route_map, parse_delays_for_stop
+
+from .datum import normalisiere_datum, normalisiere_uhrzeit, replace_date_keywords, tage
+from .karte import (
+    kartenansicht, leg_tracks_aus_trip_xml, pfad_aus_trip_xml, pfade_aus_trip_xml, trip_schluessel,
+)
+from .prompt import SYSTEM_PROMPT, nachrichten
+from .reiseinfos import normalisiere_reiseinfos, reiseinfos_aus_antwort, teil_reiseinfos
+from .trips import (
+    get_duration_and_transfers, get_text, parse_trips, schritt_text, trip_digest, trips_nach_dauer,
+)
+
+__all__ = [
+    "OJPFehler", "SYSTEM_PROMPT", "baue_delay_index", "build_trip_xml", "fetch_feed",
+    "get_duration_and_transfers", "get_text", "kartenansicht", "lade_route_map",
+    "leg_tracks_aus_trip_xml", "nachrichten", "normalisiere_datum", "normalisiere_reiseinfos",
+    "normalisiere_uhrzeit", "parse_delays_for_stop", "parse_trips", "pfad_aus_trip_xml",
+    "pfade_aus_trip_xml", "reiseinfos_aus_antwort", "replace_date_keywords", "schritt_text",
+    "stop_place_lookup", "tage", "teil_reiseinfos", "trip_abfrage", "trip_fenster_suche",
+    "trip_request", "trip_digest", "trip_schluessel", "trips_nach_dauer",
+]
@@ -0,0 +1,93 @@
+# oev_core/datum.py
+
+import re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+import dateparser
+
+# Deutsche Wochentags-Namen → weekday()
+tage = {
+    'montag': 0, 'dienstag': 1, 'mittwoch': 2,
+    'donnerstag': 3, 'freitag': 4, 'samstag': 5, 'sonntag': 6
+}
+
+_RELATIV = re.compile(r'\b(heute|gestern|morgen|übermorgen|nächsten?\s+\w+)\b', re.IGNORECASE)
+_NAECHSTEN = re.compile(r'(?i)\bnächsten\b')
+_NAECHSTER_TAG = re.compile(r'(?i)nächster\s+(\w+)')
+_UHRZEIT = re.compile(r"^(\d{1,2}):?(\d{2})?:?(\d{2})?$")
+_JAHR = re.compile(r'\b\d{4}\b')
+
+
+@lru_cache(maxsize=256)
+def _dateparser_iso(fragment: str, heute: date):
+    # dateparser braucht ~1 ms pro Aufruf; dieselben Ausdrücke ("morgen") kommen ständig wieder.
+    # `heute` gehört zum Schlüssel, damit der Cache um Mitternacht nicht veraltet.
+    dt = dateparser.parse(
+        fragment,
+        settings={'PREFER_DATES_FROM': 'future', 'RELATIVE_BASE': datetime.combine(heute, time(12))},
+        languages=['de']
+    )
+    return dt.strftime('%Y-%m-%d') if dt else None
+
+
+def replace_date_keywords(text: str, jetzt: datetime = None) -> str:
+    """
+    Ersetzt deutsche relative Datumsausdrücke (heute, gestern, morgen, übermorgen, nächsten <Wochentag>)
+    durch ein ISO-Datum (YYYY-MM-DD).
+    """
+    jetzt = jetzt or datetime.now()
+
+    def repl(match):
+        frag = match.group(0)
+        frag_norm = _NAECHSTEN.sub('nächster', frag)
+
+        # 1) Manuelle "nächster <Tag>"-Berechnung
+        m = _NAECHSTER_TAG.match(frag_norm)
+        if m:
+            tag = m.group(1).lower()
+            if tag in tage:
+                delta = (tage[tag] - jetzt.weekday() + 7) % 7 or 7
+                return (jetzt + timedelta(days=delta)).strftime('%Y-%m-%d')
+
+        # 2) Sonst dateparser ("heute", "morgen", "übermorgen"), 3) Fallback: Original
+        return _dateparser_iso(frag_norm.lower(), jetzt.date()) or frag
+
+    return _RELATIV.sub(repl, text)
+
+
+def normalisiere_uhrzeit(roh, standard: str = "08:00:00"):
+    """
+    '8' → '08:00:00', '830' → '08:30:00', '8:30' → '08:30:00'; ungültig (z. B. '25:99') → `standard`.
+    '24:00' (Ende eines Fensters "zwischen 22 und 24 Uhr") wird zu '23:59:59' am selben Tag.
+    """
+    m = _UHRZEIT.match(roh or "")
+    if not m:
+        return standard
+    stunde, minute, sekunde = int(m.group(1)), int(m.group(2) or 0), int(m.group(3) or 0)
+    if (stunde, minute, sekunde) == (24, 0, 0):
+        return "23:59:59"
+    if stunde > 23 or minute > 59 or sekunde > 59:
+        return standard
+    return f"{stunde:02d}:{minute:02d}:{sekunde:02d}"
+
+
+def normalisiere_datum(roh: str, user_input: str = "", heute: datetime = None) -> str:
+    """
+    Bringt das vom LLM gelieferte Datum auf YYYY-MM-DD:
+      - 'MM-DD' bekommt das aktuelle Jahr,
+      - ein anderes Jahr wird aufs aktuelle korrigiert, wenn der Nutzer selbst keins genannt hat,
+      - Ungültiges wird zum heutigen Datum.
+    """
+    heute = heute or datetime.now()
+    roh = (roh or "").strip()
+    try:
+        if re.match(r'^\d{1,2}-\d{1,2}$', roh):
+            monat, tag = map(int, roh.split('-'))
+            return datetime(heute.year, monat, tag).strftime("%Y-%m-%d")
+        dt = datetime.strptime(roh, "%Y-%m-%d")
+        if dt.year != heute.year and not _JAHR.search(user_input or ""):
+            dt = dt.replace(year=heute.year)
+        return dt.strftime("%Y-%m-%d")
+    except ValueError:
+        return heute.strftime("%Y-%m-%d")
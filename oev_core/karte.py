@@ -0,0 +1,149 @@
+# oev_core/karte.py
+
+import hashlib
+import xml.etree.ElementTree as ET
+
+from .geometrie import bbox, decode_polyline, douglas_peucker, encode_polyline, zoom_fuer_bbox
+from .trips import _trip_auswerten
+
+namespaces = {
+    "siri": "http://www.siri.org.uk/siri",
+    "ojp": "http://www.vdv.de/ojp"
+}
+
+# Reihenfolge der StopPointRefs pro Leg: Ein-/Ausstieg bzw. Start/Ende des Fusswegs
+_LEG_REFS = (
+    "ojp:TimedLeg/ojp:LegBoard/siri:StopPointRef",
+    "ojp:TimedLeg/ojp:LegAlight/siri:StopPointRef",
+    "ojp:TransferLeg/ojp:LegStart/siri:StopPointRef",
+    "ojp:TransferLeg/ojp:LegEnd/siri:StopPointRef",
+)
+
+
+def trip_schluessel(xml_text) -> str:
+    """Kurzer Hash der TripResponse – Cache-Schlüssel für alles, was daraus berechnet wird."""
+    daten = xml_text.encode("utf-8") if isinstance(xml_text, str) else xml_text
+    return hashlib.blake2b(daten, digest_size=16).hexdigest()
+
+
+def _koordinaten(root) -> dict[str, tuple[float, float]]:
+    """StopPointRef → (lon, lat) aus allen <ojp:Location> mit StopPoint und GeoPosition."""
+    coords = {}
+    for loc in root.iterfind(".//ojp:Location", namespaces):
+        ref = loc.findtext("ojp:StopPoint/siri:StopPointRef", namespaces=namespaces)
+        lon = loc.findtext("ojp:GeoPosition/siri:Longitude", namespaces=namespaces)
+        lat = loc.findtext("ojp:GeoPosition/siri:Latitude", namespaces=namespaces)
+        if not ref or lon is None or lat is None:
+            continue
+        try:
+            coords[ref.strip()] = (float(lon), float(lat))
+        except ValueError:
+            # Ungültige Koordinaten ignorieren
+            pass
+    return coords
+
+
+def _leg_schluessel(timed) -> str:
+    """
+    Schlüssel einer Leg-Geometrie: JourneyRef plus Ein- und Ausstieg – dieselbe Fahrt
+    ergibt je nach Teilstrecke eine andere Geometrie.
+    """
+    journey = timed.findtext("ojp:Service/ojp:JourneyRef", namespaces=namespaces)
+    if not journey:
+        return None
+    ein = timed.findtext("ojp:LegBoard/siri:StopPointRef", "", namespaces)
+    aus = timed.findtext("ojp:LegAlight/siri:StopPointRef", "", namespaces)
+    return f"{journey.strip()}|{ein.strip()}|{aus.strip()}"
+
+
+def _trip_pfad(trip, coords: dict, tracks: dict = None) -> list[list[float]]:
+    """
+    [lon, lat] der StopPoints eines Trips in Leg-Reihenfolge, ohne direkt aufeinanderfolgende
+    Duplikate. Liegt für ein TimedLeg eine Streckengeometrie in `tracks` (Leg-Schlüssel →
+    Punkte), ersetzt sie die gerade Linie zwischen Ein- und Ausstieg.
+    """
+    pfad = []
+
+    def anhaengen(pt):
+        if pt and (not pfad or pfad[-1] != [pt[0], pt[1]]):
+            pfad.append([pt[0], pt[1]])
+
+    for leg in trip.iterfind("ojp:TripLeg", namespaces):
+        timed = leg.find("ojp:TimedLeg", namespaces)
+        track = tracks.get(_leg_schluessel(timed)) if tracks and timed is not None else None
+        if track:
+            for pt in track:
+                anhaengen(pt)
+            continue
+        for xpath in _LEG_REFS:
+            ref = leg.findtext(xpath, namespaces=namespaces)
+            anhaengen(coords.get(ref.strip()) if ref else None)
+    return pfad
+
+
+def pfad_aus_trip_xml(xml_text) -> list[list[float]]:
+    """
+    Routenverlauf der ersten Verbindung als Liste von [lon, lat] (StopPoints in
+    Reihenfolge der TripLegs, ohne direkt aufeinanderfolgende Duplikate).
+    Wirft ET.ParseError bei ungültigem XML – die Anzeige entscheidet, wie sie das meldet.
+    """
+    root = ET.fromstring(xml_text)
+    trip = root.find(".//ojp:TripResult/ojp:Trip", namespaces)
+    if trip is None:
+        return []
+    return _trip_pfad(trip, _koordinaten(root))
+
+
+def pfade_aus_trip_xml(xml_text, leg_tracks: dict[str, str] = None) -> list[dict]:
+    """
+    Alle Verbindungen aus einem Parse: [{"pfad": [[lon, lat], ...], "dauer": timedelta}, ...],
+    in derselben Reihenfolge wie parse_trips (schnellste zuerst), damit Index 0 die
+    "Schnellste Verbindung" und Index i die "Alternative i" der Textausgabe ist.
+    `leg_tracks` (aus leg_tracks_aus_trip_xml) liefert die genaue Streckenführung pro Leg.
+    """
+    root = ET.fromstring(xml_text)
+    coords = _koordinaten(root)
+    tracks = {k: decode_polyline(v) for k, v in leg_tracks.items()} if leg_tracks else None
+    trips = []
+    for trip in root.iterfind(".//ojp:TripResult/ojp:Trip", namespaces):
+        _, dauer = _trip_auswerten(trip)
+        if dauer is not None:
+            trips.append({"pfad": _trip_pfad(trip, coords, tracks), "dauer": dauer})
+    return sorted(trips, key=lambda t: t["dauer"])
+
+
+def leg_tracks_aus_trip_xml(xml_text, toleranz_m: float = 10.0) -> dict[str, str]:
+    """
+    Streckengeometrie aller TimedLegs einer Antwort mit Leg-Projektion
+    (build_trip_xml(mit_projektion=True)): Leg-Schlüssel → Encoded Polyline, nach
+    Douglas–Peucker mit `toleranz_m` vereinfacht. Legs ohne LegTrack fehlen im Ergebnis.
+    """
+    root = ET.fromstring(xml_text)
+    tracks = {}
+    for timed in root.iterfind(".//ojp:TripResult/ojp:Trip/ojp:TripLeg/ojp:TimedLeg", namespaces):
+        key = _leg_schluessel(timed)
+        if key is None or key in tracks:
+            continue
+        punkte = []
+        for pos in timed.iterfind("ojp:LegTrack/ojp:TrackSection/ojp:LinkProjection/ojp:Position", namespaces):
+            try:
+                punkte.append((float(pos.findtext("siri:Longitude", namespaces=namespaces)),
+                               float(pos.findtext("siri:Latitude", namespaces=namespaces))))
+            except (TypeError, ValueError):
+                continue
+        if len(punkte) >= 2:
+            tracks[key] = encode_polyline(douglas_peucker(punkte, toleranz_m))
+    return tracks
+
+
+def kartenansicht(punkte) -> dict:
+    """
+    Mittelpunkt und Zoom-Level, damit alle Punkte sichtbar sind (für pdk.ViewState).
+    `punkte` als Liste von [lon, lat] oder (n, 2)-Array.
+    """
+    box = bbox(punkte)
+    return {
+        "longitude": (box[0] + box[2]) / 2,
+        "latitude": (box[1] + box[3]) / 2,
+        "zoom": zoom_fuer_bbox(box),
+    }
@@ -0,0 +1,35 @@
+# oev_core/prompt.py
+
+# System-Prompt des Reise-Chatbots: sammelt Start, Ziel, Datum, Uhrzeit und Suchtyp
+# und liefert sie als JSON (siehe reiseinfos_aus_antwort). Geteilt von Streamlit-App und API.
+SYSTEM_PROMPT = (
+    "Du bist ein freundlicher und hilfsbereiter Mobilitäts-Chatbot. "
+    "Du planst für den Nutzer eine Reise mit dem öffentlichen Verkehr in der Schweiz. "
+    "Dein Ziel ist es, die Informationen zur Reiseplanung vom Nutzer zu sammeln: Startort, Zielort, Datum, Uhrzeit "
+    "und ob es sich um eine Abfahrts- oder Ankunftszeit handelt. "
+    "Führe einen natürlichen und lockeren Dialog per Du. Stelle gezielte Rückfragen, wenn etwas fehlt. "
+    "Sobald du alle Infos hast, gib **ausschließlich** ein JSON-Objekt aus:\n"
+    "{\"start\":\"…\", \"ziel\":\"…\", \"datum\":\"YYYY-MM-DD\", \"uhrzeit\":\"HH:MM:SS\", \"typ\":\"abfahrt\"}\n"
+    "Nennt der Nutzer ein Zeitfenster (z. B. \"irgendwann zwischen 8 und 11\"), setze \"uhrzeit\" auf den Beginn "
+    "und ergänze \"uhrzeit_bis\":\"HH:MM:SS\" mit dem Ende des Fensters.\n"
+    "Nach dem Stage Trip werden die Verbindungen angezeigt. Du gibst jetzt kein JSON mehr aus. "
+    "Jetzt sage dem Nutzer, dass du ihn gerne auf seiner Reise begleiten wirst."
+    "Frage den Nutzer dazu, ob alles klar ist, ob er die Reise durchführt, und welche Verbindung er wählen wird.  "
+    "Beende das Gespräch und wünsche ihm eine gute Reise. Sei kreativ und überraschend."
+)
+
+
+def nachrichten(verlauf: list, kontext: str = None, system_prompt: str = SYSTEM_PROMPT) -> list[dict]:
+    """
+    Nachrichten für einen LLM-Aufruf, so angeordnet, dass der Anfang von Aufruf zu Aufruf
+    byte-gleich bleibt – Prompt-Caching beim Anbieter greift nur auf identische Präfixe:
+      1. statischer System-Prompt
+      2. Gesprächsverlauf (wird nur angehängt, nie umgeschrieben)
+      3. wechselnder Kontext (z. B. die gefundenen Verbindungen) als System-Nachricht am Ende
+    System-Nachrichten im Verlauf werden übersprungen; der Verlauf selbst bleibt unverändert.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    messages += [{"role": m["role"], "content": m["content"]} for m in verlauf if m.get("role") != "system"]
+    if kontext:
+        messages.append({"role": "system", "content": kontext})
+    return messages
@@ -0,0 +1,119 @@
+# oev_core/reiseinfos.py
+
+import json
+import re
+
+from .datum import normalisiere_datum, normalisiere_uhrzeit, tage
+
+_JSON_OBJEKT = re.compile(r'\{.*\}', re.DOTALL)
+
+# Grobe Slot-Erkennung ohne LLM (teil_reiseinfos): Ortsnamen sind gross geschriebene Wörter,
+# ggf. verbunden mit "am", "an der", "bei", "b.", "a." ("Affoltern am Albis", "St. Gallen",
+# "Zürich HB", "Muri b. Bern"). Ein Punkt gehört nur zu "St."/"Ste." – sonst endet dort der
+# Satz und das nächste gross geschriebene Wort ("Thun. Ab 8 Uhr") ist kein Teil des Namens.
+_ORT_WORT = r"(?:Ste?\.|[A-ZÄÖÜ][\w'-]*)"
+_ORT = rf"{_ORT_WORT}(?:\s+(?:am\s+|an\s+der\s+|bei\s+|[ab]\.\s+)?{_ORT_WORT})*"
+_START = re.compile(rf"\b(?:[Vv]on|[Aa]b)\s+({_ORT})")
+_ZIEL = re.compile(rf"\b(?:[Nn]ach|[Bb]is)\s+({_ORT})")
+_NUR_ORT = re.compile(rf"^\s*(?:[Ii]n\s+|[Nn]ach\s+|[Vv]on\s+)?({_ORT})\s*[.!]?\s*$")
+_ZEIT = re.compile(r"\b(\d{1,2})(?:[:.](\d{2}))?\s*Uhr\b|\b(\d{1,2}):(\d{2})\b")
+_ISO_DATUM = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+_DATUM = re.compile(r"\b(\d{1,2})\.(\d{1,2})\.(\d{4})?")
+_ANKUNFT = re.compile(r"(?i)\bankunft|\bankommen|\bspätestens|\bdort\s+sein\b|\ban\s+sein\b")
+_FRAGT_ZIEL = re.compile(r"(?i)wohin|ziel")
+_FRAGT_START = re.compile(r"(?i)woher|von\s+wo|start|abfahrtsort|wo\s+\w*\s*los")
+# Gross geschrieben nach "bis"/"nach"/"ab", aber kein Ort ("bis Montag", "ab Juni")
+_KEINE_ORTE = {"Hause", "Mittag", "Abend", "Morgen", "Mitternacht", "Uhr", "Heute", "Übermorgen",
+               "Januar", "Februar", "März", "April", "Mai", "Juni", "Juli", "August",
+               "September", "Oktober", "November", "Dezember"} | {t.capitalize() for t in tage}
+
+
+def _ist_ort(name: str) -> bool:
+    return name.split()[0] not in _KEINE_ORTE
+
+
+def reiseinfos_aus_antwort(reply: str):
+    """
+    Holt das JSON-Objekt mit den Reiseinfos aus einer LLM-Antwort.
+    Gibt None zurück, wenn keines enthalten oder es kein gültiges JSON ist.
+    """
+    match = _JSON_OBJEKT.search(reply or "")
+    if not match:
+        return None
+    try:
+        parsed = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def normalisiere_reiseinfos(reiseinfos: dict, user_input: str = "", heute=None) -> dict:
+    """
+    Bringt Datum, Uhrzeit, Suchtyp und das optionale Fensterende in das Format,
+    das ojp_client erwartet. Ändert `reiseinfos` direkt und gibt es zurück.
+    """
+    reiseinfos["datum"] = normalisiere_datum(reiseinfos.get("datum", ""), user_input, heute)
+    reiseinfos["uhrzeit"] = normalisiere_uhrzeit(reiseinfos.get("uhrzeit", "08:00:00"))
+
+    if reiseinfos.get("typ") not in ("abfahrt", "ankunft"):
+        reiseinfos["typ"] = "abfahrt"
+
+    # Optionales Fensterende ("zwischen 8 und 11"); ungültig → kein Fenster
+    uhrzeit_bis = normalisiere_uhrzeit(reiseinfos.get("uhrzeit_bis"), standard=None)
+    if uhrzeit_bis:
+        reiseinfos["uhrzeit_bis"] = uhrzeit_bis
+    else:
+        reiseinfos.pop("uhrzeit_bis", None)
+    return reiseinfos
+
+
+def teil_reiseinfos(verlauf: list) -> dict:
+    """
+    Liest aus den bisherigen Nutzernachrichten heraus, was an Start, Ziel, Datum, Uhrzeit und
+    Suchtyp schon feststeht – ohne LLM, für die spekulative Vorab-Suche (prefetch.py).
+    Spätere Nennungen überschreiben frühere; fehlende Felder fehlen im Ergebnis. Die
+    Nachrichten müssen schon durch replace_date_keywords gelaufen sein ("morgen" → ISO).
+    Ein Ortsname als ganze Antwort zählt als Start bzw. Ziel, wenn der Bot davor danach
+    gefragt hat. Ein Zeitfenster ("zwischen 8 und 11") setzt nur "fenster".
+    """
+    slots, frage = {}, ""
+    for m in verlauf:
+        if m.get("role") == "assistant":
+            frage = str(m.get("content", ""))
+            continue
+        if m.get("role") != "user":
+            continue
+        text = str(m.get("content", ""))
+
+        start = [o for o in _START.findall(text) if _ist_ort(o)]
+        ziel = [o for o in _ZIEL.findall(text) if _ist_ort(o)]
+        nur_ort = _NUR_ORT.match(text)
+        if not start and not ziel and nur_ort and _ist_ort(nur_ort.group(1)):
+            if _FRAGT_ZIEL.search(frage):
+                ziel = [nur_ort.group(1)]
+            elif _FRAGT_START.search(frage):
+                start = [nur_ort.group(1)]
+        if start:
+            slots["start"] = start[-1]
+        if ziel:
+            slots["ziel"] = ziel[-1]
+
+        zeit = _ZEIT.search(text)
+        if zeit:
+            stunde, minute = (zeit.group(1), zeit.group(2)) if zeit.group(1) else (zeit.group(3), zeit.group(4))
+            slots["uhrzeit"] = normalisiere_uhrzeit(f"{stunde}:{minute or '00'}")
+        if "zwischen" in text.lower():
+            slots["fenster"] = True
+
+        iso = _ISO_DATUM.search(text)
+        datum = _DATUM.search(text)
+        if iso:
+            slots["datum"] = iso.group(1)
+        elif datum:
+            tag, monat, jahr = datum.groups()
+            slots["datum"] = normalisiere_datum(f"{jahr}-{monat.zfill(2)}-{tag.zfill(2)}" if jahr
+                                                else f"{monat}-{tag}", text)
+
+        if _ANKUNFT.search(text):
+            slots["typ"] = "ankunft"
+    return slots
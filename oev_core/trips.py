@@ -0,0 +1,170 @@
+# oev_core/trips.py
+
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+ns = {'ojp': 'http://www.vdv.de/ojp', 'siri': 'http://www.siri.org.uk/siri'}
+
+_MINUTEN = re.compile(r'(\d+)m')
+
+
+def get_text(elem, path, ns=ns):
+    """
+    Sucht ein Element mit Pfad `path` im Element `elem` unter Verwendung der Namensräume `ns`.
+    Gibt den Textinhalt zurück oder einen leeren String, wenn nichts gefunden wird.
+    """
+    sub = elem.find(path, ns)
+    return sub.text if sub is not None and sub.text is not None else ''
+
+
+def _uhrzeit(iso: str) -> str:
+    return iso.split('T')[-1].rstrip('Z')
+
+
+def _trip_auswerten(trip):
+    """
+    Ein Durchlauf pro Trip: Schritte bauen und gleichzeitig erste Abfahrt / letzte Ankunft
+    merken. Gibt (steps, dauer) zurück; dauer ist None, wenn der Trip keine Fahrt enthält.
+    """
+    steps = []
+    erste_ab = letzte_an = None
+    for leg in trip.iterfind('ojp:TripLeg', ns):
+        t = leg.find('ojp:TimedLeg', ns)
+        if t is not None:
+            board   = t.find('ojp:LegBoard', ns)
+            alight  = t.find('ojp:LegAlight', ns)
+            service = t.find('ojp:Service', ns)
+            ab = get_text(board, './/ojp:TimetabledTime')
+            an = get_text(alight, './/ojp:TimetabledTime')
+            erste_ab = erste_ab or ab
+            letzte_an = an
+            steps.append({
+                'type':     'ride',
+                'line':     get_text(service, './/ojp:PublishedLineName/ojp:Text'),
+                'dep_sta':  get_text(board, './/ojp:StopPointName/ojp:Text'),
+                'dep_time': _uhrzeit(ab),
+                'dep_quay': get_text(board, 'ojp:PlannedQuay/ojp:Text') or '–',
+                'arr_sta':  get_text(alight, './/ojp:StopPointName/ojp:Text'),
+                'arr_time': _uhrzeit(an),
+                'arr_quay': get_text(alight, 'ojp:PlannedQuay/ojp:Text') or '–',
+            })
+            continue
+
+        trf = leg.find('ojp:TransferLeg', ns)
+        if trf is not None:
+            # Dauer aus ISO-8601 („PT10M“ → „10m“ → „10 min“)
+            dur = _MINUTEN.sub(r'\1 min', get_text(trf, 'ojp:Duration').lstrip('PT').lower())
+            steps.append({
+                'type':     'walk',
+                'mode':     get_text(trf, './/ojp:TransferMode'),
+                'from':     get_text(trf, './/ojp:LegStart/ojp:LocationName/ojp:Text'),
+                'to':       get_text(trf, './/ojp:LegEnd/ojp:LocationName/ojp:Text'),
+                'duration': dur,
+            })
+
+    if not erste_ab or not letzte_an:
+        return steps, None
+    dauer = datetime.fromisoformat(letzte_an.rstrip('Z')) - datetime.fromisoformat(erste_ab.rstrip('Z'))
+    return steps, dauer
+
+
+def trips_nach_dauer(xml_text) -> list[tuple[list[dict], timedelta]]:
+    """
+    Alle Trips der OJP-TripResponse als (steps, dauer), aufsteigend nach Dauer.
+    Trips ohne Fahrt (reine Fusswege) fallen weg. Akzeptiert XML-Text oder Bytes.
+    """
+    root = ET.fromstring(xml_text)
+    trips = []
+    for trip in root.iterfind('.//ojp:TripResult/ojp:Trip', ns):
+        steps, dauer = _trip_auswerten(trip)
+        if dauer is not None:
+            trips.append((steps, dauer))
+    # sorted ist stabil: bei gleicher Dauer bleibt die Reihenfolge der Antwort erhalten
+    return sorted(trips, key=lambda x: x[1])
+
+
+def parse_trips(xml_text):
+    """
+    Parst die OJP-TripResponse, sortiert alle Trips nach Dauer
+    und gibt (besteVerbindung_steps, [ali1_steps, ali2_steps, ...]) zurück.
+    """
+    trips = trips_nach_dauer(xml_text)
+    if not trips:
+        return [], []
+    return trips[0][0], [steps for steps, _ in trips[1:]]
+
+
+def _dauer_und_umstiege(steps):
+    """(Dauer erste Abfahrt → letzte Ankunft, Umstiege) oder None ohne Fahrt."""
+    rides = [s for s in steps if s['type'] == 'ride']
+    if not rides:
+        return None
+    fmt = "%H:%M:%S"
+    dep = datetime.strptime(rides[0]['dep_time'], fmt)
+    arr = datetime.strptime(rides[-1]['arr_time'], fmt)
+    if arr < dep:
+        arr += timedelta(days=1)  # Nachtfahrten berücksichtigen
+    return arr - dep, len(rides) - 1
+
+
+def get_duration_and_transfers(steps):
+    werte = _dauer_und_umstiege(steps)
+    if werte is None:
+        return ""
+    duration, umstiege = werte
+    hours, remainder = divmod(duration.seconds, 3600)
+    minutes = remainder // 60
+    return f"⏱️ Dauer: {hours}h {minutes}min, 🔁 Umstiege: {umstiege}"
+
+
+def _hhmm(uhrzeit: str) -> str:
+    return uhrzeit[:5]
+
+
+def _digest_zeile(name: str, steps: list[dict]) -> str:
+    """'Schnellste: 07:09–07:51, 42 min, 0 Umst. | IR70 Luzern 07:09 Gl. 6 → Zürich HB 07:51 Gl. 12'"""
+    dauer, umstiege = _dauer_und_umstiege(steps)
+    rides = [s for s in steps if s['type'] == 'ride']
+    teile = []
+    for s in steps:
+        if s['type'] == 'ride':
+            teile.append(f"{s['line']} {s['dep_sta']} {_hhmm(s['dep_time'])} Gl. {s['dep_quay']} → "
+                         f"{s['arr_sta']} {_hhmm(s['arr_time'])} Gl. {s['arr_quay']}")
+        else:
+            teile.append(f"{s['mode'] or 'Fussweg'} {s['duration']}")
+    return (f"{name}: {_hhmm(rides[0]['dep_time'])}–{_hhmm(rides[-1]['arr_time'])}, "
+            f"{dauer.seconds // 60} min, {umstiege} Umst. | " + "; ".join(teile))
+
+
+def trip_digest(best: list[dict], alts: list[list[dict]], reise: dict = None,
+                max_alternativen: int = None) -> str:
+    """
+    Kompakte Zusammenfassung der angezeigten Verbindungen für das LLM (eine Zeile pro
+    Verbindung: Zeiten, Dauer, Umstiege, Linien mit Halt, Zeit und Gleis), gleich nummeriert
+    wie in der App ("Schnellste", "Alternative 1", …). `reise` ergänzt Start, Ziel und Datum.
+    Standardmässig alle Alternativen, wie die App sie zeigt; mit `max_alternativen` gekürzt,
+    dann mit einem Hinweis auf die weggelassenen.
+    """
+    if not best:
+        return "Es wurden keine Verbindungen gefunden."
+    kopf = "Angezeigte Verbindungen"
+    if reise:
+        kopf += (f" {reise.get('start_name', reise.get('start', ''))} → {reise.get('ziel_name', reise.get('ziel', ''))}"
+                 f", {reise.get('datum', '')}, {reise.get('typ', 'abfahrt')} {_hhmm(reise.get('uhrzeit', ''))}")
+    zeilen = [kopf + " (nur diese Angaben verwenden, nichts erfinden):", _digest_zeile("Schnellste", best)]
+    zeilen += [_digest_zeile(f"Alternative {i}", alt)
+               for i, alt in enumerate(alts[:max_alternativen], start=1) if _dauer_und_umstiege(alt)]
+    weggelassen = len(alts) - len(alts[:max_alternativen])
+    if weggelassen:
+        zeilen.append(f"Weitere {weggelassen} Alternativen nicht aufgeführt.")
+    return "\n".join(zeilen)
+
+
+def schritt_text(i: int, s: dict, markdown: bool = False, ohne_gleis: str = "") -> str:
+    """Eine Zeile pro Schritt, wie sie Chatbot und CLI ausgeben (`ohne_gleis` ersetzt fehlende Gleise)."""
+    b = "**" if markdown else ""
+    if s['type'] == 'ride':
+        return (f"{i}. 🚆 {b}{s['line']}{b}: {s['dep_sta']} ({s['dep_time']} Uhr, Gleis {s['dep_quay'] or ohne_gleis}) → "
+                f"{s['arr_sta']} ({s['arr_time']} Uhr, Gleis {s['arr_quay'] or ohne_gleis})")
+    return f"{i}. 🚶 {b}{s['mode'].capitalize()}{b} von {s['from']} nach {s['to']} (Dauer {s['duration']})"
@@ -0,0 +1,464 @@
+# ojp_client.py
+
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import tracing
+from rate_limiter import gedrosselt
+from singleflight import SingleFlight
+from trip_cache import TripCache, zeit_bucket
+
+# Per OJP_URL lässt sich der Client auf einen lokalen Stub umlenken (siehe ojp_stub_server.py)
+OJP_URL = os.environ.get("OJP_URL", "https://api.opentransportdata.swiss/ojp2020")
+
+ns = {'ojp': 'http://www.vdv.de/ojp', 'siri': 'http://www.siri.org.uk/siri'}
+
+# Präfixe beim Zurückschreiben beibehalten (sonst ns0:/ns1:)
+ET.register_namespace('siri', ns['siri'])
+ET.register_namespace('ojp', ns['ojp'])
+
+# Eine Session für alle Anfragen: Keep-Alive spart pro Anfrage den TCP/TLS-Handshake
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+# Gleichzeitige identische Anfragen (mehrere Sessions, gleiche Strecke) teilen sich einen Upstream-Call
+_flight = SingleFlight()
+
+
+class OJPFehler(Exception):
+    """OJP hat geantwortet, aber ohne verwertbares Ergebnis (z. B. ErrorCondition statt TripDelivery)."""
+
+# ------------------------- 1) Stop-Place-Lookup -------------------------
+
+# Haltestellen ändern sich kaum: Treffer pro Suchname einen Tag lang wiederverwenden.
+# Auch die spekulative Vorab-Suche (prefetch.py) füllt diesen Cache.
+ORTE_TTL_S = 24 * 60 * 60
+ORTE_MAX   = 1000
+_orte_cache: "OrderedDict[str, tuple[float, list]]" = OrderedDict()
+_orte_lock = threading.Lock()
+
+def _location_request(ort_name: str, api_key: str, requestor_ref: str):
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    xml_body = f"""<?xml version="1.0" encoding="UTF-8"?>
+<OJP xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+     xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+     xmlns="http://www.siri.org.uk/siri"
+     xmlns:ojp="http://www.vdv.de/ojp"
+     version="1.0"
+     xsi:schemaLocation="http://www.siri.org.uk/siri ../ojp-xsd-v1.0/OJP.xsd">
+  <OJPRequest>
+    <ServiceRequest>
+      <RequestTimestamp>{timestamp}</RequestTimestamp>
+      <RequestorRef>{requestor_ref}</RequestorRef>
+      <ojp:OJPLocationInformationRequest>
+        <RequestTimestamp>{timestamp}</RequestTimestamp>
+        <MessageIdentifier>mi-{int(datetime.now(timezone.utc).timestamp())}</MessageIdentifier>
+        <ojp:InitialInput>
+          <ojp:LocationName>{ort_name}</ojp:LocationName>
+        </ojp:InitialInput>
+        <ojp:Restrictions>
+          <ojp:Type>stop</ojp:Type>
+          <ojp:IncludePtModes>true</ojp:IncludePtModes>
+        </ojp:Restrictions>
+      </ojp:OJPLocationInformationRequest>
+    </ServiceRequest>
+  </OJPRequest>
+</OJP>"""
+    headers = {
+        "Content-Type": "application/xml",
+        "Authorization": f"Bearer {api_key}"
+    }
+    body = xml_body.encode("utf-8")
+    with tracing.span("ojp.location", anfrage_bytes=len(body)) as sp:
+        resp = gedrosselt(api_key, "ojp", _session.post, OJP_URL, data=body, headers=headers)
+        sp.setze(antwort_bytes=len(resp.content), status=resp.status_code)
+    if resp.status_code != 200:
+        return None
+
+    with tracing.span("ojp.location.parse"):
+        tree = ET.fromstring(resp.content)
+        results = []
+        for sp in tree.findall('.//ojp:StopPlace', ns):
+            ref  = sp.findtext('.//ojp:StopPlaceRef', namespaces=ns)
+            name = sp.findtext('.//ojp:StopPlaceName/ojp:Text', namespaces=ns)
+            if ref and name:
+                results.append((ref, name))
+    return results or None
+
+
+def stop_place_lookup(ort_name: str, api_key: str, requestor_ref: str = "IRMA"):
+    """
+    Sucht eine Haltestelle via OJP. Gibt Liste von (stop_id, stop_name) oder None zurück.
+    Gleichzeitige Suchen nach demselben Namen teilen sich eine Anfrage, gefundene
+    Haltestellen kommen ORTE_TTL_S lang aus dem Cache (leere Ergebnisse nicht).
+    """
+    name = ort_name.strip().lower()
+    jetzt = time.monotonic()
+    with tracing.span("orte_cache.get") as sp:
+        with _orte_lock:
+            eintrag = _orte_cache.get(name)
+            treffer = eintrag is not None and jetzt - eintrag[0] < ORTE_TTL_S
+            if treffer:
+                _orte_cache.move_to_end(name)
+        sp.setze(treffer=treffer)
+    if treffer:
+        return eintrag[1]
+
+    # Nur Anfragen mit demselben Key und RequestorRef teilen sich einen Aufruf (Kontingent, Logs)
+    results = _flight.do(('location', name, api_key, requestor_ref), _location_request,
+                         ort_name, api_key, requestor_ref)
+    if results:
+        with _orte_lock:
+            _orte_cache[name] = (jetzt, results)
+            _orte_cache.move_to_end(name)
+            while len(_orte_cache) > ORTE_MAX:
+                _orte_cache.popitem(last=False)
+    return results
+
+# ------------------------- 2) Trip-Request aufbauen & senden -------------------------
+
+def build_trip_xml(start_id, start_name, ziel_id, ziel_name, datum, uhrzeit,
+                   typ="abfahrt", anzahl=5, requestor_ref="StreamlitApp", mit_projektion=False):
+    """
+    Baut den XML-Body für eine OJPTripRequest.
+    Bei typ "abfahrt" steht DepArrTime beim Origin, bei "ankunft" bei der Destination.
+    `mit_projektion` fordert die Streckengeometrie pro Leg an (LegTrack) – deutlich grössere Antwort.
+    """
+    now_utc = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    dep_arr = f"<ojp:DepArrTime>{datum}T{uhrzeit}Z</ojp:DepArrTime>"
+    origin_zeit = dep_arr if typ == "abfahrt" else "<!-- kein DepArrTime beim Origin -->"
+    ziel_zeit   = dep_arr if typ != "abfahrt" else "<!-- kein DepArrTime beim Reiseziel -->"
+    projektion  = ("<ojp:IncludeTrackSections>true</ojp:IncludeTrackSections>\n"
+                   "          <ojp:IncludeLegProjection>true</ojp:IncludeLegProjection>"
+                   if mit_projektion else "<!-- keine Leg-Projektion -->")
+
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<OJP xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+     xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+     xmlns="http://www.siri.org.uk/siri"
+     xmlns:ojp="http://www.vdv.de/ojp"
+     version="1.0"
+     xsi:schemaLocation="http://www.siri.org.uk/siri ../ojp-xsd-v1.0/OJP.xsd">
+  <OJPRequest>
+    <ServiceRequest>
+      <RequestTimestamp>{now_utc}</RequestTimestamp>
+      <RequestorRef>{requestor_ref}</RequestorRef>
+      <ojp:OJPTripRequest>
+        <RequestTimestamp>{now_utc}</RequestTimestamp>
+        <ojp:Origin>
+          <ojp:PlaceRef>
+            <ojp:StopPlaceRef>{start_id}</ojp:StopPlaceRef>
+            <ojp:LocationName>
+              <ojp:Text>{start_name}</ojp:Text>
+            </ojp:LocationName>
+          </ojp:PlaceRef>
+          {origin_zeit}
+        </ojp:Origin>
+        <ojp:Destination>
+          <ojp:PlaceRef>
+            <ojp:StopPlaceRef>{ziel_id}</ojp:StopPlaceRef>
+            <ojp:LocationName>
+              <ojp:Text>{ziel_name}</ojp:Text>
+            </ojp:LocationName>
+          </ojp:PlaceRef>
+          {ziel_zeit}
+        </ojp:Destination>
+        <ojp:Params>
+          <ojp:NumberOfResults>{anzahl}</ojp:NumberOfResults>
+          {projektion}
+          <ojp:OptimisationMethod>fastest</ojp:OptimisationMethod>
+        </ojp:Params>
+      </ojp:OJPTripRequest>
+    </ServiceRequest>
+  </OJPRequest>
+</OJP>
+"""
+
+
+def trip_request(xml_body: str, api_key: str) -> requests.Response:
+    """
+    Schickt eine fertige OJPTripRequest ab und gibt die rohe Response zurück.
+    Läuft über den Rate-Limiter des Keys; wirft QuotaErschoepft, wenn kein Kontingent frei wird.
+    """
+    headers = {
+        "Content-Type": "application/xml",
+        "Authorization": f"Bearer {api_key}"
+    }
+    body = xml_body.encode("utf-8")
+    with tracing.span("ojp.trip", anfrage_bytes=len(body)) as sp:
+        resp = gedrosselt(api_key, "ojp", _session.post, OJP_URL, data=body, headers=headers)
+        sp.setze(antwort_bytes=len(resp.content), status=resp.status_code)
+    return resp
+
+# ------------------------- 3) Zeitfenster-Suche (mehrere Seiten) -------------------------
+
+# Seiten-Cache: (start_id, ziel_id, typ, anzahl, mit_projektion) → Liste von Seiten
+# Jede Seite merkt sich das Zeitintervall, das sie lückenlos abdeckt.
+SEITEN_TTL_S   = 300
+SEITEN_MAX     = 200
+_seiten_cache: "OrderedDict[tuple, list[dict]]" = OrderedDict()
+_seiten_lock = threading.Lock()
+
+
+def _parse_zeit(text: str) -> datetime:
+    return datetime.fromisoformat(text.rstrip('Z'))
+
+
+def _journey_kette(trip) -> tuple:
+    """
+    Schlüssel zur Duplikaterkennung: Folge aller (OperatingDayRef, JourneyRef) der TimedLegs.
+    Reine Fussweg-Trips fallen auf Start- und Endzeit zurück.
+    """
+    kette = []
+    for service in trip.findall('ojp:TripLeg/ojp:TimedLeg/ojp:Service', ns):
+        kette.append((service.findtext('ojp:OperatingDayRef', '', ns),
+                      service.findtext('ojp:JourneyRef', '', ns)))
+    if not kette:
+        kette.append((trip.findtext('ojp:StartTime', '', ns),
+                      trip.findtext('ojp:EndTime', '', ns)))
+    return tuple(kette)
+
+
+def _seite_holen(key, cursor, typ, api_key, build_args):
+    """
+    Liefert (xml_text, abgedeckt_von, abgedeckt_bis) für den Zeitpunkt `cursor`.
+    Eine gecachte Seite wird wiederverwendet, wenn sie `cursor` bereits abdeckt. Am Rand
+    (letzte Abfahrt bzw. früheste Ankunft) nicht: dort kann die Seite wegen `anzahl` Trips
+    derselben Minute abgeschnitten haben.
+    """
+    jetzt = time.monotonic()
+    with _seiten_lock:
+        for s in _seiten_cache.get(key, []):
+            innen = s['von'] <= cursor < s['bis'] if typ == "abfahrt" else s['von'] < cursor <= s['bis']
+            if jetzt - s['zeit'] < SEITEN_TTL_S and innen:
+                _seiten_cache.move_to_end(key)
+                return s['xml'], s['von'], s['bis']
+
+    xml_body = build_trip_xml(
+        datum=cursor.strftime("%Y-%m-%d"), uhrzeit=cursor.strftime("%H:%M:%S"),
+        typ=typ, **build_args
+    )
+    resp = _flight.do(('seite', key, cursor), trip_request, xml_body, api_key)
+    resp.raise_for_status()
+    xml_text = resp.content.decode('utf-8')
+
+    # Abgedecktes Intervall bestimmen: bei Abfahrt [cursor, letzte Abfahrt],
+    # bei Ankunft [früheste Ankunft, cursor]
+    root = ET.fromstring(resp.content)
+    feld = 'ojp:StartTime' if typ == "abfahrt" else 'ojp:EndTime'
+    zeiten = [_parse_zeit(t.findtext(feld, '', ns))
+              for t in root.findall('.//ojp:TripResult/ojp:Trip', ns)
+              if t.findtext(feld, '', ns)]
+    if typ == "abfahrt":
+        von, bis = cursor, max(zeiten + [cursor])
+    else:
+        von, bis = min(zeiten + [cursor]), cursor
+
+    with _seiten_lock:
+        seiten = [s for s in _seiten_cache.get(key, []) if jetzt - s['zeit'] < SEITEN_TTL_S]
+        seiten.append({'von': von, 'bis': bis, 'xml': xml_text, 'zeit': jetzt})
+        _seiten_cache[key] = seiten
+        _seiten_cache.move_to_end(key)
+        while len(_seiten_cache) > SEITEN_MAX:
+            _seiten_cache.popitem(last=False)
+    return xml_text, von, bis
+
+
+def trip_fenster_suche(start_id, start_name, ziel_id, ziel_name, datum,
+                       uhrzeit_von, uhrzeit_bis, api_key,
+                       typ="abfahrt", anzahl=5, max_seiten=8,
+                       requestor_ref="StreamlitApp", mit_projektion=False) -> str:
+    """
+    Sucht alle Verbindungen im Zeitfenster [uhrzeit_von, uhrzeit_bis].
+
+    Bei Abfahrt wird ab `uhrzeit_von` jeweils ab der letzten gelieferten Abfahrt
+    weitergeblättert, bei Ankunft ab `uhrzeit_bis` rückwärts, bis eine Seite keine
+    neue Verbindung mehr bringt. Trips werden über ihre JourneyRef-Kette dedupliziert,
+    nach Abfahrt sortiert und in einer einzigen OJP-Antwort zusammengeführt, die
+    `parse_trips` und die Karte unverändert verarbeiten können.
+    Wirft requests.HTTPError, wenn eine Seite nicht geladen werden kann, und OJPFehler,
+    wenn OJP statt Verbindungen eine Fehlermeldung liefert.
+    """
+    with tracing.span("ojp.fenster_suche", max_seiten=max_seiten) as sp:
+        xml_text, seiten = _fenster_suche(start_id, start_name, ziel_id, ziel_name, datum,
+                                          uhrzeit_von, uhrzeit_bis, api_key, typ, anzahl,
+                                          max_seiten, requestor_ref, mit_projektion)
+        sp.setze(seiten=seiten, antwort_bytes=len(xml_text))
+    return xml_text
+
+
+def _fenster_suche(start_id, start_name, ziel_id, ziel_name, datum, uhrzeit_von, uhrzeit_bis,
+                   api_key, typ, anzahl, max_seiten, requestor_ref,
+                   mit_projektion=False) -> tuple[str, int]:
+    fenster_von = datetime.fromisoformat(f"{datum}T{uhrzeit_von}")
+    fenster_bis = datetime.fromisoformat(f"{datum}T{uhrzeit_bis}")
+    if fenster_bis < fenster_von:
+        fenster_bis += timedelta(days=1)  # z. B. 23:00–01:00
+
+    key = (start_id, ziel_id, typ, anzahl, mit_projektion)
+    build_args = {
+        'start_id': start_id, 'start_name': start_name,
+        'ziel_id': ziel_id, 'ziel_name': ziel_name,
+        'anzahl': anzahl, 'requestor_ref': requestor_ref,
+        'mit_projektion': mit_projektion,
+    }
+    feld = 'ojp:StartTime' if typ == "abfahrt" else 'ojp:EndTime'
+
+    basis = None
+    trips = {}       # journey_kette → (zeit, TripResult)
+    gesehen = set()  # alle Ketten, auch ausserhalb des Fensters
+    orte = {}        # Ref → Location aus dem TripResponseContext
+    cursor = fenster_von if typ == "abfahrt" else fenster_bis
+
+    seiten = 0
+    for _ in range(max_seiten):
+        seiten += 1
+        xml_text, von, bis = _seite_holen(key, cursor, typ, api_key, build_args)
+        root = ET.fromstring(xml_text)
+        if basis is None:
+            basis = root
+
+        for loc in root.findall('.//ojp:TripResponseContext/ojp:Places/ojp:Location', ns):
+            ref = (loc.findtext('ojp:StopPoint/siri:StopPointRef', None, ns)
+                   or loc.findtext('ojp:StopPlace/ojp:StopPlaceRef', None, ns)
+                   or loc.findtext('ojp:LocationName/ojp:Text', '', ns))
+            orte.setdefault(ref, loc)
+
+        neu = 0
+        for result in root.findall('.//ojp:TripResult', ns):
+            trip = result.find('ojp:Trip', ns)
+            if trip is None or not trip.findtext(feld, '', ns):
+                continue
+            kette = _journey_kette(trip)
+            if kette in gesehen:
+                continue
+            gesehen.add(kette)
+            neu += 1
+            zeit = _parse_zeit(trip.findtext(feld, '', ns))
+            if fenster_von <= zeit <= fenster_bis:
+                trips[kette] = (_parse_zeit(trip.findtext('ojp:StartTime', '', ns)), result)
+
+        # Weiterblättern ab dem Rand der Seite (nicht eine Minute weiter: dort können weitere
+        # Trips derselben Minute liegen), bis das Fenster abgedeckt ist oder nichts Neues kommt.
+        # Endet eine Seite genau am Cursor, geht es eine Minute weiter, sonst träte sie auf der Stelle.
+        if not neu:
+            break
+        if typ == "abfahrt":
+            if bis > fenster_bis:
+                break
+            cursor = bis if bis > cursor else cursor + timedelta(minutes=1)
+        else:
+            if von < fenster_von:
+                break
+            cursor = von if von < cursor else cursor - timedelta(minutes=1)
+
+    # Zusammenführen: TripResults der ersten Seite durch die gesammelten ersetzen
+    delivery = basis.find('.//ojp:OJPTripDelivery', ns)
+    if delivery is None:
+        meldung = " ".join(t.strip() for t in basis.itertext() if t.strip())
+        raise OJPFehler(f"OJP-Antwort ohne OJPTripDelivery: {meldung[:200]}")
+    for result in delivery.findall('ojp:TripResult', ns):
+        delivery.remove(result)
+
+    places = delivery.find('ojp:TripResponseContext/ojp:Places', ns)
+    if places is not None:
+        for loc in list(places):
+            places.remove(loc)
+        places.extend(orte.values())
+
+    for _, result in sorted(trips.values(), key=lambda x: x[0]):
+        delivery.append(result)
+
+    return ET.tostring(basis, encoding="unicode"), seiten
+
+# ------------------------- 4) Trip-Anfrage mit geteiltem Cache -------------------------
+
+trip_cache = TripCache.aus_umgebung()
+
+
+def _zeit_filtern(xml_text: str, zeitpunkt: datetime, typ: str):
+    """
+    Entfernt TripResults, die vor `zeitpunkt` abfahren (Abfahrt) bzw. danach ankommen (Ankunft).
+    Gibt den Text unverändert zurück, wenn nichts wegfällt oder die Antwort keine Trips hat,
+    und None, wenn kein Trip übrig bleibt.
+    """
+    root = ET.fromstring(xml_text)
+    delivery = root.find('.//ojp:OJPTripDelivery', ns)
+    results = delivery.findall('ojp:TripResult', ns) if delivery is not None else []
+    feld = 'ojp:Trip/ojp:StartTime' if typ == "abfahrt" else 'ojp:Trip/ojp:EndTime'
+    weg = []
+    for result in results:
+        text = result.findtext(feld, '', ns)
+        if not text:
+            continue
+        zeit = _parse_zeit(text).replace(tzinfo=None)
+        if (zeit < zeitpunkt) if typ == "abfahrt" else (zeit > zeitpunkt):
+            weg.append(result)
+    if not weg:
+        return xml_text
+    if len(weg) == len(results):
+        return None
+    for result in weg:
+        delivery.remove(result)
+    return ET.tostring(root, encoding="unicode")
+
+
+def _trip_direkt(start_id, start_name, ziel_id, ziel_name, datum, uhrzeit, api_key, **build_args) -> str:
+    """Eine Trip-Anfrage genau für datum/uhrzeit, ohne Trip-Cache."""
+    resp = trip_request(build_trip_xml(start_id, start_name, ziel_id, ziel_name, datum, uhrzeit,
+                                       **build_args), api_key)
+    resp.raise_for_status()
+    return resp.content.decode('utf-8')
+
+
+def trip_abfrage(start_id, start_name, ziel_id, ziel_name, datum, uhrzeit, api_key,
+                 typ="abfahrt", anzahl=5, requestor_ref="StreamlitApp", mit_projektion=False) -> str:
+    """
+    OJPTripRequest hinter dem geteilten Trip-Cache.
+    Angefragt wird der Anfang (Abfahrt) bzw. das Ende (Ankunft) des Zeit-Buckets,
+    damit eine Antwort alle Anfragen innerhalb des Buckets abdeckt; zurück kommen nur
+    Trips ab der gewünschten Abfahrt bzw. bis zur gewünschten Ankunft. Liegen alle Trips
+    des Buckets davor bzw. danach, wird die genaue Zeit ungecacht angefragt, ebenso bei
+    einer ungültigen Zeit (die Fehlermeldung kommt dann von OJP).
+    Gibt den XML-Text zurück, wirft requests.HTTPError bei Fehlern.
+    """
+    build_args = {"typ": typ, "anzahl": anzahl, "requestor_ref": requestor_ref, "mit_projektion": mit_projektion}
+    try:
+        zeitpunkt = datetime.fromisoformat(f"{datum}T{uhrzeit}")
+        bucket = zeit_bucket(datum, uhrzeit, typ, trip_cache.bucket_min)
+    except ValueError:
+        return _trip_direkt(start_id, start_name, ziel_id, ziel_name, datum, uhrzeit, api_key, **build_args)
+
+    key = trip_cache.key(start_id, ziel_id, typ, bucket)
+    if mit_projektion:
+        key += "|projektion"  # eigene Einträge: gleiche Trips, aber mit LegTrack
+    with tracing.span("trip_cache.get") as sp:
+        xml_text = trip_cache.get(key)
+        sp.setze(treffer=xml_text is not None)
+
+    def laden():
+        xml_text = _trip_direkt(start_id, start_name, ziel_id, ziel_name,
+                                bucket.strftime("%Y-%m-%d"), bucket.strftime("%H:%M:%S"),
+                                api_key, **build_args)
+        trip_cache.put(key, xml_text, bucket)
+        return xml_text
+
+    if xml_text is None:
+        # Cache-Miss: gleichzeitige Anfragen für denselben Bucket warten auf einen gemeinsamen Call
+        xml_text = _flight.do(('trip', key), laden)
+    if zeitpunkt == bucket:
+        return xml_text
+
+    with tracing.span("trip_cache.zeit_filtern"):
+        gefiltert = _zeit_filtern(xml_text, zeitpunkt, typ)
+    if gefiltert is not None:
+        return gefiltert
+    return _flight.do(('trip_direkt', key, uhrzeit), _trip_direkt, start_id, start_name, ziel_id,
+                      ziel_name, datum, uhrzeit, api_key, **build_args)
@@ -0,0 +1,201 @@
+# ojp_stub_server.py
+#
+# Lokaler Ersatz für den OJP-Endpunkt (ojp2020), der aufgezeichnete Antworten aus
+# fixtures/ojp/ ausliefert. Für Last- und Latenztests ohne Netz:
+#
+#   python ojp_stub_server.py --port 8765 --latenz-ms 300 --jitter-ms 100 --fehlerquote 0.05
+#   OJP_URL=http://127.0.0.1:8765/ojp2020 streamlit run streamlit_chatbot.py
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ns = {'ojp': 'http://www.vdv.de/ojp', 'siri': 'http://www.siri.org.uk/siri'}
+ET.register_namespace('siri', ns['siri'])
+ET.register_namespace('ojp', ns['ojp'])
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'ojp')
+
+
+class StubKonfig:
+    """Verhalten des Stubs: Latenz, Jitter, Fehlerinjektion und Durchsatzgrenze."""
+
+    def __init__(self, latenz_ms=0, jitter_ms=0, fehlerquote=0.0, fehler_status=500,
+                 max_rps=0, seed=None, fixtures_dir=FIXTURES_DIR):
+        self.latenz_ms = latenz_ms
+        self.jitter_ms = jitter_ms
+        self.fehlerquote = fehlerquote
+        self.fehler_status = fehler_status
+        self.max_rps = max_rps
+        self.rng = random.Random(seed)
+        self.fixtures_dir = fixtures_dir
+
+        self._lock = threading.Lock()
+        self._tokens = float(max_rps)
+        self._stand = time.monotonic()
+        self.statistik = {'anfragen': 0, 'location': 0, 'trip': 0, 'fehler_injiziert': 0, 'gedrosselt': 0}
+
+    def durchlassen(self) -> bool:
+        """Token-Bucket über alle Threads; False → 429."""
+        if not self.max_rps:
+            return True
+        with self._lock:
+            jetzt = time.monotonic()
+            self._tokens = min(self.max_rps, self._tokens + (jetzt - self._stand) * self.max_rps)
+            self._stand = jetzt
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def verzoegerung_s(self) -> tuple[float, bool]:
+        """Wartezeit für diese Antwort und ob ein Fehler injiziert wird."""
+        with self._lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            fehler = self.rng.random() < self.fehlerquote
+        return max(0.0, (self.latenz_ms + jitter) / 1000.0), fehler
+
+    def zaehlen(self, feld):
+        with self._lock:
+            self.statistik[feld] += 1
+
+# ------------------------- Fixtures -------------------------
+
+def _lade_fixtures(fixtures_dir, praefix):
+    fixtures = []
+    for pfad in sorted(glob.glob(os.path.join(fixtures_dir, f"{praefix}_*.xml"))):
+        with open(pfad, 'rb') as f:
+            fixtures.append(f.read())
+    return fixtures
+
+
+def location_antwort(fixtures, ort_name: str) -> bytes:
+    """
+    Alle Locations der Fixtures, deren Name die Suche enthält. Ohne Treffer bleibt die
+    Delivery leer – wie bei OJP, damit "Haltestelle nicht gefunden" testbar ist.
+    """
+    root = ET.fromstring(fixtures[0])
+    delivery = root.find('.//ojp:OJPLocationInformationDelivery', ns)
+    alle = []
+    for fixture in fixtures:
+        alle.extend(ET.fromstring(fixture).findall('.//ojp:OJPLocationInformationDelivery/ojp:Location', ns))
+    for loc in delivery.findall('ojp:Location', ns):
+        delivery.remove(loc)
+
+    suche = ort_name.strip().lower()
+    treffer = [l for l in alle
+               if suche and suche in (l.findtext('.//ojp:StopPlaceName/ojp:Text', '', ns) or '').lower()]
+    delivery.extend(treffer)
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True)
+
+
+def trip_antwort(fixtures, start_id: str, ziel_id: str) -> bytes:
+    """Erste Trip-Fixture, die Start und Ziel enthält, sonst die erste überhaupt."""
+    for fixture in fixtures:
+        if f">{start_id}<".encode() in fixture and f">{ziel_id}<".encode() in fixture:
+            return fixture
+    return fixtures[0]
+
+# ------------------------- HTTP -------------------------
+
+def handler_fuer(konfig: StubKonfig):
+    location_fixtures = _lade_fixtures(konfig.fixtures_dir, 'location')
+    trip_fixtures = _lade_fixtures(konfig.fixtures_dir, 'trip')
+
+    class OJPStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Header und Body gehen als zwei Writes raus – ohne TCP_NODELAY hängt jede
+        # Keep-Alive-Antwort ~40 ms im Delayed-ACK des Clients (pooled requests.Session)
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass  # keine Zeile pro Anfrage – stört bei Lasttests
+
+        def _senden(self, status, body: bytes, content_type="application/xml", header=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (header or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._senden(200, json.dumps(konfig.statistik).encode(), "application/json")
+            else:
+                self._senden(200, b"ok", "text/plain")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8", "replace")
+            konfig.zaehlen('anfragen')
+
+            if not konfig.durchlassen():
+                konfig.zaehlen('gedrosselt')
+                self._senden(429, b"Too Many Requests", "text/plain", {"Retry-After": "1"})
+                return
+
+            verzoegerung, fehler = konfig.verzoegerung_s()
+            time.sleep(verzoegerung)
+            if fehler:
+                konfig.zaehlen('fehler_injiziert')
+                self._senden(konfig.fehler_status, b"injizierter Fehler", "text/plain")
+                return
+
+            if "OJPLocationInformationRequest" in body:
+                konfig.zaehlen('location')
+                m = re.search(r"<ojp:LocationName>(.*?)</ojp:LocationName>", body, re.DOTALL)
+                self._senden(200, location_antwort(location_fixtures, m.group(1) if m else ""))
+            elif "OJPTripRequest" in body:
+                konfig.zaehlen('trip')
+                refs = re.findall(r"<ojp:StopPlaceRef>(.*?)</ojp:StopPlaceRef>", body)
+                start_id, ziel_id = (refs + ["", ""])[:2]
+                self._senden(200, trip_antwort(trip_fixtures, start_id, ziel_id))
+            else:
+                self._senden(400, b"unbekannte OJP-Anfrage", "text/plain")
+
+    return OJPStubHandler
+
+
+def starte_server(host="127.0.0.1", port=0, **konfig_args):
+    """
+    Startet den Stub in einem Hintergrund-Thread (z. B. für Benchmarks).
+    Gibt (server, url) zurück; beenden mit server.shutdown().
+    """
+    konfig = StubKonfig(**konfig_args)
+    server = ThreadingHTTPServer((host, port), handler_fuer(konfig))
+    server.daemon_threads = True
+    server.konfig = konfig
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/ojp2020"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokaler OJP-Stub mit aufgezeichneten Antworten")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latenz-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--fehlerquote", type=float, default=0.0, help="Anteil Antworten mit Fehlerstatus (0–1)")
+    parser.add_argument("--fehler-status", type=int, default=500)
+    parser.add_argument("--max-rps", type=float, default=0, help="Durchsatzgrenze, darüber 429 (0 = keine)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    konfig = StubKonfig(args.latenz_ms, args.jitter_ms, args.fehlerquote, args.fehler_status,
+                        args.max_rps, args.seed, args.fixtures)
+    server = ThreadingHTTPServer((args.host, args.port), handler_fuer(konfig))
+    server.daemon_threads = True
+    print(f"🧪 OJP-Stub läuft auf http://{args.host}:{args.port}/ojp2020 (Fixtures: {args.fixtures})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
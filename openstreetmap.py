@@ -1,58 +1,65 @@
 # openstreetmap.py
 
 import streamlit as st
-from geopy.geocoders import Nominatim
 import requests
-import ssl
-import certifi
+import numpy as np
 import pandas as pd
 import folium
-from folium.features import DivIcon
+from folium.plugins import FastMarkerCluster
+from folium.utilities import JsCode
 from streamlit_folium import st_folium
+from geocoding import Geocoder, geocoder_aus_umgebung
+from oev_core.geometrie import bbox, eindeutige_indizes, zoom_fuer_bbox
+from poi_cache import PoiKachelCache
+from rate_limiter import QuotaErschoepft
 
 # --- Seite konfigurieren ---
 st.set_page_config(page_title="Einkaufsmöglichkeiten finden", layout="wide")
 
-# SSL-Kontext für Geopy
-ssl_ctx = ssl.create_default_context(cafile=certifi.where())
+# Marker pro Shop, im Browser gebaut aus [lat, lon, Nr, Name, Typ]: roter Kreis mit Nummer.
+# Tooltip als Textknoten, damit Shop-Namen aus OSM nie als HTML interpretiert werden.
+SHOP_MARKER_JS = """
+function (row) {
+    var icon = L.divIcon({
+        className: "",
+        iconSize: [24, 24],
+        iconAnchor: [12, 12],
+        html: "<div style='width:24px;height:24px;border-radius:50%;background:rgba(255,0,0,0.7);"
+            + "border:1px solid white;color:white;font-size:11px;line-height:22px;text-align:center;'>"
+            + row[2] + "</div>"
+    });
+    var tip = document.createElement("span");
+    tip.textContent = row[2] + ". " + row[3] + " (" + row[4] + ")";
+    return L.marker(new L.LatLng(row[0], row[1]), {icon: icon}).bindTooltip(tip);
+}
+"""
+
+# Weit herausgezoomt grosszügig bündeln, in der Nähe nur noch dicht beieinanderliegende Shops
+CLUSTER_RADIUS_JS = "function (zoom) { return zoom < 15 ? 80 : 40; }"
+
+@st.cache_resource
+def geocoder() -> Geocoder:
+    """Ein Geocoder pro Prozess; der Cache selbst liegt dauerhaft in SQLite (GEOCODING_SQLITE)."""
+    return geocoder_aus_umgebung()
 
-@st.cache_data
 def get_coordinates(address: str):
     """Gibt (lat, lon) zurück oder (None, None)."""
-    geolocator = Nominatim(user_agent="streamlit_shop_app", ssl_context=ssl_ctx)
-    try:
-        loc = geolocator.geocode(address, timeout=10)
-    except Exception:
-        return None, None
-    return (loc.latitude, loc.longitude) if loc else (None, None)
-
-@st.cache_data
+    return geocoder().koordinaten(address)
+
+@st.cache_resource
+def poi_cache() -> PoiKachelCache:
+    """Ein Kachel-Cache pro Prozess (SQLite-Datei, siehe POI_CACHE_SQLITE)."""
+    return PoiKachelCache()
+
 def get_shops(lat: float, lon: float, radius: int = 1000) -> pd.DataFrame:
-    """Fragt Overpass API ab und liefert DataFrame mit Name, Typ, lat, lon, Nr."""
-    overpass_url = "http://overpass-api.de/api/interpreter"
-    query = f"""
-    [out:json];
-    (
-      node["shop"](around:{radius},{lat},{lon});
-      way["shop"](around:{radius},{lat},{lon});
-      relation["shop"](around:{radius},{lat},{lon});
-    );
-    out center;
     """
-    resp = requests.get(overpass_url, params={"data": query})
-    data = resp.json()
-    shops = []
-    for el in data.get("elements", []):
-        lat_e = el.get("lat") or el.get("center", {}).get("lat")
-        lon_e = el.get("lon") or el.get("center", {}).get("lon")
-        tags = el.get("tags", {})
-        shops.append({
-            "Name": tags.get("name", "Unbenannter Shop"),
-            "Typ":  tags.get("shop", "unbekannt"),
-            "lat":  lat_e,
-            "lon":  lon_e
-        })
-    df = pd.DataFrame(shops)
+    Shops im Umkreis als DataFrame mit Name, Typ, lat, lon, Distanz (m), Nr (nächster zuerst).
+    Overpass wird nur für Kacheln abgefragt, die noch nicht im POI-Cache liegen; doppelte
+    Positionen (Node und Way desselben Shops) fallen weg.
+    """
+    shops = poi_cache().shops_im_umkreis(lon, lat, radius)
+    df = pd.DataFrame(shops, columns=["Name", "Typ", "lat", "lon", "Distanz (m)"])
+    df = df.iloc[eindeutige_indizes(df[["lon", "lat"]].to_numpy(dtype=float))].reset_index(drop=True)
     df["Nr"] = df.index + 1
     return df
 
@@ -72,8 +79,13 @@ if st.button("Suchen"):
             st.error("Die angegebene Adresse konnte nicht gefunden werden.")
             st.session_state.pop("shops_df", None)
         else:
-            df = get_shops(lat, lon, radius)
-            st.session_state["shops_df"] = {"df": df, "lat": lat, "lon": lon}
+            try:
+                df = get_shops(lat, lon, radius)
+            except (requests.RequestException, QuotaErschoepft):
+                st.error("Die Shop-Daten (Overpass API) sind im Moment nicht erreichbar. Bitte versuche es gleich nochmals.")
+                st.session_state.pop("shops_df", None)
+            else:
+                st.session_state["shops_df"] = {"df": df, "lat": lat, "lon": lon}
 
 # 2) Wenn wir ein Ergebnis haben, zeigen wir Filter + Karte + Tabelle
 if "shops_df" in st.session_state:
@@ -98,9 +110,11 @@ if "shops_df" in st.session_state:
         st.subheader(f"Shops um '{address}' (Radius {radius} m)")
 
         # --- Folium-Karte erzeugen ---
+        # Ausschnitt auf Adresse plus gefilterte Shops zuschneiden (folium will [lat, lon])
+        box = bbox(np.vstack([df_filtered[["lon", "lat"]].to_numpy(dtype=float), [lon, lat]]))
         m = folium.Map(
-            location=[lat, lon],
-            zoom_start=15,
+            location=[(box[1] + box[3]) / 2, (box[0] + box[2]) / 2],
+            zoom_start=int(zoom_fuer_bbox(box, max_zoom=17, punkt_zoom=15)),
             tiles="CartoDB dark_matter"
         )
 
@@ -112,37 +126,23 @@ if "shops_df" in st.session_state:
             tooltip="Eingegebener Ort"
         ).add_to(m)
 
-        # Kreise und nummerierte Marker
-        for _, row in df_filtered.iterrows():
-            folium.Circle(
-                radius=20,
-                location=(row.lat, row.lon),
-                color="white",
-                weight=1,
-                fill=True,
-                fill_color="red",
-                fill_opacity=0.7
-            ).add_to(m)
-
-            folium.map.Marker(
-                [row.lat, row.lon],
-                icon=DivIcon(
-                    icon_size=(30, 30),
-                    icon_anchor=(15, 15),
-                    html=(
-                        f"<div style='font-size:12px;"
-                        f"color:white;text-align:center;"
-                        f"width:30px;line-height:30px;'>"
-                        f"{row.Nr}</div>"
-                    ),
-                )
-            ).add_to(m)
-
-        # Karte in Streamlit einbetten mit vollem Leaflet-Support
-        st_folium(m, width=700, height=500)
+        # Alle Shops als eine Cluster-Ebene: die Daten gehen als ein JSON-Array an den
+        # Browser, die Marker entstehen dort (statt je Shop ein Circle + DivIcon in Python)
+        FastMarkerCluster(
+            df_filtered[["lat", "lon", "Nr", "Name", "Typ"]].to_numpy().tolist(),
+            callback=SHOP_MARKER_JS,
+            name="Shops",
+            maxClusterRadius=JsCode(CLUSTER_RADIUS_JS),
+            disableClusteringAtZoom=17,
+            spiderfyOnMaxZoom=False,
+        ).add_to(m)
+
+        # Karte in Streamlit einbetten mit vollem Leaflet-Support; keine Rückgabewerte,
+        # damit Zoomen/Verschieben (Clustering im Browser) keinen Rerun auslöst
+        st_folium(m, width=700, height=500, returned_objects=[])
 
         # Tabelle mit Details
-        st.dataframe(df_filtered[["Nr", "Name", "Typ"]])
+        st.dataframe(df_filtered[["Nr", "Name", "Typ", "Distanz (m)"]])
 
 # --- Installationshinweis ---
 st.markdown("---")
@@ -0,0 +1,241 @@
+# poi_cache.py
+
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+import tracing
+from oev_core.geometrie import haversine_m
+from rate_limiter import gedrosselt
+from singleflight import SingleFlight
+
+# Per OVERPASS_URL lässt sich auf eine eigene Overpass-Instanz umlenken
+OVERPASS_URL = os.environ.get("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+
+# Zoomstufe 15: Kacheln von rund 800 × 800 m in der Schweiz
+KACHEL_ZOOM = 15
+
+# OSM-Shops ändern sich langsam – eine Kachel gilt eine Woche
+KACHEL_TTL_S = int(os.environ.get("POI_CACHE_TTL_S", str(7 * 24 * 60 * 60)))
+
+POI_CACHE_SQLITE = os.environ.get(
+    "POI_CACHE_SQLITE", os.path.join(tempfile.gettempdir(), "oev_poi_cache.db")
+)
+
+# Keep-Alive-Verbindung zu Overpass
+_session = requests.Session()
+
+# ------------------------- 1) Kacheln (Web-Mercator / Quadkey) -------------------------
+
+def kachel(lon: float, lat: float, zoom: int = KACHEL_ZOOM) -> tuple[int, int]:
+    """Slippy-Map-Kachel (x, y), in der der Punkt liegt."""
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_r = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_r)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def quadkey(x: int, y: int, zoom: int = KACHEL_ZOOM) -> str:
+    """Bing-Quadkey der Kachel – ein String pro Kachel, Präfix = übergeordnete Kachel."""
+    ziffern = []
+    for z in range(zoom, 0, -1):
+        maske = 1 << (z - 1)
+        ziffern.append(str((1 if x & maske else 0) + (2 if y & maske else 0)))
+    return "".join(ziffern)
+
+
+def kachel_bbox(x: int, y: int, zoom: int = KACHEL_ZOOM) -> tuple[float, float, float, float]:
+    """(lon_min, lat_min, lon_max, lat_max) der Kachel."""
+    n = 2 ** zoom
+
+    def lat(yy):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * yy / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def umkreis_bbox(lon: float, lat: float, radius_m: float) -> tuple[float, float, float, float]:
+    """Bounding Box um einen Kreis (für Kachelauswahl und Vorfilter in SQLite)."""
+    dlat = math.degrees(radius_m / 6_371_000.0)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+
+def kacheln_im_umkreis(lon: float, lat: float, radius_m: float, zoom: int = KACHEL_ZOOM) -> list[tuple[int, int]]:
+    """Alle Kacheln, die die Bounding Box des Kreises berühren."""
+    lon_min, lat_min, lon_max, lat_max = umkreis_bbox(lon, lat, radius_m)
+    x0, y0 = kachel(lon_min, lat_max, zoom)
+    x1, y1 = kachel(lon_max, lat_min, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+# ------------------------- 2) Cache -------------------------
+
+class PoiKachelCache:
+    """
+    Shops aus Overpass, pro Quadkey-Kachel in SQLite abgelegt.
+
+    Eine Umkreisabfrage lädt nur die Kacheln nach, die fehlen oder abgelaufen sind
+    (alle zusammen in einer Overpass-Abfrage), und beantwortet jeden Radius danach
+    lokal: Bounding-Box-Vorfilter über den Index auf (lat, lon), dann exakte Distanz.
+    """
+
+    def __init__(self, sqlite_pfad: str = POI_CACHE_SQLITE, zoom: int = KACHEL_ZOOM,
+                 ttl_s: int = KACHEL_TTL_S, overpass_url: str = OVERPASS_URL):
+        self.zoom = zoom
+        self.ttl_s = ttl_s
+        self.overpass_url = overpass_url
+        self._sqlite_pfad = sqlite_pfad
+        self._lock = threading.Lock()          # nur für die Zähler
+        self._flight = SingleFlight()
+        self.kachel_treffer = 0
+        self.kachel_geladen = 0
+        self.overpass_abfragen = 0
+        with self._sqlite() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS poi_kacheln (
+                    quadkey TEXT PRIMARY KEY,
+                    geladen REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS pois (
+                    osm_id  TEXT PRIMARY KEY,     -- 'node/123', 'way/456', ...
+                    quadkey TEXT NOT NULL,
+                    name    TEXT NOT NULL,
+                    typ     TEXT NOT NULL,
+                    lat     REAL NOT NULL,
+                    lon     REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS pois_lat_lon ON pois (lat, lon);
+                CREATE INDEX IF NOT EXISTS pois_quadkey ON pois (quadkey);
+            """)
+
+    def _sqlite(self):
+        return sqlite3.connect(self._sqlite_pfad, timeout=5)
+
+    # ---------- Kacheln nachladen ----------
+
+    def _fehlende(self, kacheln: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        grenze = time.time() - self.ttl_s
+        keys = {quadkey(x, y, self.zoom): (x, y) for x, y in kacheln}
+        with self._sqlite() as conn:
+            frisch = {row[0] for row in conn.execute(
+                f"SELECT quadkey FROM poi_kacheln WHERE geladen > ? AND quadkey IN ({','.join('?' * len(keys))})",
+                (grenze, *keys),
+            )}
+        return [xy for qk, xy in keys.items() if qk not in frisch]
+
+    def _overpass(self, box: tuple[float, float, float, float]) -> list[dict]:
+        lon_min, lat_min, lon_max, lat_max = box
+        bbox = f"{lat_min},{lon_min},{lat_max},{lon_max}"
+        query = f"""
+        [out:json][timeout:60];
+        (
+          node["shop"]({bbox});
+          way["shop"]({bbox});
+          relation["shop"]({bbox});
+        );
+        out center;
+        """
+        with tracing.span("overpass.abfrage") as sp:
+            resp = gedrosselt("", "overpass", _session.post, self.overpass_url,
+                              data={"data": query}, timeout=90)
+            sp.setze(antwort_bytes=len(resp.content), status=resp.status_code)
+        resp.raise_for_status()
+        with self._lock:
+            self.overpass_abfragen += 1
+        return resp.json().get("elements", [])
+
+    def _laden(self, kacheln: list[tuple[int, int]]):
+        """Eine Overpass-Abfrage über die Bounding Box aller fehlenden Kacheln."""
+        boxen = [kachel_bbox(x, y, self.zoom) for x, y in kacheln]
+        box = (min(b[0] for b in boxen), min(b[1] for b in boxen),
+               max(b[2] for b in boxen), max(b[3] for b in boxen))
+        gesucht = {quadkey(x, y, self.zoom) for x, y in kacheln}
+
+        zeilen = []
+        for el in self._overpass(box):
+            lat = el.get("lat") or el.get("center", {}).get("lat")
+            lon = el.get("lon") or el.get("center", {}).get("lon")
+            if lat is None or lon is None:
+                continue
+            qk = quadkey(*kachel(lon, lat, self.zoom), self.zoom)
+            # Ways, deren Mittelpunkt in einer anderen Kachel liegt, kommen mit jener Kachel
+            if qk not in gesucht:
+                continue
+            tags = el.get("tags", {})
+            zeilen.append((f"{el.get('type')}/{el.get('id')}", qk,
+                           tags.get("name", "Unbenannter Shop"), tags.get("shop", "unbekannt"), lat, lon))
+
+        jetzt = time.time()
+        with self._sqlite() as conn:
+            conn.executemany("DELETE FROM pois WHERE quadkey = ?", [(qk,) for qk in gesucht])
+            conn.executemany("INSERT OR REPLACE INTO pois VALUES (?, ?, ?, ?, ?, ?)", zeilen)
+            conn.executemany("INSERT OR REPLACE INTO poi_kacheln VALUES (?, ?)",
+                             [(qk, jetzt) for qk in gesucht])
+        with self._lock:
+            self.kachel_geladen += len(gesucht)
+
+    def importieren(self, pois: list[tuple]):
+        """
+        Bulk-Import (z. B. OSM-Extrakt, siehe poi_index.py): Zeilen (osm_id, name, typ, lat, lon).
+        Die Kacheln der importierten POIs gelten danach als frisch geladen.
+        """
+        zeilen = [(osm_id, quadkey(*kachel(lon, lat, self.zoom), self.zoom), name, typ, lat, lon)
+                  for osm_id, name, typ, lat, lon in pois]
+        jetzt = time.time()
+        with self._sqlite() as conn:
+            conn.executemany("INSERT OR REPLACE INTO pois VALUES (?, ?, ?, ?, ?, ?)", zeilen)
+            conn.executemany("INSERT OR REPLACE INTO poi_kacheln VALUES (?, ?)",
+                             [(qk, jetzt) for qk in {z[1] for z in zeilen}])
+
+    # ---------- Abfragen ----------
+
+    def shops_im_umkreis(self, lon: float, lat: float, radius_m: float) -> list[dict]:
+        """
+        Shops im Umkreis, nach Distanz sortiert: [{"Name", "Typ", "lat", "lon", "Distanz (m)"}].
+        Wirft requests.HTTPError bzw. QuotaErschoepft, wenn Kacheln nachgeladen werden müssen
+        und Overpass nicht antwortet.
+        """
+        kacheln = kacheln_im_umkreis(lon, lat, radius_m, self.zoom)
+        fehlend = self._fehlende(kacheln)
+        with self._lock:
+            self.kachel_treffer += len(kacheln) - len(fehlend)
+        if fehlend:
+            # Gleichzeitige Sessions, denen dieselben Kacheln fehlen, teilen sich eine Overpass-
+            # Abfrage; Sessions mit anderen (oder schon geladenen) Kacheln warten nicht darauf
+            schluessel = tuple(sorted(quadkey(x, y, self.zoom) for x, y in fehlend))
+            self._flight.do(schluessel, self._laden, fehlend)
+
+        lon_min, lat_min, lon_max, lat_max = umkreis_bbox(lon, lat, radius_m)
+        with self._sqlite() as conn:
+            rows = conn.execute(
+                "SELECT name, typ, lat, lon FROM pois WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?",
+                (lat_min, lat_max, lon_min, lon_max),
+            ).fetchall()
+        if not rows:
+            return []
+        distanz = haversine_m(np.array([(r[3], r[2]) for r in rows]), (lon, lat))
+        return [
+            {"Name": rows[i][0], "Typ": rows[i][1], "lat": rows[i][2], "lon": rows[i][3],
+             "Distanz (m)": int(round(distanz[i]))}
+            for i in np.argsort(distanz, kind="stable") if distanz[i] <= radius_m
+        ]
+
+    def statistik(self) -> dict:
+        with self._sqlite() as conn:
+            kacheln, pois = conn.execute(
+                "SELECT (SELECT COUNT(*) FROM poi_kacheln), (SELECT COUNT(*) FROM pois)"
+            ).fetchone()
+        return {
+            "kacheln": kacheln,
+            "pois": pois,
+            "kachel_treffer": self.kachel_treffer,
+            "kachel_geladen": self.kachel_geladen,
+            "overpass_abfragen": self.overpass_abfragen,
+        }
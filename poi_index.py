@@ -0,0 +1,185 @@
+# poi_index.py
+#
+# Räumlicher Index über alle POIs im lokalen POI-Cache (poi_cache.py), z. B. nach dem
+# Import eines OSM-Extrakts der Schweiz. Beantwortet "welche POIs liegen im Umkreis r
+# um jede Haltestelle dieses Trips" für alle Haltestellen in einer vektorisierten Abfrage.
+#
+# Import (einmalig, z. B. mit osmium erzeugt):
+#   osmium tags-filter switzerland-latest.osm.pbf nwr/shop -o shops.osm.pbf
+#   osmium export -f geojsonseq -a type,id shops.osm.pbf -o shops.geojsonseq
+#   python poi_index.py import shops.geojsonseq
+
+import argparse
+import json
+import math
+import sqlite3
+
+import numpy as np
+
+from oev_core.geometrie import ERDRADIUS_M, haversine_m
+from poi_cache import POI_CACHE_SQLITE, PoiKachelCache
+
+# Welche OSM-Tags einen POI ausmachen (der erste vorhandene ist der Typ)
+POI_TAGS = ("shop", "amenity", "tourism")
+
+# ------------------------- 1) Gitter-Index -------------------------
+
+class PoiIndex:
+    """
+    Gleichmässiges Gitter (Zellen von `zelle_m` Metern, lokal equirektangulär projiziert)
+    über NumPy-Arrays. Die Punkte liegen nach Zellen-Schlüssel sortiert; eine Abfrage sucht
+    die Nachbarzellen aller Haltestellen gemeinsam per searchsorted und filtert exakt.
+    """
+
+    def __init__(self, lon, lat, namen=(), typen=(), zelle_m: float = 500.0):
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.namen = np.asarray(namen, dtype=object)
+        self.typen = np.asarray(typen, dtype=object)
+        self.zelle_m = zelle_m
+        # Bezugsbreite fix pro Index, damit Index und Abfrage gleich projizieren
+        self._cos_lat0 = math.cos(math.radians(float(self.lat.mean()))) if len(self.lat) else 1.0
+
+        cx, cy = self._zellen(self.lon, self.lat)
+        self._x0 = int(cx.min()) if len(cx) else 0
+        self._y0 = int(cy.min()) if len(cy) else 0
+        self._nx = int(cx.max()) - self._x0 + 1 if len(cx) else 1
+        self._ny = int(cy.max()) - self._y0 + 1 if len(cy) else 1
+        schluessel = (cx - self._x0) * self._ny + (cy - self._y0)
+        self._ordnung = np.argsort(schluessel, kind="stable")
+        self._schluessel = schluessel[self._ordnung]
+
+    def __len__(self):
+        return len(self.lon)
+
+    @classmethod
+    def aus_sqlite(cls, sqlite_pfad: str = POI_CACHE_SQLITE, zelle_m: float = 500.0) -> "PoiIndex":
+        """Alle POIs aus dem POI-Cache (importierter Extrakt und nachgeladene Kacheln)."""
+        conn = sqlite3.connect(sqlite_pfad, timeout=5)
+        try:
+            rows = conn.execute("SELECT name, typ, lon, lat FROM pois").fetchall()
+        except sqlite3.OperationalError:
+            # Noch kein POI-Cache angelegt
+            rows = []
+        finally:
+            conn.close()
+        namen, typen, lon, lat = zip(*rows) if rows else ((), (), (), ())
+        return cls(lon, lat, namen, typen, zelle_m=zelle_m)
+
+    def _zellen(self, lon: np.ndarray, lat: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        x = np.radians(lon) * self._cos_lat0 * ERDRADIUS_M
+        y = np.radians(lat) * ERDRADIUS_M
+        return np.floor(x / self.zelle_m).astype(np.int64), np.floor(y / self.zelle_m).astype(np.int64)
+
+    def umkreis(self, punkte, radius_m: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        POIs im Umkreis `radius_m` um jeden der `punkte` ([lon, lat]).
+        Gibt drei gleich lange Arrays zurück (Punkt-Index, POI-Index, Distanz in m),
+        sortiert nach Punkt und dann Distanz.
+        """
+        p = np.asarray(punkte, dtype=float).reshape(-1, 2)
+        leer = (np.arange(0), np.arange(0), np.zeros(0))
+        if len(p) == 0 or len(self) == 0:
+            return leer
+
+        # Alle Nachbarzellen aller Punkte auf einmal: (Punkte × Versätze)
+        k = int(math.ceil(radius_m / self.zelle_m))
+        dx, dy = np.meshgrid(np.arange(-k, k + 1), np.arange(-k, k + 1))
+        cx, cy = self._zellen(p[:, 0], p[:, 1])
+        zx = (cx[:, None] - self._x0) + dx.ravel()[None, :]
+        zy = (cy[:, None] - self._y0) + dy.ravel()[None, :]
+        gueltig = (zx >= 0) & (zx < self._nx) & (zy >= 0) & (zy < self._ny)
+        punkt = np.broadcast_to(np.arange(len(p))[:, None], zx.shape)[gueltig]
+        schluessel = (zx * self._ny + zy)[gueltig]
+
+        von = np.searchsorted(self._schluessel, schluessel, side="left")
+        bis = np.searchsorted(self._schluessel, schluessel, side="right")
+        anzahl = bis - von
+        if anzahl.sum() == 0:
+            return leer
+        # Kandidaten aller Zellen flach hintereinander: von[i], von[i]+1, …, bis[i]-1
+        start = np.repeat(von - (np.cumsum(anzahl) - anzahl), anzahl)
+        kandidat = self._ordnung[start + np.arange(anzahl.sum())]
+        halt = np.repeat(punkt, anzahl)
+
+        distanz = haversine_m(np.column_stack((self.lon[kandidat], self.lat[kandidat])), p[halt])
+        treffer = distanz <= radius_m
+        halt, kandidat, distanz = halt[treffer], kandidat[treffer], distanz[treffer]
+        ordnung = np.lexsort((distanz, halt))
+        return halt[ordnung], kandidat[ordnung], distanz[ordnung]
+
+# ------------------------- 2) Import eines OSM-Extrakts -------------------------
+
+def _features(pfad: str):
+    """Features aus GeoJSON (FeatureCollection) oder GeoJSON-Sequenz (eine Zeile pro Feature)."""
+    with open(pfad, encoding="utf-8") as f:
+        if pfad.endswith((".geojsonseq", ".geojsonl", ".jsonl")):
+            for zeile in f:
+                zeile = zeile.strip().lstrip("\x1e")
+                if zeile:
+                    yield json.loads(zeile)
+        else:
+            yield from json.load(f).get("features", [])
+
+
+def _mittelpunkt(geometrie: dict):
+    """Punkt oder Mittel aller Stützpunkte (für Gebäude-Ways reicht das)."""
+    koord = np.asarray(_stuetzpunkte(geometrie.get("coordinates", [])), dtype=float)
+    if koord.size == 0:
+        return None
+    lon, lat = koord.reshape(-1, 2).mean(axis=0)
+    return float(lon), float(lat)
+
+
+def _stuetzpunkte(c):
+    if c and isinstance(c[0], (int, float)):
+        return [c[:2]]
+    return [pt for teil in c for pt in _stuetzpunkte(teil)]
+
+
+def importiere_extrakt(pfad: str, sqlite_pfad: str = POI_CACHE_SQLITE) -> int:
+    """Liest einen GeoJSON-Extrakt in den POI-Cache; gibt die Anzahl POIs zurück."""
+    zeilen = []
+    for i, feature in enumerate(_features(pfad)):
+        props = feature.get("properties") or {}
+        typ = next((props[t] for t in POI_TAGS if props.get(t)), None)
+        punkt = _mittelpunkt(feature.get("geometry") or {})
+        if typ is None or punkt is None:
+            continue
+        osm_id = f"{props['@type']}/{props['@id']}" if "@id" in props else f"extrakt/{i}"
+        zeilen.append((osm_id, props.get("name", "Unbenannter Shop"), typ, punkt[1], punkt[0]))
+    PoiKachelCache(sqlite_pfad=sqlite_pfad).importieren(zeilen)
+    return len(zeilen)
+
+# ------------------------- 3) CLI -------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="POI-Extrakt importieren bzw. POIs um Trip-Haltestellen suchen")
+    parser.add_argument("--sqlite", default=POI_CACHE_SQLITE, help="Pfad des POI-Caches")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+    imp = sub.add_parser("import", help="GeoJSON/GeoJSON-Sequenz importieren")
+    imp.add_argument("datei")
+    suche = sub.add_parser("suche", help="POIs um alle Haltestellen einer TripResponse")
+    suche.add_argument("trip_xml")
+    suche.add_argument("--radius", type=float, default=300.0)
+    args = parser.parse_args()
+
+    if args.befehl == "import":
+        print(f"✅ {importiere_extrakt(args.datei, args.sqlite)} POIs importiert nach {args.sqlite}")
+        return
+
+    from oev_core.karte import pfad_aus_trip_xml
+
+    with open(args.trip_xml, "rb") as f:
+        haltestellen = pfad_aus_trip_xml(f.read())
+    index = PoiIndex.aus_sqlite(args.sqlite)
+    halt, poi, distanz = index.umkreis(haltestellen, args.radius)
+    for i, (lon, lat) in enumerate(haltestellen):
+        treffer = halt == i
+        print(f"Halt {i + 1} ({lat:.5f}, {lon:.5f}): {int(treffer.sum())} POIs im Umkreis von {args.radius:.0f} m")
+        for j, d in zip(poi[treffer][:5], distanz[treffer][:5]):
+            print(f"   {d:5.0f} m  {index.namen[j]} ({index.typen[j]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# prefetch.py
+#
+# Spekulative Vorab-Suche, solange das LLM noch Rückfragen stellt: Sobald Start und Ziel
+# aus dem Gespräch bekannt sind (teil_reiseinfos, ohne LLM), laufen die Haltestellensuchen
+# im Hintergrund; stehen auch Datum und Uhrzeit fest, zusätzlich die Trip-Anfrage mit den
+# ersten Kandidaten. Ergebnisse landen nur in den Caches von ojp_client (Haltestellen,
+# Trip-Cache) – stop_lookup- und trip-Stage holen sie von dort bzw. warten per SingleFlight
+# auf den laufenden Aufruf. Ändern sich die Slots, werden wartende Aufträge abgebrochen,
+# laufende zu Ende geführt, ihre Folgeschritte aber verworfen (keine Trip-Anfrage mehr).
+# Vorab-Aufrufe laufen mit Priorität BATCH und verdrängen keine Nutzeranfragen.
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from ojp_client import stop_place_lookup, trip_abfrage
+from rate_limiter import BATCH, prioritaet
+
+PREFETCH_WORKER = int(os.environ.get("PREFETCH_WORKER", "4"))
+
+# Ein Pool pro Prozess für alle Sitzungen
+_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKER, thread_name_prefix="prefetch")
+
+_lock = threading.Lock()
+_zaehler = {"gestartet": 0, "haltestellen": 0, "trips": 0, "abgebrochen": 0, "verworfen": 0, "fehler": 0}
+
+
+def _zaehlen(feld: str):
+    with _lock:
+        _zaehler[feld] += 1
+
+
+def statistik() -> dict:
+    """Vorab-Suchen aller Sitzungen dieses Prozesses (Admin-Ansicht)."""
+    with _lock:
+        return dict(_zaehler)
+
+
+def _slot_schluessel(slots: dict) -> tuple:
+    """Alles, was die Vorab-Suche beeinflusst; ändert sich davon etwas, gilt sie als veraltet."""
+    felder = ("start", "ziel", "start_id", "ziel_id", "datum", "uhrzeit", "typ", "fenster")
+    return tuple(slots.get(f) for f in felder)
+
+
+class SpekulativeSuche:
+    """
+    Vorab-Suche einer Sitzung. `beobachten(slots)` nach jeder Nutzereingabe bzw. Auswahl
+    aufrufen; gleiche Slots lösen nichts aus, geänderte ersetzen die laufende Suche.
+    Slots wie teil_reiseinfos bzw. die normalisierten Reiseinfos des LLM (Datum und Uhrzeit
+    wie für trip_abfrage); mit "start_id"/"ziel_id" (Auswahl in der stop_lookup-Stage)
+    werden diese statt der ersten Kandidaten verwendet.
+    """
+
+    def __init__(self, api_key: str, pool: ThreadPoolExecutor = None):
+        self.api_key = api_key
+        self._pool = pool or _pool
+        self._lock = threading.Lock()
+        self._schluessel = None
+        self._generation = 0
+        self._auftrag = None
+
+    def beobachten(self, slots: dict) -> bool:
+        """Startet eine neue Vorab-Suche, wenn sich die Slots geändert haben; True = gestartet."""
+        slots = dict(slots, fenster=bool(slots.get("fenster") or slots.get("uhrzeit_bis")))
+        schluessel = _slot_schluessel(slots)
+        with self._lock:
+            if schluessel == self._schluessel:
+                return False
+            self._abbrechen()
+            self._schluessel = schluessel
+            if not (slots.get("start") or slots.get("ziel")):
+                return False
+            generation = self._generation
+            # Sitzung und Eltern-Span an den Pool-Thread weitergeben
+            ctx = contextvars.copy_context()
+            self._auftrag = self._pool.submit(ctx.run, self._lauf, generation, slots)
+        _zaehlen("gestartet")
+        return True
+
+    def abbrechen(self):
+        """Laufende Vorab-Suche aufgeben (z. B. beim Neustart des Gesprächs)."""
+        with self._lock:
+            self._abbrechen()
+            self._schluessel = None
+
+    def _abbrechen(self):
+        self._generation += 1
+        auftrag, self._auftrag = self._auftrag, None
+        if auftrag is None or auftrag.done():
+            return
+        _zaehlen("abgebrochen" if auftrag.cancel() else "verworfen")
+
+    def _aktuell(self, generation: int) -> bool:
+        with self._lock:
+            return generation == self._generation
+
+    def _lauf(self, generation: int, slots: dict):
+        with tracing.span("prefetch", start=slots.get("start"), ziel=slots.get("ziel")) as sp, prioritaet(BATCH):
+            try:
+                kandidaten = {}
+                for feld in ("start", "ziel"):
+                    if slots.get(feld) and self._aktuell(generation):
+                        kandidaten[feld] = stop_place_lookup(slots[feld], self.api_key)
+                        _zaehlen("haltestellen")
+
+                trip_moeglich = (kandidaten.get("start") and kandidaten.get("ziel")
+                                 and slots.get("datum") and slots.get("uhrzeit") and not slots.get("fenster"))
+                if not trip_moeglich:
+                    sp.setze(trip=False)
+                    return
+                if not self._aktuell(generation):
+                    sp.setze(verworfen=True)
+                    return
+
+                start_id = slots.get("start_id") or kandidaten["start"][0][0]
+                ziel_id = slots.get("ziel_id") or kandidaten["ziel"][0][0]
+                start_name = slots.get("start_name") or kandidaten["start"][0][1]
+                ziel_name = slots.get("ziel_name") or kandidaten["ziel"][0][1]
+                trip_abfrage(start_id, start_name, ziel_id, ziel_name, slots["datum"], slots["uhrzeit"],
+                             self.api_key, typ=slots.get("typ") or "abfahrt")
+                _zaehlen("trips")
+                sp.setze(trip=True)
+            except Exception as e:
+                # Nur ein Versuch und kein Abbruch: die Stage fragt bei Bedarf selbst nochmals an
+                # (HTTP-Fehler, QuotaErschoepft, kaputtes XML …)
+                _zaehlen("fehler")
+                sp.setze(fehler=type(e).__name__)
@@ -0,0 +1,287 @@
+# rate_limiter.py
+
+import contextvars
+import hashlib
+import heapq
+import itertools
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# ------------------------- 1) Prioritäten -------------------------
+# Interaktive Anfragen (Nutzer wartet) werden vor Batch-/Hintergrund-Anfragen bedient.
+INTERAKTIV = 0
+BATCH      = 1
+
+_prioritaet = contextvars.ContextVar("prioritaet", default=INTERAKTIV)
+
+
+@contextmanager
+def prioritaet(p: int):
+    """Setzt die Priorität für alle Upstream-Aufrufe innerhalb des Blocks."""
+    token = _prioritaet.set(p)
+    try:
+        yield
+    finally:
+        _prioritaet.reset(token)
+
+
+class QuotaErschoepft(Exception):
+    """Tagesquota verbraucht oder Wartezeit überschritten – Anfrage wird abgelehnt."""
+
+# ------------------------- 2) Token-Bucket -------------------------
+
+class TokenBucket:
+    """
+    Token-Bucket pro API-Key mit Warteschlange statt sofortigem Fehler.
+
+    Der Bucket-Zustand liegt in einer SQLite-Datei und wird so von allen Prozessen
+    auf dem Host geteilt (ohne `sqlite_pfad` nur innerhalb des Prozesses). Innerhalb
+    eines Prozesses bedient eine Prioritäts-Warteschlange interaktive Anfragen zuerst.
+    """
+
+    def __init__(self, name: str, rate_pro_min: float, kapazitaet: float = None,
+                 tages_quota: int = None, sqlite_pfad: str = None):
+        self.name = name
+        self.rate_pro_s = rate_pro_min / 60.0
+        self.kapazitaet = kapazitaet or max(1.0, rate_pro_min / 6)
+        self.tages_quota = tages_quota
+        self._sqlite_pfad = sqlite_pfad
+
+        self._cond = threading.Condition()
+        self._warteschlange: list[tuple[int, int]] = []
+        self._zaehler = itertools.count()
+
+        # Zustand ohne SQLite
+        self._tokens = self.kapazitaet
+        self._stand = time.time()
+        self._tag = None
+        self._verbraucht = 0
+        self._gesperrt_bis = 0.0
+
+        # Metriken
+        self.erteilt = 0
+        self.abgelehnt = 0
+        self.gedrosselt_429 = 0
+        self._wartezeiten = deque(maxlen=1000)
+
+        if sqlite_pfad:
+            conn = self._sqlite()
+            try:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS rate_limit (
+                        name        TEXT PRIMARY KEY,
+                        tokens      REAL NOT NULL,
+                        stand       REAL NOT NULL,
+                        tag         TEXT,
+                        verbraucht  INTEGER NOT NULL DEFAULT 0,
+                        gesperrt_bis REAL NOT NULL DEFAULT 0
+                    )
+                """)
+                conn.execute(
+                    "INSERT OR IGNORE INTO rate_limit (name, tokens, stand) VALUES (?, ?, ?)",
+                    (name, self.kapazitaet, time.time())
+                )
+            finally:
+                conn.close()
+
+    def _sqlite(self):
+        # Autocommit; Transaktionen werden in _nehmen explizit gesteuert
+        return sqlite3.connect(self._sqlite_pfad, timeout=10, isolation_level=None)
+
+    def _auffuellen(self, tokens, stand, tag, verbraucht, gesperrt_bis, jetzt):
+        """Reine Bucket-Logik: gibt den neuen Zustand und die nötige Wartezeit zurück."""
+        heute = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        if tag != heute:
+            tag, verbraucht = heute, 0
+        if self.tages_quota is not None and verbraucht >= self.tages_quota:
+            raise QuotaErschoepft(f"Tagesquota für {self.name} verbraucht ({verbraucht}/{self.tages_quota}).")
+
+        tokens = min(self.kapazitaet, tokens + (jetzt - stand) * self.rate_pro_s)
+        if jetzt < gesperrt_bis:
+            return tokens, jetzt, tag, verbraucht, gesperrt_bis, gesperrt_bis - jetzt
+        if tokens >= 1:
+            return tokens - 1, jetzt, tag, verbraucht + 1, gesperrt_bis, 0.0
+        return tokens, jetzt, tag, verbraucht, gesperrt_bis, (1 - tokens) / self.rate_pro_s
+
+    def _nehmen(self) -> float:
+        """Versucht ein Token zu nehmen. 0 = erfolgreich, sonst Sekunden bis zum nächsten Versuch."""
+        jetzt = time.time()
+        if not self._sqlite_pfad:
+            with self._cond:
+                (self._tokens, self._stand, self._tag, self._verbraucht,
+                 self._gesperrt_bis, warte) = self._auffuellen(
+                    self._tokens, self._stand, self._tag, self._verbraucht, self._gesperrt_bis, jetzt)
+            return warte
+
+        conn = self._sqlite()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, stand, tag, verbraucht, gesperrt_bis FROM rate_limit WHERE name = ?",
+                (self.name,)
+            ).fetchone()
+            try:
+                *zustand, warte = self._auffuellen(*row, jetzt)
+            except QuotaErschoepft:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute(
+                "UPDATE rate_limit SET tokens = ?, stand = ?, tag = ?, verbraucht = ?, gesperrt_bis = ? "
+                "WHERE name = ?",
+                (*zustand, self.name)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return warte
+
+    def acquire(self, timeout: float = 90.0):
+        """
+        Wartet, bis ein Token frei ist. Interaktive Aufrufer überholen wartende Batch-Aufrufer.
+        Wirft QuotaErschoepft, wenn die Tagesquota verbraucht ist oder `timeout` überschritten wird.
+        """
+        ticket = (_prioritaet.get(), next(self._zaehler))
+        start = time.monotonic()
+        frist = start + timeout
+        with self._cond:
+            heapq.heappush(self._warteschlange, ticket)
+        try:
+            while True:
+                with self._cond:
+                    # Nur der Kopf der Warteschlange darf ein Token nehmen
+                    while self._warteschlange[0] != ticket:
+                        rest = frist - time.monotonic()
+                        if rest <= 0:
+                            raise QuotaErschoepft(f"Wartezeit für {self.name} überschritten.")
+                        self._cond.wait(rest)
+                warte = self._nehmen()
+                if warte == 0:
+                    break
+                rest = frist - time.monotonic()
+                if warte > rest:
+                    raise QuotaErschoepft(f"Wartezeit für {self.name} überschritten.")
+                # Kurz schlafen und neu prüfen – inzwischen kann eine interaktive Anfrage vorne stehen
+                with self._cond:
+                    self._cond.wait(min(warte, 0.5))
+        except QuotaErschoepft:
+            self.abgelehnt += 1
+            raise
+        finally:
+            with self._cond:
+                self._warteschlange.remove(ticket)
+                heapq.heapify(self._warteschlange)
+                self._cond.notify_all()
+
+        self.erteilt += 1
+        self._wartezeiten.append(time.monotonic() - start)
+
+    def drosseln(self, sekunden: float):
+        """Nach einem 429 alle Prozesse für `sekunden` pausieren lassen."""
+        self.gedrosselt_429 += 1
+        bis = time.time() + sekunden
+        if not self._sqlite_pfad:
+            with self._cond:
+                self._gesperrt_bis = max(self._gesperrt_bis, bis)
+                self._tokens = 0
+            return
+        conn = self._sqlite()
+        try:
+            conn.execute(
+                "UPDATE rate_limit SET tokens = 0, gesperrt_bis = MAX(gesperrt_bis, ?) WHERE name = ?",
+                (bis, self.name)
+            )
+        finally:
+            conn.close()
+
+    def metriken(self) -> dict:
+        wz = sorted(self._wartezeiten)
+        def perzentil(p):
+            return wz[min(len(wz) - 1, int(p * len(wz)))] if wz else 0.0
+        return {
+            'name': self.name,
+            'erteilt': self.erteilt,
+            'abgelehnt': self.abgelehnt,
+            'gedrosselt_429': self.gedrosselt_429,
+            'warteschlange': len(self._warteschlange),
+            'wartezeit_p50_s': perzentil(0.50),
+            'wartezeit_p95_s': perzentil(0.95),
+            'wartezeit_max_s': wz[-1] if wz else 0.0,
+        }
+
+# ------------------------- 3) Limits pro Key & Aufruf-Wrapper -------------------------
+
+# Standardlimits von opentransportdata.swiss, per Umgebungsvariable anpassbar
+LIMITS = {
+    'ojp':     {'rate_pro_min': float(os.environ.get("OJP_RATE_PRO_MIN", "50")),
+                'tages_quota':  int(os.environ.get("OJP_TAGES_QUOTA", "20000"))},
+    'gtfs_rt': {'rate_pro_min': float(os.environ.get("GTFS_RT_RATE_PRO_MIN", "2")),
+                'tages_quota':  int(os.environ.get("GTFS_RT_TAGES_QUOTA", "2000"))},
+    # Öffentliche Overpass-Instanz: wenige Slots pro IP, unter 10'000 Abfragen pro Tag
+    'overpass': {'rate_pro_min': float(os.environ.get("OVERPASS_RATE_PRO_MIN", "6")),
+                 'tages_quota':  int(os.environ.get("OVERPASS_TAGES_QUOTA", "5000"))},
+    # Nominatim-Nutzungsrichtlinie: höchstens 1 Anfrage pro Sekunde, keine Bursts
+    'nominatim': {'rate_pro_min': float(os.environ.get("NOMINATIM_RATE_PRO_MIN", "60")),
+                  'tages_quota':  int(os.environ.get("NOMINATIM_TAGES_QUOTA", "5000")),
+                  'kapazitaet':   1},
+}
+RATE_LIMIT_SQLITE = os.environ.get(
+    "RATE_LIMIT_SQLITE", os.path.join(tempfile.gettempdir(), "oev_rate_limit.db")
+)
+
+_limiter: dict[str, TokenBucket] = {}
+_limiter_lock = threading.Lock()
+
+
+def limiter_fuer(api_key: str, art: str) -> TokenBucket:
+    """Ein gemeinsamer Bucket pro (API-Key, Dienst). Der Key selbst wird nur gehasht abgelegt."""
+    name = f"{art}:{hashlib.sha256((api_key or '').encode()).hexdigest()[:12]}"
+    with _limiter_lock:
+        if name not in _limiter:
+            _limiter[name] = TokenBucket(name, sqlite_pfad=RATE_LIMIT_SQLITE or None, **LIMITS[art])
+        return _limiter[name]
+
+
+def _retry_after_s(wert: str, standard: float = 30.0) -> float:
+    """Retry-After in Sekunden: Zahl ('120', '1.5') oder HTTP-Datum; Unlesbares → `standard`."""
+    wert = (wert or "").strip()
+    try:
+        sekunden = float(wert)
+    except ValueError:
+        try:
+            bis = parsedate_to_datetime(wert)
+        except (TypeError, ValueError):
+            bis = None
+        if bis is None:
+            return standard
+        if bis.tzinfo is None:
+            bis = bis.replace(tzinfo=timezone.utc)
+        sekunden = (bis - datetime.now(timezone.utc)).total_seconds()
+    return max(0.0, sekunden) if math.isfinite(sekunden) else standard
+
+
+def gedrosselt(api_key: str, art: str, fn, *args, versuche: int = 3, **kwargs):
+    """
+    Führt den HTTP-Aufruf `fn` erst aus, wenn der Bucket ein Token hergibt.
+    Bei 429 wird der Bucket gemäss Retry-After gesperrt und erneut eingereiht.
+    """
+    limiter = limiter_fuer(api_key, art)
+    for _ in range(versuche):
+        limiter.acquire()
+        resp = fn(*args, **kwargs)
+        if resp.status_code != 429:
+            return resp
+        limiter.drosseln(_retry_after_s(resp.headers.get("Retry-After")))
+    return resp
+
+
+def alle_metriken() -> list[dict]:
+    with _limiter_lock:
+        return [l.metriken() for l in _limiter.values()]
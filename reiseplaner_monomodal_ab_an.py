@@ -1,14 +1,24 @@
 import os
+import sys
 import json
-import re
 import requests
-from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from openai import OpenAI
-import xml.etree.ElementTree as ET
-import dateparser
-from datetime import datetime, timezone
-from dateparser.search import search_dates
+from llm_gateway import LLMGateway
+from llm_router import BESTAETIGUNG, EXTRAKTION, ModellRouter
+from rate_limiter import QuotaErschoepft
+import oev_core
+from oev_core import (
+    nachrichten,
+    normalisiere_reiseinfos,
+    parse_trips,
+    reiseinfos_aus_antwort,
+    replace_date_keywords,
+    schritt_text,
+    trip_abfrage,
+    trip_digest,
+    trip_fenster_suche,
+    trips_nach_dauer,
+)
 
 # ------------------ Vorbereitung ------------------
 load_dotenv()
@@ -18,7 +28,9 @@ try:
 except KeyError as e:
     raise RuntimeError(f"Umgebungsvariable {e.args[0]} fehlt!") from None
 
-client = OpenAI(api_key=OPENAI_KEY)
+# Ein Gateway für alle Aufrufe (Verbindungspool, Timeout, Wiederholung, Fallback-Modell),
+# der Router wählt pro Aufgabe kleines oder grosses Modell
+llm = ModellRouter(LLMGateway(api_key=OPENAI_KEY))
 
 
 # ------------------ Vorbereitung Chat & System ------------------
@@ -32,6 +44,8 @@ messages = [{
         "Führe einen natürlichen und lockeren Dialog per Du. Stelle gezielte Rückfragen, wenn etwas fehlt. "
         "Sobald du alle Infos hast, gib **ausschließlich** ein JSON-Objekt aus:\n"
         "{\"start\": \"...\", \"ziel\": \"...\", \"datum\": \"YYYY-MM-DD\", \"uhrzeit\": \"HH:MM:SS\", \"typ\": \"abfahrt\"}"
+        " Nennt der Nutzer ein Zeitfenster (z. B. 'irgendwann zwischen 8 und 11'), setze 'uhrzeit' auf den Beginn"
+        " und ergänze \"uhrzeit_bis\": \"HH:MM:SS\" mit dem Ende des Fensters. "
         "Direkt nachdem die Verbindungen angezeigt wurden, frage den Nutzer, ob alles klar ist, ob er die Reise durchführt "
         "und welche Verbindung er wählen wird. Führe den Dialog so lange fort, bis "
         "der Nutzer keine Fragen mehr hat, und dir die Reise bestätigt hat. "
@@ -50,50 +64,6 @@ reiseinfos = None  # Wird später gesetzt
 print("🤖 Bot:", messages[1]["content"])
 
 
-# ------------------ Hilfsfunktion Datumerkennung ------------------
-# 1) Mappe deutsche Wochentags-Namen auf Zahlen
-tage = {
-    'montag': 0, 'dienstag': 1, 'mittwoch': 2,
-    'donnerstag': 3, 'freitag': 4, 'samstag': 5, 'sonntag': 6
-}
-
-def replace_date_keywords(text: str) -> str:
-    """
-    Ersetzt in `text`:
-      - 'nächsten <Wochentag>' per Hand in das nächste Datum
-      - alle anderen relativen Ausdrücke via dateparser
-    """
-    pattern = re.compile(r'\b(heute|gestern|morgen|übermorgen|nächsten?\s+\w+)\b', re.IGNORECASE)
-
-    def repl(match):
-        frag = match.group(0)
-        frag_norm = re.sub(r'(?i)\bnächsten\b', 'nächster', frag)
-
-        m = re.match(r'(?i)nächster\s+(\w+)', frag_norm)
-        if m:
-            tag = m.group(1).lower()
-            if tag in tage:
-                heute = datetime.now()
-                ziel_wd = tage[tag]
-                delta = (ziel_wd - heute.weekday() + 7) % 7
-                if delta == 0:
-                    delta = 7
-                dt = heute + timedelta(days=delta)
-                return dt.strftime('%Y-%m-%d')
-
-        dt = dateparser.parse(
-            frag_norm,
-            settings={'PREFER_DATES_FROM': 'future'},
-            languages=['de']
-        )
-        if dt:
-            return dt.strftime('%Y-%m-%d')
-
-        return frag
-
-    return pattern.sub(repl, text)
-
-
 # ------------------ Chat-Schleife ------------------
 while True:
     # 1) Frage den User
@@ -103,25 +73,19 @@ while True:
         print(f"ℹ️ Datumsausdruck ersetzt:\n  {user_input!r}\n→ {cleaned_input!r}")
     messages.append({"role": "user", "content": cleaned_input})
 
-    # 2) Anfrage an OpenAI
-    antwort = client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages
-    )
+    # 2) Anfrage an OpenAI (Slot-Filling: zuerst kleines Modell)
+    antwort = llm.chat(messages, EXTRAKTION)
     reply = antwort.choices[0].message.content.strip()
     print("🤖 Bot:", reply)
 
     # 3) JSON-Extraktion und Validierung
-    match = re.search(r'\{.*\}', reply, re.DOTALL)
-    if match:
-        try:
-            reiseinfos = json.loads(match.group(0))
-            print("\n✅ JSON erfolgreich erkannt:")
-            print(json.dumps(reiseinfos, indent=2))
-            break   # **Schleife hier verlassen** – kein weiteres input() nötig
-        except json.JSONDecodeError:
-            # fand zwar `{…}`, war aber kein valides JSON → weiterfragen
-            pass
+    gefunden = reiseinfos_aus_antwort(reply)
+    if gefunden is not None:
+        reiseinfos = gefunden
+        print("\n✅ JSON erfolgreich erkannt:")
+        print(json.dumps(reiseinfos, indent=2))
+        break   # **Schleife hier verlassen** – kein weiteres input() nötig
+    # sonst: kein `{…}` oder kein valides JSON → weiterfragen
 
     # 4) kein valides JSON → Bot-Antwort merken und Schleife fortsetzen
     messages.append({"role": "assistant", "content": reply})
@@ -131,47 +95,20 @@ while True:
 if reiseinfos is None:
     raise RuntimeError("Es wurden keine Reiseinformationen vom Chatbot zurückgeliefert.")
 
-today = datetime.now()
-# Hat der User im Roh-Input kein Jahr genannt?
-user_hat_jahr = bool(re.search(r'\b\d{4}\b', cleaned_input))
+# ------------------ Datum, Uhrzeit und Suchtyp normalisieren ------------------
+# MM-DD ergänzen, falsches Jahr korrigieren (wenn der User keins genannt hat), Uhrzeit auf HH:MM:SS
+datum_llm = reiseinfos.get("datum")
+normalisiere_reiseinfos(reiseinfos, cleaned_input)
+if reiseinfos["datum"] != datum_llm:
+    print(f"ℹ️ Datum angepasst: {datum_llm!r} → {reiseinfos['datum']}")
 
-
-# Parsed-Datum aus GPT
-datum = reiseinfos.get("datum", "")
-try:
-    dt = datetime.strptime(datum, "%Y-%m-%d")
-    # Wenn GPT ein anderes Jahr als heute verwendet hat und
-    # der User selbst kein Jahr genannt hat: Jahr ersetzen
-    if dt.year != today.year and not user_hat_jahr:
-        dt = dt.replace(year=today.year)
-        print(f"ℹ️ Jahr auf {today.year} korrigiert.")
-    datum = dt.strftime("%Y-%m-%d")
-except ValueError:
-    print("⚠️ Ungültiges Datum. Verwende heutiges Datum.")
-    datum = today.strftime("%Y-%m-%d")
-
-reiseinfos["datum"] = datum
-
-# ------------------ Neue Variable: Suchtyp (abfahrt oder ankunft) ------------------
-typ = reiseinfos.get("typ", "abfahrt")
-if typ not in ("abfahrt", "ankunft"):
-    typ = "abfahrt"
-reiseinfos["typ"] = typ
-
-# ------------------ Uhrzeit prĂźfen und normalisieren ------------------
-uhrzeit = reiseinfos.get("uhrzeit", "08:00:00")
-uhrzeit_match = re.match(r"^(\d{1,2}):?(\d{2})?:?(\d{2})?$", uhrzeit)
-if uhrzeit_match:
-    std = uhrzeit_match.group(1).zfill(2)
-    min = uhrzeit_match.group(2) if uhrzeit_match.group(2) else "00"
-    sek = uhrzeit_match.group(3) if uhrzeit_match.group(3) else "00"
-    uhrzeit = f"{std}:{min}:{sek}"
-else:
-    print("⚠️ Ungültiges Uhrzeitformat. Verwende 08:00:00.")
-    uhrzeit = "08:00:00"
+datum       = reiseinfos["datum"]
+uhrzeit     = reiseinfos["uhrzeit"]
+typ         = reiseinfos["typ"]
+uhrzeit_bis = reiseinfos.get("uhrzeit_bis")
 
 print(f"\n📅 Datum: {datum}")
-print(f"⏰ Uhrzeit: {uhrzeit}")
+print(f"⏰ Uhrzeit: {uhrzeit}" + (f" bis {uhrzeit_bis}" if uhrzeit_bis else ""))
 print(f"🔄 Suchtyp: {typ.capitalize()}")
 
 
@@ -181,60 +118,15 @@ def stop_place_lookup(ort_name):
     Sucht eine Haltestelle via OJP und gibt (stop_id, stop_name) zurück.
     Im Fehlerfall oder wenn nichts gefunden wurde, (None, None).
     """
-    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-    xml_body = f"""<?xml version="1.0" encoding="UTF-8"?>
-<OJP xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-     xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-     xmlns="http://www.siri.org.uk/siri"
-     xmlns:ojp="http://www.vdv.de/ojp"
-     version="1.0"
-     xsi:schemaLocation="http://www.siri.org.uk/siri ../ojp-xsd-v1.0/OJP.xsd">
-  <OJPRequest>
-    <ServiceRequest>
-      <RequestTimestamp>{timestamp}</RequestTimestamp>
-      <RequestorRef>IRMA</RequestorRef>
-      <ojp:OJPLocationInformationRequest>
-        <RequestTimestamp>{timestamp}</RequestTimestamp>
-        <MessageIdentifier>mi-{int(datetime.now(timezone.utc).timestamp())}</MessageIdentifier>
-        <ojp:InitialInput>
-          <ojp:LocationName>{ort_name}</ojp:LocationName>
-        </ojp:InitialInput>
-        <ojp:Restrictions>
-          <ojp:Type>stop</ojp:Type>
-          <ojp:IncludePtModes>true</ojp:IncludePtModes>
-        </ojp:Restrictions>
-      </ojp:OJPLocationInformationRequest>
-    </ServiceRequest>
-  </OJPRequest>
-</OJP>
-"""
-
-    url = "https://api.opentransportdata.swiss/ojp2020"
-    headers = {
-        "Content-Type": "application/xml",
-        "Authorization": f"Bearer {OJP_API_KEY}"
-    }
-
     print(f"🔍 Suche Ort: {ort_name!r}")
-    resp = requests.post(url, data=xml_body.encode("utf-8"), headers=headers)
-    print("Statuscode:", resp.status_code)
-    if resp.status_code != 200:
-        print(f"❌ Fehler bei Ortssuche: {resp.status_code}")
-        return None, None
+    try:
+        treffer = oev_core.stop_place_lookup(ort_name, OJP_API_KEY, requestor_ref="IRMA")
+    except QuotaErschoepft:
+        print("\n❌ Fehler bei der Ortssuche: Das API-Kontingent ist im Moment ausgeschöpft. Bitte versuche es gleich nochmals.")
+        exit()
 
-    ns = {
-        'ojp': 'http://www.vdv.de/ojp',
-        's': 'http://www.siri.org.uk/siri'
-    }
-    tree = ET.fromstring(resp.text)
-
-    # 1. Sammle alle StopPlace-Treffer
-    results = []
-    for sp in tree.findall('.//ojp:StopPlace', ns):
-        ref = sp.findtext('.//ojp:StopPlaceRef', namespaces=ns)
-        name = sp.findtext('.//ojp:StopPlaceName/ojp:Text', namespaces=ns)
-        if ref and name:
-            results.append((name, ref))
+    # 1. Alle StopPlace-Treffer als (Name, ID)
+    results = [(name, ref) for ref, name in treffer or []]
 
     if not results:
         print("⚠️ Kein gültiger Ort gefunden.")
@@ -275,227 +167,68 @@ ziel_id, ziel_name   = stop_place_lookup(reiseinfos["ziel"])
 
 
 # ------------------ XML-Abfrage an OJP-TripRequest (abhängig von Suchtyp) ------------------
-now_utc = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M")
-
-if typ == "abfahrt":
-    # Abfahrtsorientierte Suche: DepArrTime bei Origin
-    xml_body = f"""<?xml version="1.0" encoding="UTF-8"?>
-<OJP xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-     xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-     xmlns="http://www.siri.org.uk/siri"
-     version="1.0"
-     xmlns:ojp="http://www.vdv.de/ojp"
-     xsi:schemaLocation="http://www.siri.org.uk/siri ../ojp-xsd-v1.0/OJP.xsd">
-  <OJPRequest>
-    <ServiceRequest>
-      <RequestTimestamp>{now_utc}:00Z</RequestTimestamp>
-      <RequestorRef>test</RequestorRef>
-      <ojp:OJPTripRequest>
-        <RequestTimestamp>{now_utc}:00Z</RequestTimestamp>
-        <ojp:Origin>
-          <ojp:PlaceRef>
-            <ojp:StopPlaceRef>{start_id}</ojp:StopPlaceRef>
-            <ojp:LocationName>
-              <ojp:Text>{start_name}</ojp:Text>
-            </ojp:LocationName>
-          </ojp:PlaceRef>
-          <ojp:DepArrTime>{datum}T{uhrzeit}Z</ojp:DepArrTime>
-        </ojp:Origin>
-        <ojp:Destination>
-          <ojp:PlaceRef>
-            <ojp:StopPlaceRef>{ziel_id}</ojp:StopPlaceRef>
-            <ojp:LocationName>
-              <ojp:Text>{ziel_name}</ojp:Text>
-            </ojp:LocationName>
-          </ojp:PlaceRef>
-          <!-- Kein DepArrTime beim Reiseziel, da abfahrtsbasiert -->
-        </ojp:Destination>
-        <ojp:Params>
-          <ojp:NumberOfResults>5</ojp:NumberOfResults>
-          <ojp:OptimisationMethod>fastest</ojp:OptimisationMethod>
-        </ojp:Params>
-      </ojp:OJPTripRequest>
-    </ServiceRequest>
-  </OJPRequest>
-</OJP>
-"""
+if uhrzeit_bis:
+    # Zeitfenster: mehrere Seiten abfragen und zu einer Antwort zusammenführen
+    try:
+        xml_text = trip_fenster_suche(
+            start_id, start_name, ziel_id, ziel_name, datum,
+            uhrzeit, uhrzeit_bis, OJP_API_KEY, typ=typ, requestor_ref="test"
+        )
+    except requests.HTTPError as e:
+        print("\n❌ Fehler bei der Anfrage:", e.response.status_code)
+        print(e.response.text)
+        exit()
+    except QuotaErschoepft:
+        print("\n❌ Fehler bei der Anfrage: Das API-Kontingent ist im Moment ausgeschöpft. Bitte versuche es gleich nochmals.")
+        exit()
+    except oev_core.OJPFehler as e:
+        print("\n❌ Fehler bei der Anfrage:", e)
+        exit()
 else:
-    # Ankunftsorientierte Suche: DepArrTime bei Destination
-    xml_body = f"""<?xml version="1.0" encoding="UTF-8"?>
-<OJP xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-     xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-     xmlns="http://www.siri.org.uk/siri"
-     version="1.0"
-     xmlns:ojp="http://www.vdv.de/ojp"
-     xsi:schemaLocation="http://www.siri.org.uk/siri ../ojp-xsd-v1.0/OJP.xsd">
-  <OJPRequest>
-    <ServiceRequest>
-      <RequestTimestamp>{now_utc}:00Z</RequestTimestamp>
-      <RequestorRef>test</RequestorRef>
-      <ojp:OJPTripRequest>
-        <RequestTimestamp>{now_utc}:00Z</RequestTimestamp>
-        <ojp:Origin>
-          <ojp:PlaceRef>
-            <ojp:StopPlaceRef>{start_id}</ojp:StopPlaceRef>
-            <ojp:LocationName>
-              <ojp:Text>{start_name}</ojp:Text>
-            </ojp:LocationName>
-          </ojp:PlaceRef>
-          <!-- Kein DepArrTime bei Origin, da ankunftsorientiert -->
-        </ojp:Origin>
-        <ojp:Destination>
-          <ojp:PlaceRef>
-            <ojp:StopPlaceRef>{ziel_id}</ojp:StopPlaceRef>
-            <ojp:LocationName>
-              <ojp:Text>{ziel_name}</ojp:Text>
-            </ojp:LocationName>
-          </ojp:PlaceRef>
-          <ojp:DepArrTime>{datum}T{uhrzeit}Z</ojp:DepArrTime>
-        </ojp:Destination>
-        <ojp:Params>
-          <ojp:NumberOfResults>5</ojp:NumberOfResults>
-          <ojp:OptimisationMethod>fastest</ojp:OptimisationMethod>
-        </ojp:Params>
-      </ojp:OJPTripRequest>
-    </ServiceRequest>
-  </OJPRequest>
-</OJP>
-"""
-
-# ------------------ Anfrage senden ------------------
-url = "https://api.opentransportdata.swiss/ojp2020"
-headers = {
-    "Content-Type": "application/xml",
-    "Authorization": f"Bearer {OJP_API_KEY}"
-}
-
-response = requests.post(url, data=xml_body.encode("utf-8"), headers=headers)
-
-if response.status_code != 200:
-    print("\n❌ Fehler bei der Anfrage:", response.status_code)
-    print(response.text)
-    exit()
+    # ------------------ Anfrage senden (über den geteilten Trip-Cache) ------------------
+    try:
+        xml_text = trip_abfrage(start_id, start_name, ziel_id, ziel_name, datum, uhrzeit,
+                                OJP_API_KEY, typ=typ, requestor_ref="test")
+    except requests.HTTPError as e:
+        print("\n❌ Fehler bei der Anfrage:", e.response.status_code)
+        print(e.response.text)
+        exit()
+    except QuotaErschoepft:
+        print("\n❌ Fehler bei der Anfrage: Das API-Kontingent ist im Moment ausgeschöpft. Bitte versuche es gleich nochmals.")
+        exit()
 
 # ------------------ Antwort speichern ------------------
 with open("response.xml", "w", encoding="utf-8") as f:
-    f.write(response.text)
+    f.write(xml_text)
 
 print("✅ Die Antwort wurde als 'response.xml' gespeichert.")
 
 
 # ------------------ XML-Antwort verarbeiten ------------------
-#!/usr/bin/env python3
-import xml.etree.ElementTree as ET
-from datetime import datetime
-import sys, os
-
-def get_text(elem, path, ns):
-    sub = elem.find(path, ns)
-    return sub.text if sub is not None and sub.text is not None else ''
-
 def parse_and_sort_trips(xml_path):
-    ns = {'siri': 'http://www.siri.org.uk/siri', 'ojp': 'http://www.vdv.de/ojp'}
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-
-    # 1. Alle Trip-Elemente finden
-    trips = root.findall('.//ojp:TripResult/ojp:Trip', ns)
-    if not trips:
-        print("Keine Trip-Daten in der XML gefunden.")
-        sys.exit(1)
-
-    # 2. Für jeden Trip Abfahrts- und Ankunftszeit auslesen und Dauer berechnen
-    trip_durations = []
-    for trip in trips:
-        legs = trip.findall('ojp:TripLeg', ns)
-        dep_times = []
-        arr_times = []
-        for leg in legs:
-            t = leg.find('ojp:TimedLeg', ns)
-            if t is not None:
-                board  = t.find('ojp:LegBoard', ns)
-                alight = t.find('ojp:LegAlight', ns)
-
-                dep_str = board.find('.//ojp:TimetabledTime', ns).text
-                arr_str = alight.find('.//ojp:TimetabledTime', ns).text
-
-                dep_times.append(dep_str)
-                arr_times.append(arr_str)
-
-        if not dep_times:
-            continue
-
-        dep_dt = datetime.fromisoformat(dep_times[0].rstrip('Z'))
-        arr_dt = datetime.fromisoformat(arr_times[-1].rstrip('Z'))
-        duration = arr_dt - dep_dt
-        trip_durations.append((trip, duration))
-
-    if not trip_durations:
+    with open(xml_path, 'rb') as f:
+        sorted_trips = trips_nach_dauer(f.read())
+    if not sorted_trips:
         print("Keine fahrplanmäßigen Legs gefunden.")
         sys.exit(1)
 
-    # 3. Trips aufsteigend nach Dauer sortieren
-    sorted_trips = sorted(trip_durations, key=lambda x: x[1])
-
     # Schnellste Verbindung abtrennen
-    best_trip, best_duration = sorted_trips[0]
+    best_steps, best_duration = sorted_trips[0]
     alternatives = sorted_trips[1:]
 
-    def build_steps(trip):
-        steps = []
-        for leg in trip.findall('ojp:TripLeg', ns):
-            t = leg.find('ojp:TimedLeg', ns)
-            if t is not None:
-                board   = t.find('ojp:LegBoard', ns)
-                alight  = t.find('ojp:LegAlight', ns)
-                service = t.find('ojp:Service', ns)
-                steps.append({
-                    'type': 'ride',
-                    'line':      get_text(service, 'ojp:PublishedLineName/ojp:Text', ns),
-                    'dep_sta':   get_text(board,  'ojp:StopPointName/ojp:Text', ns),
-                    'dep_time':  get_text(board,  './/ojp:TimetabledTime', ns).split('T')[-1].rstrip('Z'),
-                    'dep_quay':  get_text(board,  'ojp:PlannedQuay/ojp:Text', ns),
-                    'arr_sta':   get_text(alight, 'ojp:StopPointName/ojp:Text', ns),
-                    'arr_time':  get_text(alight, './/ojp:TimetabledTime', ns).split('T')[-1].rstrip('Z'),
-                    'arr_quay':  get_text(alight, 'ojp:PlannedQuay/ojp:Text', ns)
-                })
-            else:
-                tr = leg.find('ojp:TransferLeg', ns)
-                if tr is not None:
-                    steps.append({
-                        'type':     'walk',
-                        'mode':     get_text(tr, 'ojp:TransferMode', ns),
-                        'from':     get_text(tr, 'ojp:LegStart/ojp:LocationName/ojp:Text', ns),
-                        'to':       get_text(tr, 'ojp:LegEnd/ojp:LocationName/ojp:Text', ns),
-                        'duration': get_text(tr, 'ojp:Duration', ns).lstrip('PT').lower()
-                    })
-        return steps
-
-    # 4. Ausgabe
-
     # --- Beste Verbindung ---
     print("Schnellste Verbindung:")
     print(f"Dauer: {best_duration}")
-    best_steps = build_steps(best_trip)
     for i, s in enumerate(best_steps, 1):
-        if s['type'] == 'ride':
-            print(f"{i}. 🚆 {s['line']}: {s['dep_sta']} ({s['dep_time']} Uhr, Gleis {s['dep_quay'] or '–'}) → "
-                  f"{s['arr_sta']} ({s['arr_time']} Uhr, Gleis {s['arr_quay'] or '–'})")
-        else:
-            print(f"{i}. 🚶 {s['mode'].capitalize()} von {s['from']} nach {s['to']} (Dauer {s['duration']})")
+        print(schritt_text(i, s, ohne_gleis='–'))
 
     # --- Alternative Verbindungen ---
     if alternatives:
         print("\nAlternative Verbindungen:")
-        for idx, (trip, dur) in enumerate(alternatives, 1):
+        for idx, (alt_steps, dur) in enumerate(alternatives, 1):
             print(f"\nAlternative {idx} (Dauer: {dur}):")
-            alt_steps = build_steps(trip)
             for i, s in enumerate(alt_steps, 1):
-                if s['type'] == 'ride':
-                    print(f"{i}. 🚆 {s['line']}: {s['dep_sta']} ({s['dep_time']} Uhr, Gleis {s['dep_quay'] or '–'}) → "
-                          f"{s['arr_sta']} ({s['arr_time']} Uhr, Gleis {s['arr_quay'] or '–'})")
-                else:
-                    print(f"{i}. 🚶 {s['mode'].capitalize()} von {s['from']} nach {s['to']} (Dauer {s['duration']})")
+                print(schritt_text(i, s, ohne_gleis='–'))
 
 if __name__ == '__main__':
     xml_file = sys.argv[1] if len(sys.argv) > 1 else 'response.xml'
@@ -505,11 +238,21 @@ if __name__ == '__main__':
 
 #----------------------------- Chatbot-Interaktion für Abschluss ------------------
 
+# Kompakte Verbindungsliste fürs LLM statt des ganzen Slot-Filling-Verlaufs
+best, alts = parse_trips(xml_text)
+verbindungen = trip_digest(best, alts, {"start_name": start_name, "ziel_name": ziel_name,
+                                        "datum": datum, "uhrzeit": uhrzeit, "typ": typ})
+trip_verlauf_ab = len(messages)
+messages.append({"role": "assistant", "content": "Hier sind die Verbindungen:"})
+
+
+def abschluss_nachrichten():
+    """System-Prompt, Verlauf ab den Verbindungen und die Verbindungsliste am Ende."""
+    return nachrichten(messages[trip_verlauf_ab:], verbindungen, system_prompt=messages[0]["content"])
+
+
 # Anfrage an OpenAI
-antwort = client.chat.completions.create(
-    model="gpt-4o",
-    messages=messages
-)
+antwort = llm.chat(abschluss_nachrichten(), BESTAETIGUNG)
 reply = antwort.choices[0].message.content.strip()
 print("🤖 Bot:", reply)
 
@@ -521,10 +264,7 @@ while True:
 
     messages.append({"role": "user", "content": user_input})
 
-    antwort = client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages
-    )
+    antwort = llm.chat(abschluss_nachrichten(), BESTAETIGUNG)
     bot_reply = antwort.choices[0].message.content.strip()
 
     if "<ENDE>" in bot_reply:
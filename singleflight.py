@@ -0,0 +1,56 @@
+# singleflight.py
+
+import threading
+
+
+class _Aufruf:
+    """Ein laufender Upstream-Aufruf, auf den weitere Threads warten können."""
+
+    def __init__(self):
+        self.fertig = threading.Event()
+        self.ergebnis = None
+        self.fehler = None
+
+
+class SingleFlight:
+    """
+    Fasst gleichzeitige, identische Aufrufe zusammen ("single flight").
+
+    Der erste Thread mit einem Schlüssel führt `fn` aus, alle weiteren Threads mit
+    demselben Schlüssel warten darauf und erhalten dasselbe Ergebnis bzw. dieselbe
+    Exception. Nach Abschluss wird der Schlüssel freigegeben – es wird nichts gecacht.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._laufend: dict = {}
+        self.ausgefuehrt = 0   # tatsächliche Upstream-Aufrufe
+        self.geteilt = 0       # Aufrufe, die ein laufendes Ergebnis mitbenutzt haben
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            aufruf = self._laufend.get(key)
+            fuehrend = aufruf is None
+            if fuehrend:
+                aufruf = _Aufruf()
+                self._laufend[key] = aufruf
+                self.ausgefuehrt += 1
+            else:
+                self.geteilt += 1
+
+        if not fuehrend:
+            aufruf.fertig.wait()
+            if aufruf.fehler is not None:
+                raise aufruf.fehler
+            return aufruf.ergebnis
+
+        try:
+            aufruf.ergebnis = fn(*args, **kwargs)
+            return aufruf.ergebnis
+        except BaseException as e:
+            aufruf.fehler = e
+            raise
+        finally:
+            with self._lock:
+                del self._laufend[key]
+            aufruf.fertig.set()
@@ -0,0 +1,158 @@
+# streamlit_caches.py
+#
+# Prozessweite Ressourcen der Streamlit-Apps: einmal pro Prozess statt einmal pro Sitzung
+# (st.cache_resource), jeweils mit TTL und Obergrenze der Einträge. Die Objekte werden
+# zwischen allen Sitzungen geteilt – nur lesen, nicht verändern.
+# admin_ansicht() zeigt die Kennzahlen dieser und der übrigen Caches in der Sidebar.
+
+import functools
+import os
+import threading
+import time
+
+import streamlit as st
+
+import gtfs_rt_client
+import prefetch
+import rate_limiter
+from llm_gateway import LLMGateway
+from llm_router import ModellRouter
+from ojp_client import trip_cache
+
+ROUTES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routes.txt")
+
+# ------------------------- 1) Registrierung mit Kennzahlen -------------------------
+
+_statistik: dict[str, dict] = {}
+_lock = threading.Lock()
+# Aktuelle LLM-Gateways und -Router pro API-Key, damit die Admin-Ansicht ihre Kennzahlen zeigen
+# kann; baut st.cache_resource nach Ablauf der TTL neu, ersetzt das neue Objekt das alte
+_gateways: dict = {}
+_router: dict = {}
+
+
+def geteilt(name: str, ttl_s: float, max_eintraege: int, groesse=None):
+    """
+    Wie st.cache_resource(ttl=ttl_s, max_entries=max_eintraege), zusätzlich mit Zugriffs- und
+    Erstellungszählern für die Admin-Ansicht. `groesse(wert)` beschreibt ein erstelltes Objekt
+    (z. B. "1.4 MB"); st.cache_resource kennt keine Byte-Grenze, die Obergrenze läuft über
+    die Anzahl Einträge.
+    """
+    def decorator(fn):
+        with _lock:
+            _statistik[name] = {"cache": name, "ttl_s": ttl_s, "max_eintraege": max_eintraege,
+                                "zugriffe": 0, "erstellt": 0, "zuletzt_erstellt": None, "groesse": None}
+
+        @functools.wraps(fn)
+        def erstellen(*args, **kwargs):
+            wert = fn(*args, **kwargs)
+            with _lock:
+                s = _statistik[name]
+                s["erstellt"] += 1
+                s["zuletzt_erstellt"] = time.strftime("%H:%M:%S")
+                s["groesse"] = groesse(wert) if groesse else None
+            return wert
+
+        gecacht = st.cache_resource(ttl=ttl_s, max_entries=max_eintraege, show_spinner=False)(erstellen)
+
+        @functools.wraps(fn)
+        def zugriff(*args, **kwargs):
+            with _lock:
+                _statistik[name]["zugriffe"] += 1
+            return gecacht(*args, **kwargs)
+
+        zugriff.clear = gecacht.clear
+        return zugriff
+    return decorator
+
+
+def statistik() -> list[dict]:
+    """Eine Zeile pro registrierter Ressource; Trefferquote = Anteil ohne Neuerstellung."""
+    with _lock:
+        zeilen = [dict(s) for s in _statistik.values()]
+    for z in zeilen:
+        z["trefferquote"] = 1 - z["erstellt"] / z["zugriffe"] if z["zugriffe"] else 0.0
+    return zeilen
+
+# ------------------------- 2) Ressourcen -------------------------
+
+@geteilt("llm_gateway", ttl_s=24 * 60 * 60, max_eintraege=4)
+def llm_gateway(api_key: str) -> LLMGateway:
+    """
+    Ein LLM-Gateway pro API-Key und Prozess: ein Verbindungspool, eine Parallelitätsgrenze
+    und ein gemeinsamer Latenzverlauf (SLO-Fallback) für alle Sitzungen.
+    """
+    gateway = LLMGateway(api_key=api_key)
+    _gateways[api_key] = gateway
+    return gateway
+
+
+@geteilt("llm_router", ttl_s=24 * 60 * 60, max_eintraege=4)
+def llm_router(api_key: str) -> ModellRouter:
+    """Modellwahl nach Aufgabe über das geteilte Gateway; Latenz pro Route für alle Sitzungen."""
+    router = ModellRouter(llm_gateway(api_key))
+    _router[api_key] = router
+    return router
+
+
+@geteilt("route_map", ttl_s=24 * 60 * 60, max_eintraege=1,
+         groesse=lambda m: f"{len(m)} Routen")
+def route_map(pfad: str = ROUTES_PATH) -> dict[str, dict[str, str]]:
+    """routes.txt einmal pro Prozess und Tag einlesen."""
+    return gtfs_rt_client.lade_route_map(pfad)
+
+
+# GTFS-RT wird alle 30 s neu erzeugt und darf nur 2× pro Minute abgefragt werden
+@geteilt("gtfs_rt_feed", ttl_s=30, max_eintraege=2,
+         groesse=lambda f: f"{len(f.entity)} Entities, {f.ByteSize() / 1e6:.1f} MB")
+def gtfs_feed(api_key: str):
+    """
+    Geparster GTFS-RT-Feed, für alle Sitzungen gemeinsam. Störungen (Ausfälle, grosse
+    Verspätungen) invalidieren den Trip-Cache einmal pro neuem Feed statt pro Sitzung.
+    Wirft requests.HTTPError bzw. QuotaErschoepft wie gtfs_rt_client.fetch_feed.
+    """
+    feed = gtfs_rt_client.fetch_feed(api_key)
+    trip_cache.invalidiere_aus_feed(feed)
+    return feed
+
+
+@geteilt("delay_index", ttl_s=30, max_eintraege=2,
+         groesse=lambda i: f"{len(i)} Haltestellen")
+def delay_index(api_key: str) -> dict:
+    """stop_id → Verspätungen (baue_delay_index) zum aktuellen Feed, ein Durchlauf pro Feed."""
+    return gtfs_rt_client.baue_delay_index(gtfs_feed(api_key))
+
+# ------------------------- 3) Admin-Ansicht -------------------------
+
+def llm_statistik() -> list[dict]:
+    """Kennzahlen aller in diesem Prozess erstellten Gateways (ohne eines zu erstellen)."""
+    return [g.statistik() for g in list(_gateways.values())]
+
+
+def llm_routen_statistik() -> list[dict]:
+    """Aufrufe, Eskalationen und Latenz pro Route aller Router dieses Prozesses."""
+    return [zeile for r in list(_router.values()) for zeile in r.statistik()]
+
+
+def admin_ansicht(titel: str = "🗄️ Admin: Caches"):
+    """Kennzahlen aller geteilten Ressourcen, des Trip-Caches, der Vorab-Suche und der Rate-Limiter (Sidebar)."""
+    with st.sidebar.expander(titel, expanded=False):
+        st.caption("Geteilte Ressourcen (st.cache_resource)")
+        st.dataframe(statistik(), hide_index=True)
+        st.caption("Trip-Cache")
+        st.dataframe([trip_cache.statistik()], hide_index=True)
+        st.caption("LLM-Gateway")
+        st.dataframe(llm_statistik(), hide_index=True)
+        st.dataframe(llm_routen_statistik(), hide_index=True)
+        st.caption("Vorab-Suche (spekulativ)")
+        st.dataframe([prefetch.statistik()], hide_index=True)
+        st.caption("Rate-Limiter")
+        st.dataframe(rate_limiter.alle_metriken(), hide_index=True)
+        if st.button("Geteilte Ressourcen leeren", key="admin_caches_leeren"):
+            for fn in (llm_router, llm_gateway, route_map, gtfs_feed, delay_index):
+                fn.clear()
+            for g in _gateways.values():
+                g.cache.leeren()
+            _gateways.clear()
+            _router.clear()
+            st.rerun()
@@ -1,219 +1,109 @@
 # streamlit_chatbot.py
 
-import os
-import re
-import json
+import functools
 import requests
-import xml.etree.ElementTree as ET
-import dateparser
-from datetime import datetime, timedelta, timezone
 
 import streamlit as st
-import openai
-from streamlit_karte import show_reiseweg   
+from streamlit_karte import show_reiseweg, show_shops_an_haltestellen
+import ojp_client
+import tracing
+from oev_core import (
+    SYSTEM_PROMPT, get_duration_and_transfers, nachrichten, normalisiere_reiseinfos, parse_trips,
+    reiseinfos_aus_antwort, replace_date_keywords, schritt_text, teil_reiseinfos, trip_abfrage,
+    trip_digest, trip_fenster_suche, trip_schluessel,
+)
+from llm_gateway import LLMNichtVerfuegbar
+from llm_router import BESTAETIGUNG, DIALOG, EXTRAKTION
+from prefetch import SpekulativeSuche
+from rate_limiter import QuotaErschoepft
+from streamlit_caches import admin_ansicht, gtfs_feed, llm_router
 
 # ------------------------- 1) API-Keys aus secrets laden -------------------------
 OPENAI_API_KEY = st.secrets.get("OPENAI_API_KEY")
 OJP_API_KEY    = st.secrets.get("OJP_API_KEY")
+# Optional: mit GTFS-RT fliegen gestörte Verbindungen (Ausfall, grosse Verspätung) aus dem Trip-Cache
+GTFS_RT_API_KEY = st.secrets.get("GTFS_RT_API_KEY")
+# Haltestellen und Verbindungen schon suchen, während das LLM noch nachfragt (PREFETCH = false: aus)
+PREFETCH       = st.secrets.get("PREFETCH", True)
 
 if not OPENAI_API_KEY or not OJP_API_KEY:
     st.error("❌ Bitte lege in .streamlit/secrets.toml OPENAI_API_KEY und OJP_API_KEY an.")
     st.stop()
 
-openai.api_key = OPENAI_API_KEY
+# ------------------------- 2) Funktionen -------------------------
+# Datumserkennung, Reiseinfos und Trip-Parsing kommen aus oev_core (gemeinsam mit CLI & DB-App)
 
-# ------------------------- 2) Datumerkennung/Funktionen -------------------------
-tage = {
-    'montag': 0, 'dienstag': 1, 'mittwoch': 2,
-    'donnerstag': 3, 'freitag': 4, 'samstag': 5, 'sonntag': 6
-}
-
-def replace_date_keywords(text: str) -> str:
+def stop_place_lookup(ort_name: str):
     """
-    Ersetzt deutsche relative Datumsausdrücke (heute, gestern, morgen, übermorgen, nächsten <Wochentag>) 
-    durch ein ISO-Datum (YYYY-MM-DD).  
+    Sucht eine Haltestelle via OJP. Gibt Liste von (stop_id, stop_name) oder None zurück.
     """
-    pattern = re.compile(r'\b(heute|gestern|morgen|übermorgen|nächsten?\s+\w+)\b', re.IGNORECASE)
-
-    def repl(match):
-        frag = match.group(0)
-        frag_norm = re.sub(r'(?i)\bnächsten\b', 'nächster', frag)
-
-        # 1) Manuelle "nächster <Tag>"-Berechnung
-        m = re.match(r'(?i)nächster\s+(\w+)', frag_norm)
-        if m:
-            tag = m.group(1).lower()
-            if tag in tage:
-                heute = datetime.now()
-                ziel_wd = tage[tag]
-                delta = (ziel_wd - heute.weekday() + 7) % 7
-                if delta == 0:
-                    delta = 7
-                dt = heute + timedelta(days=delta)
-                return dt.strftime('%Y-%m-%d')
-
-        # 2) Sonst dateparser ("heute", "morgen", "übermorgen")
-        dt = dateparser.parse(
-            frag_norm,
-            settings={'PREFER_DATES_FROM': 'future'},
-            languages=['de']
-        )
-        if dt:
-            return dt.strftime('%Y-%m-%d')
-
-        # 3) Fallback
-        return frag
+    return ojp_client.stop_place_lookup(ort_name, OJP_API_KEY)
 
-    return pattern.sub(repl, text)
 
-def get_text(elem, path, ns):
+def trip_projektion(args: dict) -> str:
     """
-    Sucht ein Element mit Pfad `path` im Element `elem` unter Verwendung der Namensräume `ns`.
-    Gibt den Textinhalt zurück oder einen leeren String, wenn nichts gefunden wird.
+    Dieselbe Trip-Anfrage wie in der trip-Stage, aber mit Leg-Projektion (Streckenverlauf
+    für die Karte). Läuft über dieselben Caches; wird nur bei "Genaue Streckenführung" geladen.
     """
-    sub = elem.find(path, ns)
-    return sub.text if sub is not None and sub.text is not None else ''
+    if args["uhrzeit_bis"]:
+        return trip_fenster_suche(
+            args["start_id"], args["start_name"], args["ziel_id"], args["ziel_name"], args["datum"],
+            args["uhrzeit"], args["uhrzeit_bis"], OJP_API_KEY, typ=args["typ"], mit_projektion=True
+        )
+    return trip_abfrage(
+        args["start_id"], args["start_name"], args["ziel_id"], args["ziel_name"], args["datum"],
+        args["uhrzeit"], OJP_API_KEY, typ=args["typ"], mit_projektion=True
+    )
 
-def stop_place_lookup(ort_name: str):
+
+def stoerungen_abgleichen():
     """
-    Sucht eine Haltestelle via OJP. Gibt Liste von (stop_id, stop_name) oder None zurück.
+    Holt den geteilten GTFS-RT-Feed (höchstens alle 30 s pro Prozess neu); beim Neuladen
+    invalidiert gtfs_feed die gestörten Einträge im Trip-Cache. Ohne Feed bleibt der Cache
+    bis zur TTL – die Trip-Anfrage läuft trotzdem.
     """
-    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-    xml_body = f"""<?xml version="1.0" encoding="UTF-8"?>
-<OJP xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-     xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-     xmlns="http://www.siri.org.uk/siri"
-     xmlns:ojp="http://www.vdv.de/ojp"
-     version="1.0"
-     xsi:schemaLocation="http://www.siri.org.uk/siri ../ojp-xsd-v1.0/OJP.xsd">
-  <OJPRequest>
-    <ServiceRequest>
-      <RequestTimestamp>{timestamp}</RequestTimestamp>
-      <RequestorRef>IRMA</RequestorRef>
-      <ojp:OJPLocationInformationRequest>
-        <RequestTimestamp>{timestamp}</RequestTimestamp>
-        <MessageIdentifier>mi-{int(datetime.now(timezone.utc).timestamp())}</MessageIdentifier>
-        <ojp:InitialInput>
-          <ojp:LocationName>{ort_name}</ojp:LocationName>
-        </ojp:InitialInput>
-        <ojp:Restrictions>
-          <ojp:Type>stop</ojp:Type>
-          <ojp:IncludePtModes>true</ojp:IncludePtModes>
-        </ojp:Restrictions>
-      </ojp:OJPLocationInformationRequest>
-    </ServiceRequest>
-  </OJPRequest>
-</OJP>"""
-
-    url = "https://api.opentransportdata.swiss/ojp2020"
-    headers = {
-        "Content-Type": "application/xml",
-        "Authorization": f"Bearer {OJP_API_KEY}"
-    }
-    resp = requests.post(url, data=xml_body.encode("utf-8"), headers=headers)
-    if resp.status_code != 200:
-        return None
-
-    ns = {'ojp': 'http://www.vdv.de/ojp', 's': 'http://www.siri.org.uk/siri'}
-    tree = ET.fromstring(resp.content)
-    results = []
-    for sp in tree.findall('.//ojp:StopPlace', ns):
-        ref  = sp.findtext('.//ojp:StopPlaceRef', namespaces=ns)
-        name = sp.findtext('.//ojp:StopPlaceName/ojp:Text', namespaces=ns)
-        if ref and name:
-            results.append((ref, name))
-
-    return results if results else None
-
-def parse_trips(xml_text: str):
+    if not GTFS_RT_API_KEY:
+        return
+    with tracing.span("stoerungen_abgleichen") as sp:
+        try:
+            gtfs_feed(GTFS_RT_API_KEY)
+        except (requests.RequestException, QuotaErschoepft) as e:
+            sp.setze(fehler=type(e).__name__)
+
+
+def vorab_suchen(slots: dict):
+    """Spekulative Suche der Sitzung mit den aktuellen (Teil-)Slots füttern, siehe prefetch.py."""
+    if PREFETCH:
+        st.session_state.vorab.beobachten(slots)
+
+
+def nach_trip_verlauf() -> list:
     """
-    Parst die OJP-TripResponse, sortiert alle Trips nach Dauer 
-    und gibt (besteVerbindung_steps, [ali1_steps, ali2_steps, ...]) zurück.
+    Verlauf ab "Hier sind die Verbindungen:". Das Slot-Filling davor braucht das LLM nicht
+    mehr – Start, Ziel, Zeit und alle Verbindungen stehen kompakt im Trip-Digest.
     """
-    ns = {'ojp': 'http://www.vdv.de/ojp'}
-    root = ET.fromstring(xml_text)
-    trips = root.findall('.//ojp:TripResult/ojp:Trip', ns)
-    trip_durations = []
-
-    for trip in trips:
-        legs = trip.findall('ojp:TripLeg', ns)
-        dep_times = []
-        arr_times = []
-        for leg in legs:
-            t = leg.find('ojp:TimedLeg', ns)
-            if t is not None:
-                board  = t.find('ojp:LegBoard', ns)
-                alight = t.find('ojp:LegAlight', ns)
-                dep_times.append(board.find('.//ojp:TimetabledTime', ns).text)
-                arr_times.append(alight.find('.//ojp:TimetabledTime', ns).text)
-        if dep_times:
-            dep_dt = datetime.fromisoformat(dep_times[0].rstrip('Z'))
-            arr_dt = datetime.fromisoformat(arr_times[-1].rstrip('Z'))
-            duration = arr_dt - dep_dt
-            trip_durations.append((trip, duration))
-
-    if not trip_durations:
-        return [], []
-
-    sorted_trips = sorted(trip_durations, key=lambda x: x[1])
-    best_trip = sorted_trips[0][0]
-    alts = [t[0] for t in sorted_trips[1:]]
-
-    def build_steps(trip):
-        steps = []
-        for leg in trip.findall('ojp:TripLeg', ns):
-            t = leg.find('ojp:TimedLeg', ns)
-            if t is not None:
-                board   = t.find('ojp:LegBoard', ns)
-                alight  = t.find('ojp:LegAlight', ns)
-                service = t.find('ojp:Service', ns)
-                steps.append({
-                    'type':     'ride',
-                    'line':     service.find('.//ojp:PublishedLineName/ojp:Text', ns).text,
-                    'dep_sta':  board.find('.//ojp:StopPointName/ojp:Text', ns).text,
-                    'dep_time': board.find('.//ojp:TimetabledTime', ns).text.split('T')[-1].rstrip('Z'),
-                    'dep_quay': get_text(board, 'ojp:PlannedQuay/ojp:Text', ns) or '–',
-                    'arr_sta':  alight.find('.//ojp:StopPointName/ojp:Text', ns).text,
-                    'arr_time': alight.find('.//ojp:TimetabledTime', ns).text.split('T')[-1].rstrip('Z'),
-                    'arr_quay': get_text(alight, 'ojp:PlannedQuay/ojp:Text', ns) or '–',
-                })
-            else:
-                trf = leg.find('ojp:TransferLeg', ns)
-                if trf is not None:
-                    # Dauer aus ISO-8601 („PT10M“ → „10M“) holen, zu Kleinbuchstaben,
-                    # dann „10m“ per Regex in „10 min“ umwandeln
-                    raw_dur = trf.find('ojp:Duration', ns).text.lstrip('PT')
-                    dur = raw_dur.lower()
-                    dur = re.sub(r'(\d+)m', r'\1 min', dur)
-                    steps.append({
-                        'type':     'walk',
-                        'mode':     trf.find('.//ojp:TransferMode', ns).text,
-                        'from':     trf.find('.//ojp:LegStart/ojp:LocationName/ojp:Text', ns).text,
-                        'to':       trf.find('.//ojp:LegEnd/ojp:LocationName/ojp:Text', ns).text,
-                        'duration': dur
-                    })
-        return steps
+    return st.session_state.messages[st.session_state.get("trip_verlauf_ab", 0):]
+
 
-    return build_steps(best_trip), [build_steps(t) for t in alts]
+# Antworten auf identische Eingaben wiederverwenden (Eröffnung: nur der System-Prompt)
+EROEFFNUNG_TTL_S = 6 * 60 * 60
+VERBINDUNGEN_TTL_S = 60 * 60
 
-# ——————————————————————————————————————————————————————————————
-# Hilfsfunktion für Verbindungsdauer und Umstiege
-# ——————————————————————————————————————————————————————————————
 
-def get_duration_and_transfers(steps):
-    rides = [s for s in steps if s['type'] == 'ride']
-    if not rides:
-        return ""
-    fmt = "%H:%M:%S"
-    dep = datetime.strptime(rides[0]['dep_time'], fmt)
-    arr = datetime.strptime(rides[-1]['arr_time'], fmt)
-    if arr < dep:
-        arr += timedelta(days=1)  # Nachtfahrten berücksichtigen
-    duration = arr - dep
-    hours, remainder = divmod(duration.seconds, 3600)
-    minutes = remainder // 60
-    umstiege = len(rides) - 1
-    return f"⏱️ Dauer: {hours}h {minutes}min, 🔁 Umstiege: {umstiege}"
+def gpt(messages, aufgabe: str = DIALOG, cache_ttl_s: float = None, kontext: str = None):
+    """
+    LLM-Aufruf über Router und geteiltes Gateway (Timeout, Wiederholung, Fallback-Modell, Span).
+    Die Nachrichten werden mit `nachrichten` angeordnet: statischer System-Prompt und Verlauf
+    als stabiler Präfix (Prompt-Caching beim Anbieter), `kontext` als System-Nachricht am Ende.
+    `aufgabe` wählt das Modell (Slot-Filling und kurze Bestätigungen: kleines Modell).
+    Mit `cache_ttl_s` kommt die Antwort für identische Nachrichten aus dem Antwort-Cache.
+    Antwortet kein Modell, bricht der Skriptlauf mit einer Meldung ab.
+    """
+    try:
+        return llm_router(OPENAI_API_KEY).chat(nachrichten(messages, kontext), aufgabe, cache_ttl_s=cache_ttl_s)
+    except LLMNichtVerfuegbar:
+        st.error("❌ Der Sprachassistent ist gerade nicht erreichbar. Bitte versuche es in einer Minute nochmals.")
+        st.stop()
 
 
 
@@ -223,19 +113,7 @@ if "messages" not in st.session_state:
     st.session_state.messages = [
         {
             "role": "system",
-            "content": (
-                "Du bist ein freundlicher und hilfsbereiter Mobilitäts-Chatbot. "
-                "Du planst für den Nutzer eine Reise mit dem öffentlichen Verkehr in der Schweiz. "
-                "Dein Ziel ist es, die Informationen zur Reiseplanung vom Nutzer zu sammeln: Startort, Zielort, Datum, Uhrzeit "
-                "und ob es sich um eine Abfahrts- oder Ankunftszeit handelt. "
-                "Führe einen natürlichen und lockeren Dialog per Du. Stelle gezielte Rückfragen, wenn etwas fehlt. "
-                "Sobald du alle Infos hast, gib **ausschließlich** ein JSON-Objekt aus:\n"
-                "{\"start\":\"…\", \"ziel\":\"…\", \"datum\":\"YYYY-MM-DD\", \"uhrzeit\":\"HH:MM:SS\", \"typ\":\"abfahrt\"}\n"
-                "Nach dem Stage Trip werden die Verbindungen angezeigt. Du gibst jetzt kein JSON mehr aus. "
-                "Jetzt sage dem Nutzer, dass du ihn gerne auf seiner Reise begleiten wirst."
-                "Frage den Nutzer dazu, ob alles klar ist, ob er die Reise durchführt, und welche Verbindung er wählen wird.  "
-                "Beende das Gespräch und wünsche ihm eine gute Reise. Sei kreativ und überraschend."
-            )
+            "content": SYSTEM_PROMPT
         },
 
     ]
@@ -244,6 +122,10 @@ if "messages" not in st.session_state:
     st.session_state.steps_alts = []           # Liste mit Schritte-Listen aller Alternativen
     st.session_state.stage = "chat"            # "chat" bis JSON erkannt, dann "stop_lookup", dann "trip", dann "done"
     st.session_state.user_input = ""           # Letzte Benutzereingabe
+    st.session_state.vorab = SpekulativeSuche(OJP_API_KEY)  # Vorab-Suche von Haltestellen & Trip
+
+# Alle Spans dieses Durchlaufs der Sitzung zuordnen (Debug-Sidebar, JSON-Logs)
+st.session_state.trace_sitzung = tracing.setze_sitzung(st.session_state.get("trace_sitzung"))
 
 # ------------------------- 7) UI oben: Titel & Erklärung -------------------------
 st.set_page_config(page_title="🚆 ÖV-Chatbot Schweiz", layout="wide")
@@ -254,21 +136,19 @@ st.write("---")
 
 # Wenn wir gerade in Stage "chat" sind und noch keine Assistant-Nachricht da ist:
 if st.session_state.stage == "chat" and len(st.session_state.messages) == 1:
-    # 1) GPT aufrufen mit nur der System-Instruction
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=st.session_state.messages
-    )
-    first_question = response.choices[0].message.content.strip()
+    with tracing.span("stage.chat.eroeffnung"):
+        # 1) GPT aufrufen mit nur der System-Instruction (für alle Sitzungen gleich → gecacht)
+        response = gpt(st.session_state.messages, cache_ttl_s=EROEFFNUNG_TTL_S)
+        first_question = response.choices[0].message.content.strip()
     
-    # 2) In die History übernehmen
-    st.session_state.messages.append({
-        "role": "assistant",
-        "content": first_question
-    })
+        # 2) In die History übernehmen
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": first_question
+        })
     
-    # 3) Seite neu laden, um das Feld mit der neuen Frage anzuzeigen
-    st.rerun()
+        # 3) Seite neu laden, um das Feld mit der neuen Frage anzuzeigen
+        st.rerun()
 
 
 
@@ -287,33 +167,30 @@ for msg in st.session_state.messages:
 #  >>> EINGABE BEARBEITEN: NUR IN STAGES "chat" ODER "done" <<<
 # ===============================================================
 if st.session_state.stage in ["chat", "done"]:
-    user_input = st.chat_input("🧳 Deine Nachricht:")
-    if user_input:
-        st.session_state.user_input = user_input
-        # 1) Datumsausdrücke ersetzen
-        cleaned = replace_date_keywords(user_input)
-        # Hinweis nur noch intern, nicht für den User:
-        #if cleaned != user_input:
-            #st.info(f"ℹ️ Datums­auss­druck ersetzt:\n  {user_input!r}\n→ {cleaned!r}")
-
-        # 2) Nachricht in History speichern
-        st.session_state.messages.append({"role": "user", "content": cleaned})
-
-        # 3) GPT-4 aufrufen (nur in Stage "chat"; in Stage "done" antwortet Bot direkt)
-        if st.session_state.stage == "chat":
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=st.session_state.messages
-            )
-            reply = response.choices[0].message.content.strip()
-
-            # 4) Prüfen, ob Bot ein JSON zurückgegeben hat
-            match = re.search(r'\{.*\}', reply, re.DOTALL)
-            if match:
-                # Wenn JSON gefunden wird, parsen wir es und speichern in session_state,
-                # aber KEINEN JSON-String an den User ausgeben:
-                try:
-                    parsed = json.loads(match.group(0))
+    with tracing.span(f"stage.{st.session_state.stage}.eingabe"):
+        user_input = st.chat_input("🧳 Deine Nachricht:")
+        if user_input:
+            st.session_state.user_input = user_input
+            # 1) Datumsausdrücke ersetzen
+            cleaned = replace_date_keywords(user_input)
+            # Hinweis nur noch intern, nicht für den User:
+            #if cleaned != user_input:
+                #st.info(f"ℹ️ Datums­auss­druck ersetzt:\n  {user_input!r}\n→ {cleaned!r}")
+
+            # 2) Nachricht in History speichern
+            st.session_state.messages.append({"role": "user", "content": cleaned})
+
+            # 3) GPT aufrufen (nur in Stage "chat"; in Stage "done" antwortet Bot direkt)
+            if st.session_state.stage == "chat":
+                # Was schon feststeht, im Hintergrund suchen, während das LLM antwortet
+                vorab_suchen(teil_reiseinfos(st.session_state.messages))
+                response = gpt(st.session_state.messages, EXTRAKTION)
+                reply = response.choices[0].message.content.strip()
+
+                # 4) Prüfen, ob Bot ein (gültiges) JSON zurückgegeben hat
+                parsed = reiseinfos_aus_antwort(reply)
+                if parsed is not None:
+                    # Reiseinfos in session_state speichern, aber KEINEN JSON-String an den User ausgeben:
                     st.session_state.reiseinfos = parsed
                     st.session_state.stage = "stop_lookup"
                     # Statt den rohen JSON-Text anzuzeigen, bestätigen wir kurz:
@@ -321,78 +198,65 @@ if st.session_state.stage in ["chat", "done"]:
                         "role": "assistant",
                         "content": "Super, ich habe alle notwendigen Informationen erhalten. Ich suche nun deine Verbindungen."
                     })
-                    st.rerun()
-                except json.JSONDecodeError:
-                    # Falls das gefundene Fragment kein gültiges JSON ist, ignorieren wir es
+                else:
+                    # Kein (gültiges) JSON: normale Chat-Antwort anzeigen
                     st.session_state.messages.append({"role": "assistant", "content": reply})
-                    st.rerun()
-            else:
-                # Kein JSON gefunden: normale Chat-Antwort anzeigen
-                st.session_state.messages.append({"role": "assistant", "content": reply})
                 st.rerun()
 
-        else:
-            # Stage "done": Bot antwortet abschließend
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": "Danke für deine Rückmeldung! Ich wünsche dir eine gute Reise und bis zum nächsten Mal!"
-            })
-            st.rerun()
+            else:
+                # Stage "done": Bot antwortet abschließend
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": "Danke für deine Rückmeldung! Ich wünsche dir eine gute Reise und bis zum nächsten Mal!"
+                })
+                st.rerun()
 
 # ===============================================================
 #  >>> STAGE: stop_lookup <<<
 # ===============================================================
 if st.session_state.stage == "stop_lookup":
-    reiseinfos = st.session_state.reiseinfos
-
-    # Datum normalisieren (falls ohne Jahr eingegeben)
-    heute = datetime.now()
-    user_hat_jahr = bool(re.search(r'\b\d{4}\b', st.session_state.user_input))
-    try:
-        dt = datetime.strptime(reiseinfos["datum"], "%Y-%m-%d")
-        if dt.year != heute.year and not user_hat_jahr:
-            dt = dt.replace(year=heute.year)
-        reiseinfos["datum"] = dt.strftime("%Y-%m-%d")
-    except ValueError:
-        reiseinfos["datum"] = heute.strftime("%Y-%m-%d")
-
-    # Uhrzeit normalisieren
-    uhr_raw = reiseinfos.get("uhrzeit", "08:00:00")
-    m = re.match(r"^(\d{1,2}):?(\d{2})?:?(\d{2})?$", uhr_raw)
-    if m:
-        std  = m.group(1).zfill(2)
-        minu = m.group(2) or "00"
-        sek  = m.group(3) or "00"
-        reiseinfos["uhrzeit"] = f"{std}:{minu}:{sek}"
-    else:
-        reiseinfos["uhrzeit"] = "08:00:00"
-
-    # Stop-Place-Lookup für Start und Ziel
-    start_candidates = stop_place_lookup(reiseinfos["start"])
-    ziel_candidates  = stop_place_lookup(reiseinfos["ziel"])
-
-    if not start_candidates or not ziel_candidates:
-        st.error("❌ Haltestelle(n) konnten nicht gefunden werden. Bitte neu starten und Eingabe prüfen.")
-        st.stop()
-
-    st.markdown("**Wähle die exakte Haltestelle aus den Ergebnissen unten aus.**")
-    col1, col2 = st.columns(2)
-    with col1:
-        st.write("🔎 Start-Haltestelle:")
-        start_map = {name: ref for ref, name in start_candidates}
-        chosen_start_name = st.selectbox("Start-Haltestelle auswählen", options=list(start_map.keys()))
-    with col2:
-        st.write("🔎 Ziel-Haltestelle:")
-        ziel_map = {name: ref for ref, name in ziel_candidates}
-        chosen_ziel_name = st.selectbox("Ziel-Haltestelle auswählen", options=list(ziel_map.keys()))
-
-    if st.button("Weiter zu Verbindungen"):
-        st.session_state.reiseinfos["start_id"]   = start_map[chosen_start_name]
-        st.session_state.reiseinfos["start_name"] = chosen_start_name
-        st.session_state.reiseinfos["ziel_id"]    = ziel_map[chosen_ziel_name]
-        st.session_state.reiseinfos["ziel_name"]  = chosen_ziel_name
-        st.session_state.stage = "trip"
-        st.rerun()
+    with tracing.span("stage.stop_lookup"):
+        reiseinfos = st.session_state.reiseinfos
+
+        # Datum (ohne Jahr → aktuelles), Uhrzeit, Suchtyp und optionales Fensterende normalisieren
+        normalisiere_reiseinfos(reiseinfos, st.session_state.user_input)
+
+        # Stop-Place-Lookup für Start und Ziel – schon von der Vorab-Suche im Cache bzw. noch
+        # unterwegs (dann wartet der Lookup per SingleFlight auf denselben Aufruf)
+        try:
+            start_candidates = stop_place_lookup(reiseinfos["start"])
+            ziel_candidates  = stop_place_lookup(reiseinfos["ziel"])
+        except QuotaErschoepft:
+            st.error("❌ Fehler bei der Haltestellensuche: Das API-Kontingent ist im Moment ausgeschöpft. Bitte versuche es gleich nochmals.")
+            st.stop()
+
+        if not start_candidates or not ziel_candidates:
+            st.error("❌ Haltestelle(n) konnten nicht gefunden werden. Bitte neu starten und Eingabe prüfen.")
+            st.stop()
+
+        st.markdown("**Wähle die exakte Haltestelle aus den Ergebnissen unten aus.**")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.write("🔎 Start-Haltestelle:")
+            start_map = {name: ref for ref, name in start_candidates}
+            chosen_start_name = st.selectbox("Start-Haltestelle auswählen", options=list(start_map.keys()))
+        with col2:
+            st.write("🔎 Ziel-Haltestelle:")
+            ziel_map = {name: ref for ref, name in ziel_candidates}
+            chosen_ziel_name = st.selectbox("Ziel-Haltestelle auswählen", options=list(ziel_map.keys()))
+
+        # Trip zur aktuellen Auswahl schon laden, während der Nutzer noch wählt; eine andere
+        # Auswahl ersetzt die Vorab-Suche mit den grob erkannten Slots
+        vorab_suchen({**reiseinfos, "start_id": start_map[chosen_start_name], "start_name": chosen_start_name,
+                      "ziel_id": ziel_map[chosen_ziel_name], "ziel_name": chosen_ziel_name})
+
+        if st.button("Weiter zu Verbindungen"):
+            st.session_state.reiseinfos["start_id"]   = start_map[chosen_start_name]
+            st.session_state.reiseinfos["start_name"] = chosen_start_name
+            st.session_state.reiseinfos["ziel_id"]    = ziel_map[chosen_ziel_name]
+            st.session_state.reiseinfos["ziel_name"]  = chosen_ziel_name
+            st.session_state.stage = "trip"
+            st.rerun()
 
 # … dein Code bis einschließlich „trip“-Block unverändert …
 
@@ -401,268 +265,178 @@ if st.session_state.stage == "stop_lookup":
 #  >>> STAGE: trip <<<
 # ===============================================================
 if st.session_state.stage == "trip":
-    info = st.session_state.reiseinfos
-
-    datum      = info["datum"]
-    uhrzeit    = info["uhrzeit"]
-    start_id   = info["start_id"]
-    start_name = info["start_name"]
-    ziel_id    = info["ziel_id"]
-    ziel_name  = info["ziel_name"]
-
-    typ = info.get("typ", "abfahrt")
-    if typ not in ("abfahrt", "ankunft"):
-        typ = "abfahrt"
-
-    now_utc = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-
-    if typ == "abfahrt":
-        xml_body = f"""<?xml version="1.0" encoding="UTF-8"?>
-<OJP xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-     xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-     xmlns="http://www.siri.org.uk/siri"
-     xmlns:ojp="http://www.vdv.de/ojp"
-     version="1.0"
-     xsi:schemaLocation="http://www.siri.org.uk/siri ../ojp-xsd-v1.0/OJP.xsd">
-  <OJPRequest>
-    <ServiceRequest>
-      <RequestTimestamp>{now_utc}</RequestTimestamp>
-      <RequestorRef>StreamlitApp</RequestorRef>
-      <ojp:OJPTripRequest>
-        <RequestTimestamp>{now_utc}</RequestTimestamp>
-        <ojp:Origin>
-          <ojp:PlaceRef>
-            <ojp:StopPlaceRef>{start_id}</ojp:StopPlaceRef>
-            <ojp:LocationName>
-              <ojp:Text>{start_name}</ojp:Text>
-            </ojp:LocationName>
-          </ojp:PlaceRef>
-          <ojp:DepArrTime>{datum}T{uhrzeit}Z</ojp:DepArrTime>
-        </ojp:Origin>
-        <ojp:Destination>
-          <ojp:PlaceRef>
-            <ojp:StopPlaceRef>{ziel_id}</ojp:StopPlaceRef>
-            <ojp:LocationName>
-              <ojp:Text>{ziel_name}</ojp:Text>
-            </ojp:LocationName>
-          </ojp:PlaceRef>
-          <!-- kein DepArrTime beim Reiseziel -->
-        </ojp:Destination>
-        <ojp:Params>
-          <ojp:NumberOfResults>5</ojp:NumberOfResults>
-          <ojp:OptimisationMethod>fastest</ojp:OptimisationMethod>
-        </ojp:Params>
-      </ojp:OJPTripRequest>
-    </ServiceRequest>
-  </OJPRequest>
-</OJP>
-"""
-    else:
-        xml_body = f"""<?xml version="1.0" encoding="UTF-8"?>
-<OJP xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-     xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-     xmlns="http://www.siri.org.uk/siri"
-     xmlns:ojp="http://www.vdv.de/ojp"
-     version="1.0"
-     xsi:schemaLocation="http://www.siri.org.uk/siri ../ojp-xsd-v1.0/OJP.xsd">
-  <OJPRequest>
-    <ServiceRequest>
-      <RequestTimestamp>{now_utc}</RequestTimestamp>
-      <RequestorRef>StreamlitApp</RequestorRef>
-      <ojp:OJPTripRequest>
-        <RequestTimestamp>{now_utc}</RequestTimestamp>
-        <ojp:Origin>
-          <ojp:PlaceRef>
-            <ojp:StopPlaceRef>{start_id}</ojp:StopPlaceRef>
-            <ojp:LocationName>
-              <ojp:Text>{start_name}</ojp:Text>
-            </ojp:LocationName>
-          </ojp:PlaceRef>
-          <!-- kein DepArrTime beim Origin -->
-        </ojp:Origin>
-        <ojp:Destination>
-          <ojp:PlaceRef>
-            <ojp:StopPlaceRef>{ziel_id}</ojp:StopPlaceRef>
-            <ojp:LocationName>
-              <ojp:Text>{ziel_name}</ojp:Text>
-            </ojp:LocationName>
-          </ojp:PlaceRef>
-          <ojp:DepArrTime>{datum}T{uhrzeit}Z</ojp:DepArrTime>
-        </ojp:Destination>
-        <ojp:Params>
-          <ojp:NumberOfResults>5</ojp:NumberOfResults>
-          <ojp:OptimisationMethod>fastest</ojp:OptimisationMethod>
-        </ojp:Params>
-      </ojp:OJPTripRequest>
-    </ServiceRequest>
-  </OJPRequest>
-</OJP>
-"""
-
-    headers = {
-        "Content-Type": "application/xml",
-        "Authorization": f"Bearer {OJP_API_KEY}"
-    }
-    response = requests.post(
-        "https://api.opentransportdata.swiss/ojp2020",
-        data=xml_body.encode("utf-8"),
-        headers=headers
-    )
-
-    if response.status_code != 200:
-        st.error(f"❌ Fehler bei der Trip-Anfrage: {response.status_code}")
-        st.stop()
-
-    best, alts = parse_trips(response.content)
-    st.session_state.steps_best = best
-    st.session_state.steps_alts = alts
-
-    # ───────────────────────────────────────────────────────────────────
-    # Neu: XML-Antwort im Session-State speichern
-    st.session_state.xml_response = response.content.decode('utf-8')
-    # ───────────────────────────────────────────────────────────────────
-
-    best, alts = parse_trips(response.content)
-    st.session_state.steps_best = best
-    st.session_state.steps_alts = alts
-
-
-
-
+    with tracing.span("stage.trip"):
+        info = st.session_state.reiseinfos
+
+        datum      = info["datum"]
+        uhrzeit    = info["uhrzeit"]
+        start_id   = info["start_id"]
+        start_name = info["start_name"]
+        ziel_id    = info["ziel_id"]
+        ziel_name  = info["ziel_name"]
+
+        typ = info.get("typ", "abfahrt")
+        if typ not in ("abfahrt", "ankunft"):
+            typ = "abfahrt"
+
+        uhrzeit_bis = info.get("uhrzeit_bis")
+        stoerungen_abgleichen()
+        try:
+            if uhrzeit_bis:
+                # Zeitfenster-Modus ("irgendwann zwischen 8 und 11"): mehrere Seiten abfragen
+                xml_response = trip_fenster_suche(
+                    start_id, start_name, ziel_id, ziel_name, datum,
+                    uhrzeit, uhrzeit_bis, OJP_API_KEY, typ=typ
+                )
+            else:
+                # Einzelne Anfrage über den geteilten Trip-Cache
+                xml_response = trip_abfrage(
+                    start_id, start_name, ziel_id, ziel_name, datum, uhrzeit, OJP_API_KEY, typ=typ
+                )
+        except requests.HTTPError as e:
+            st.error(f"❌ Fehler bei der Trip-Anfrage: {e.response.status_code}")
+            st.stop()
+        except QuotaErschoepft:
+            st.error("❌ Fehler bei der Trip-Anfrage: Das API-Kontingent ist im Moment ausgeschöpft. Bitte versuche es gleich nochmals.")
+            st.stop()
+        except ojp_client.OJPFehler:
+            st.error("❌ Fehler bei der Trip-Anfrage: Der Fahrplandienst hat keine Verbindungen geliefert. Bitte prüfe Datum und Uhrzeit.")
+            st.stop()
+
+        # ───────────────────────────────────────────────────────────────────
+        # Neu: XML-Antwort im Session-State speichern
+        st.session_state.xml_response = xml_response
+        # Hash einmal pro Trip: Schlüssel für die gecachte Kartengeometrie
+        st.session_state.xml_hash = trip_schluessel(xml_response)
+        # Parameter merken, damit die Karte den Streckenverlauf bei Bedarf nachladen kann
+        st.session_state.trip_args = {
+            "start_id": start_id, "start_name": start_name, "ziel_id": ziel_id, "ziel_name": ziel_name,
+            "datum": datum, "uhrzeit": uhrzeit, "uhrzeit_bis": uhrzeit_bis, "typ": typ,
+        }
+        # ───────────────────────────────────────────────────────────────────
+
+        with tracing.span("parse_trips", anfrage_bytes=len(xml_response)):
+            best, alts = parse_trips(xml_response)
+        st.session_state.steps_best = best
+        st.session_state.steps_alts = alts
+        # Kompakte Verbindungsliste fürs LLM: ersetzt ab hier den Slot-Filling-Verlauf
+        st.session_state.trip_digest = trip_digest(best, alts, info)
+
+
+
+
+
+        # ——————————————————————————————————————————————————————————————
+        # Ausgabe der Verbindungen + Frage (einmalig):
+        # ——————————————————————————————————————————————————————————————
+
+        st.session_state.trip_verlauf_ab = len(st.session_state.messages)
+        st.session_state.messages.append({"role": "assistant", "content": "Hier sind die Verbindungen:"})
+        st.chat_message("assistant").write("Hier sind die Verbindungen:")
+
+        st.markdown("### 🚀 Schnellste Verbindung")
+        duration_info = get_duration_and_transfers(best)
+        if duration_info:
+            st.write(duration_info)
+        for i, s in enumerate(best, start=1):
+            st.write(schritt_text(i, s, markdown=True))
+
+        if alts:
+            st.markdown("### 🔄 Alternative Verbindungen")
+            for idx, alt in enumerate(alts, start=1):
+                st.markdown(f"**Alternative {idx}:**")
+                duration_info = get_duration_and_transfers(alt)
+                if duration_info:
+                    st.write(duration_info)
+                for j, s in enumerate(alt, start=1):
+                    st.write(schritt_text(j, s, markdown=True))
+        else:
+            st.info("Keine Alternativen verfügbar.")
 
-    # ——————————————————————————————————————————————————————————————
-    # Ausgabe der Verbindungen + Frage (einmalig):
-    # ——————————————————————————————————————————————————————————————
 
-    st.session_state.messages.append({"role": "assistant", "content": "Hier sind die Verbindungen:"})
-    st.chat_message("assistant").write("Hier sind die Verbindungen:")
+        # Nur Verbindungsliste + "Hier sind die Verbindungen:" → gleiche Verbindungen, gleiche Rückfrage
+        response = gpt(nach_trip_verlauf(), BESTAETIGUNG, cache_ttl_s=VERBINDUNGEN_TTL_S,
+                       kontext=st.session_state.trip_digest)
+        bot_reply = response.choices[0].message.content.strip()
 
-    st.markdown("### 🚀 Schnellste Verbindung")
-    duration_info = get_duration_and_transfers(best)
-    if duration_info:
-        st.write(duration_info)
-    for i, s in enumerate(best, start=1):
-        if s['type'] == 'ride':
-            st.write(
-                f"{i}. 🚆 **{s['line']}**: {s['dep_sta']} ({s['dep_time']} Uhr, Gleis {s['dep_quay']}) → "
-                f"{s['arr_sta']} ({s['arr_time']} Uhr, Gleis {s['arr_quay']})"
-            )
-        else:
-            st.write(
-                f"{i}. 🚶 **{s['mode'].capitalize()}** von {s['from']} nach {s['to']} "
-                f"(Dauer {s['duration']})"
-            )
+        # 4) Speichere und zeige die Antwort an
+        st.session_state.messages.append({
+            "role":"assistant",
+            "content": bot_reply
+        })
+        st.chat_message("assistant").write(bot_reply)
 
-    if alts:
-        st.markdown("### 🔄 Alternative Verbindungen")
-        for idx, alt in enumerate(alts, start=1):
-            st.markdown(f"**Alternative {idx}:**")
-            duration_info = get_duration_and_transfers(alt)
-            if duration_info:
-                st.write(duration_info)
-            for j, s in enumerate(alt, start=1):
-                if s['type'] == 'ride':
-                    st.write(
-                        f"{j}. 🚆 **{s['line']}**: {s['dep_sta']} ({s['dep_time']} Uhr, Gleis {s['dep_quay']}) → "
-                        f"{s['arr_sta']} ({s['arr_time']} Uhr, Gleis {s['arr_quay']})"
-                    )
-                else:
-                    st.write(
-                        f"{j}. 🚶 **{s['mode'].capitalize()}** von {s['from']} nach {s['to']} "
-                        f"(Dauer {s['duration']})"
-                    )
-    else:
-        st.info("Keine Alternativen verfügbar.")
 
-
-    response = openai.chat.completions.create(
-        model="gpt-4o",                    
-        messages=st.session_state.messages
-    )
-    bot_reply = response.choices[0].message.content.strip()
-
-    # 4) Speichere und zeige die Antwort an
-    st.session_state.messages.append({
-        "role":"assistant",
-        "content": bot_reply
-    })
-    st.chat_message("assistant").write(bot_reply)
-
-
-    user_choice = st.chat_input("🧳 Deine Antwort:")
-    if user_choice:
-        st.session_state.messages.append({"role": "user", "content": user_choice})
-        # Wenn der Nutzer hier antwortet, merken wir uns die Wahl und schalten erst danach auf "done"
-        st.session_state.stage = "done"
-        # Jetzt rerunen, damit wir ins "done"-Branch springen:
-        st.rerun()
+        user_choice = st.chat_input("🧳 Deine Antwort:")
+        if user_choice:
+            st.session_state.messages.append({"role": "user", "content": user_choice})
+            # Wenn der Nutzer hier antwortet, merken wir uns die Wahl und schalten erst danach auf "done"
+            st.session_state.stage = "done"
+            # Jetzt rerunen, damit wir ins "done"-Branch springen:
+            st.rerun()
 
 
 # ===============================================================
 #  >>> STAGE: done <<<
 # ===============================================================
 if st.session_state.stage == "done":
-    # 1) Zuerst zeigen wir hier die Verbindungen erneut, damit sie auch nach dem Rerun sichtbar bleiben:
-    best = st.session_state.steps_best or []
-    alts = st.session_state.steps_alts or []
+    with tracing.span("stage.done"):
+        # 1) Zuerst zeigen wir hier die Verbindungen erneut, damit sie auch nach dem Rerun sichtbar bleiben:
+        best = st.session_state.steps_best or []
+        alts = st.session_state.steps_alts or []
     
 
-    st.markdown("### 🚀 Schnellste Verbindung")
-    duration_info = get_duration_and_transfers(best)
-    if duration_info:
-        st.write(duration_info)
-    for i, s in enumerate(best, start=1):
-        if s['type'] == 'ride':
-            st.write(
-                f"{i}. 🚆 **{s['line']}**: {s['dep_sta']} ({s['dep_time']} Uhr, Gleis {s['dep_quay']}) → "
-                f"{s['arr_sta']} ({s['arr_time']} Uhr, Gleis {s['arr_quay']})"
-            )
+        st.markdown("### 🚀 Schnellste Verbindung")
+        duration_info = get_duration_and_transfers(best)
+        if duration_info:
+            st.write(duration_info)
+        for i, s in enumerate(best, start=1):
+            st.write(schritt_text(i, s, markdown=True))
+
+        if alts:
+            st.markdown("### 🔄 Alternative Verbindungen")
+            for idx, alt in enumerate(alts, start=1):
+                st.markdown(f"**Alternative {idx}:**")
+                duration_info = get_duration_and_transfers(alt)
+                if duration_info:
+                    st.write(duration_info)
+                for j, s in enumerate(alt, start=1):
+                    st.write(schritt_text(j, s, markdown=True))
         else:
-            st.write(
-                f"{i}. 🚶 **{s['mode'].capitalize()}** von {s['from']} nach {s['to']} "
-                f"(Dauer {s['duration']})"
+            st.info("Keine Alternativen verfügbar.")
+
+        # ----------------------------------------------
+        # Ganz am Schluss: Karte mit dem Reiseweg anzeigen
+        # ----------------------------------------------
+        st.markdown("---")
+        st.markdown("## Karte zum Reiseweg")
+        with tracing.span("karte.render"):
+            args = st.session_state.get("trip_args")
+            show_reiseweg(
+                st.session_state.xml_response, st.session_state.get("xml_hash"),
+                functools.partial(trip_projektion, args) if args else None,
             )
+            show_shops_an_haltestellen(st.session_state.xml_response, st.session_state.get("xml_hash"))
 
-    if alts:
-        st.markdown("### 🔄 Alternative Verbindungen")
-        for idx, alt in enumerate(alts, start=1):
-            st.markdown(f"**Alternative {idx}:**")
-            duration_info = get_duration_and_transfers(alt)
-            if duration_info:
-                st.write(duration_info)
-            for j, s in enumerate(alt, start=1):
-                if s['type'] == 'ride':
-                    st.write(
-                        f"{j}. 🚆 **{s['line']}**: {s['dep_sta']} ({s['dep_time']} Uhr, Gleis {s['dep_quay']}) → "
-                        f"{s['arr_sta']} ({s['arr_time']} Uhr, Gleis {s['arr_quay']})"
-                    )
-                else:
-                    st.write(
-                        f"{j}. 🚶 **{s['mode'].capitalize()}** von {s['from']} nach {s['to']} "
-                        f"(Dauer {s['duration']})"
-                    )
-    else:
-        st.info("Keine Alternativen verfügbar.")
+        # ––– freie Abschlussnachricht –––
 
-    # ----------------------------------------------
-    # Ganz am Schluss: Karte mit dem Reiseweg anzeigen
-    # ----------------------------------------------
-    st.markdown("---")
-    st.markdown("## Karte zum Reiseweg")
-    show_reiseweg(st.session_state.xml_response)
+        # enthält jetzt auch die letzte User-Antwort; offene Fragen gehen ans grosse Modell
+        response = gpt(nach_trip_verlauf(), BESTAETIGUNG, kontext=st.session_state.get("trip_digest"))
+        final_reply = response.choices[0].message.content.strip()
 
-    # ––– freie Abschlussnachricht –––
+        # Antwort speichern und ausgeben
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": final_reply
+        })
+        st.chat_message("assistant").write(final_reply)
 
-    response = openai.chat.completions.create(
-        model="gpt-4o",                            
-        messages=st.session_state.messages        # enthält jetzt auch die letzte User-Antwort
-    )
-    final_reply = response.choices[0].message.content.strip()
-
-    # Antwort speichern und ausgeben
-    st.session_state.messages.append({
-        "role": "assistant",
-        "content": final_reply
-    })
-    st.chat_message("assistant").write(final_reply)
 
+# ===============================================================
+#  >>> DEBUG: Latenzen pro Stufe (nur mit DEBUG_SIDEBAR = true in secrets.toml) <<<
+# ===============================================================
+if st.secrets.get("DEBUG_SIDEBAR", False):
+    tracing.debug_sidebar()
+# Kennzahlen der geteilten Caches (nur mit ADMIN_CACHES = true in secrets.toml)
+if st.secrets.get("ADMIN_CACHES", False):
+    admin_ansicht()
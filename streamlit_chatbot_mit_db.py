@@ -1,13 +1,14 @@
 # Datei: streamlit_chatbot.py
 import streamlit as st
-import openai
-import re
-import json
 from chatbot_util_mit_db import replace_date_keywords, stop_place_lookup, parse_trips
+from oev_core import normalisiere_reiseinfos, reiseinfos_aus_antwort
 from datetime import datetime
+from llm_gateway import LLMNichtVerfuegbar
+from llm_router import EXTRAKTION
+from streamlit_caches import llm_router
 
-# Setze API-Key (wird in app.py bereits aus secrets geladen)
-openai.api_key = st.secrets.get("OPENAI_API_KEY")
+# API-Key (wird in app.py bereits aus secrets geladen); ein Gateway/Router pro Prozess
+OPENAI_API_KEY = st.secrets.get("OPENAI_API_KEY")
 
 def zeige_streamlit_chatbot():
     if "messages" not in st.session_state:
@@ -48,21 +49,18 @@ def zeige_streamlit_chatbot():
             st.session_state.messages.append({"role": "user", "content": cleaned})
 
             if st.session_state.stage == "chat":
-                response = openai.chat.completions.create(
-                    model="gpt-4o",
-                    messages=st.session_state.messages
-                )
+                try:
+                    response = llm_router(OPENAI_API_KEY).chat(st.session_state.messages, EXTRAKTION)
+                except LLMNichtVerfuegbar:
+                    st.error("❌ Der Sprachassistent ist gerade nicht erreichbar. Bitte versuche es in einer Minute nochmals.")
+                    st.stop()
                 reply = response.choices[0].message.content.strip()
                 st.session_state.messages.append({"role": "assistant", "content": reply})
 
-                match = re.search(r'\{.*\}', reply, re.DOTALL)
-                if match:
-                    try:
-                        parsed = json.loads(match.group(0))
-                        st.session_state.reiseinfos = parsed
-                        st.session_state.stage = "stop_lookup"
-                    except json.JSONDecodeError:
-                        pass
+                parsed = reiseinfos_aus_antwort(reply)
+                if parsed is not None:
+                    st.session_state.reiseinfos = parsed
+                    st.session_state.stage = "stop_lookup"
             else:
                 st.session_state.messages.append({
                     "role": "assistant",
@@ -71,25 +69,7 @@ def zeige_streamlit_chatbot():
 
     if st.session_state.stage == "stop_lookup":
         reiseinfos = st.session_state.reiseinfos
-        heute = datetime.now()
-        user_hat_jahr = bool(re.search(r'\b\d{4}\b', st.session_state.user_input))
-        try:
-            dt = datetime.strptime(reiseinfos["datum"], "%Y-%m-%d")
-            if dt.year != heute.year and not user_hat_jahr:
-                dt = dt.replace(year=heute.year)
-            reiseinfos["datum"] = dt.strftime("%Y-%m-%d")
-        except ValueError:
-            reiseinfos["datum"] = heute.strftime("%Y-%m-%d")
-
-        uhr_raw = reiseinfos.get("uhrzeit", "08:00:00")
-        m = re.match(r"^(\d{1,2}):?(\d{2})?:?(\d{2})?$", uhr_raw)
-        if m:
-            std  = m.group(1).zfill(2)
-            minu = m.group(2) or "00"
-            sek  = m.group(3) or "00"
-            reiseinfos["uhrzeit"] = f"{std}:{minu}:{sek}"
-        else:
-            reiseinfos["uhrzeit"] = "08:00:00"
+        normalisiere_reiseinfos(reiseinfos, st.session_state.user_input)
 
         start_candidates = stop_place_lookup(reiseinfos["start"])
         ziel_candidates  = stop_place_lookup(reiseinfos["ziel"])
@@ -1,16 +1,19 @@
 # streamlit_karte.py
 
-import math
 import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
 import pydeck as pdk
+import requests
 import streamlit as st
 import streamlit.components.v1 as components
+from ojp_client import OJPFehler
+from oev_core.karte import (
+    kartenansicht, leg_tracks_aus_trip_xml, pfad_aus_trip_xml, pfade_aus_trip_xml, trip_schluessel,
+)
+from poi_index import PoiIndex
+from rate_limiter import QuotaErschoepft
 
-# Namespaces definieren
-namespaces = {
-    "siri": "http://www.siri.org.uk/siri",
-    "ojp": "http://www.vdv.de/ojp"
-}
 
 def parse_xml_and_extract_path_from_string(xml_text: str):
     """
@@ -19,140 +22,119 @@ def parse_xml_and_extract_path_from_string(xml_text: str):
     Routenverlauf bilden.
     """
     try:
-        root = ET.fromstring(xml_text)
+        return pfad_aus_trip_xml(xml_text)
     except ET.ParseError as e:
         st.error(f"Fehler beim Parsen des XML-Strings: {e}")
         return []
 
-    # 1) Alle <ojp:Location> mit <ojp:StopPoint> sammeln → Mapping StopPointRef → (lon, lat)
-    stoppoint_to_coords = {}
-    for loc in root.findall(".//ojp:Location", namespaces):
-        sp = loc.find("ojp:StopPoint", namespaces)
-        if sp is not None:
-            ref_elem = sp.find("siri:StopPointRef", namespaces)
-            if ref_elem is not None and ref_elem.text:
-                sp_ref = ref_elem.text.strip()
-                geo = loc.find("ojp:GeoPosition", namespaces)
-                if geo is not None:
-                    lon_elem = geo.find("siri:Longitude", namespaces)
-                    lat_elem = geo.find("siri:Latitude", namespaces)
-                    if lon_elem is not None and lat_elem is not None:
-                        try:
-                            lon = float(lon_elem.text)
-                            lat = float(lat_elem.text)
-                            stoppoint_to_coords[sp_ref] = (lon, lat)
-                        except (ValueError, TypeError):
-                            # Ungültige Koordinaten ignorieren
-                            pass
-
-    # 2) Erstes <ojp:TripResult> auswählen
-    first_trip = root.find(".//ojp:TripResult", namespaces)
-    if first_trip is None:
-        return []
 
-    trip = first_trip.find("ojp:Trip", namespaces)
-    if trip is None:
-        return []
+# Farben der Verbindungen: zuerst die schnellste, dann die Alternativen (zyklisch)
+FARBEN = [
+    [220, 20, 60], [30, 110, 200], [240, 150, 0],
+    [40, 160, 80], [150, 60, 180], [0, 150, 160],
+]
+
 
-    # 3) StopPointRefs in Reihenfolge der TripLegs sammeln
-    sequence_of_refs = []
-    for leg in trip.findall("ojp:TripLeg", namespaces):
-        # TimedLeg → Boarding + Alighting
-        timed = leg.find("ojp:TimedLeg", namespaces)
-        if timed is not None:
-            board_ref_elem = timed.find("ojp:LegBoard/siri:StopPointRef", namespaces)
-            if board_ref_elem is not None and board_ref_elem.text:
-                sequence_of_refs.append(board_ref_elem.text.strip())
-            alight_ref_elem = timed.find("ojp:LegAlight/siri:StopPointRef", namespaces)
-            if alight_ref_elem is not None and alight_ref_elem.text:
-                sequence_of_refs.append(alight_ref_elem.text.strip())
-
-        # TransferLeg → Fußweg Start + Ende
-        transfer = leg.find("ojp:TransferLeg", namespaces)
-        if transfer is not None:
-            start_ref_elem = transfer.find("ojp:LegStart/siri:StopPointRef", namespaces)
-            if start_ref_elem is not None and start_ref_elem.text:
-                sequence_of_refs.append(start_ref_elem.text.strip())
-            end_ref_elem = transfer.find("ojp:LegEnd/siri:StopPointRef", namespaces)
-            if end_ref_elem is not None and end_ref_elem.text:
-                sequence_of_refs.append(end_ref_elem.text.strip())
-
-    # 4) Referenzen → Koordinatenliste
-    path_coords = []
-    for ref in sequence_of_refs:
-        coords = stoppoint_to_coords.get(ref)
-        if coords:
-            path_coords.append([coords[0], coords[1]])
-
-    # 5) Doppelte Punkte (hintereinander) entfernen
-    deduped = []
-    prev = None
-    for pt in path_coords:
-        if pt != prev:
-            deduped.append(pt)
-        prev = pt
-
-    return deduped
-
-
-def show_reiseweg(xml_text: str = None):
+@st.cache_data(max_entries=64, show_spinner=False)
+def karten_daten(trip_hash: str, _xml_text: str, genau: bool = False, _leg_tracks: dict = None) -> dict:
     """
-    Zeigt in Streamlit die pydeck-Karte mit dem Reiseweg an.
-    Erwartet den OJP-XML-String als Parameter. Wird kein XML-String übergeben,
-    versucht es fallback-weise, 'response.xml' einzulesen (Legacy).
+    Pfade aller Verbindungen, Mittelpunkt und Zoom einmal pro Trip berechnen (ein Parse).
+    Schlüssel ist nur `trip_hash` und `genau` (siehe oev_core.karte.trip_schluessel) – XML-Text
+    und Leg-Geometrien selbst werden nicht gehasht. Gibt {"fehler": ...} zurück statt st.error
+    aufzurufen, damit der Cache nichts rendert.
     """
-    # Wenn xml_text nicht übergeben wurde, versuchen, aus Datei zu laden (fallback)
-    if xml_text is None:
-        XML_FILE = "response.xml"
+    try:
+        pfade = pfade_aus_trip_xml(_xml_text, _leg_tracks if genau else None)
+    except ET.ParseError as e:
+        return {"fehler": f"Fehler beim Parsen des XML-Strings: {e}"}
+
+    trips = []
+    for i, t in enumerate(pfade):
+        if not t["pfad"]:
+            continue
+        stunden, rest = divmod(int(t["dauer"].total_seconds()) // 60, 60)
+        trips.append({
+            "path":  t["pfad"],
+            "name":  "Schnellste Verbindung" if i == 0 else f"Alternative {i}",
+            "dauer": f"{stunden}h {rest}min",
+            "color": FARBEN[i % len(FARBEN)],
+        })
+    if not trips:
+        return {"fehler": "Keine Route/Koordinaten gefunden. Die Karte bleibt leer."}
+
+    alle_punkte = np.concatenate([np.asarray(t["path"], dtype=float) for t in trips])
+    return {"trips": trips, "ansicht": kartenansicht(alle_punkte)}
+
+
+def _leg_tracks(trip_hash: str, projektion) -> dict:
+    """
+    Streckengeometrien pro Leg (Encoded Polylines) aus st.session_state; für einen neuen
+    Trip wird die Antwort mit Leg-Projektion einmal geladen und vereinfacht.
+    Gibt None zurück, wenn das Laden fehlschlägt (Karte bleibt bei geraden Linien).
+    """
+    tracks = st.session_state.setdefault("leg_tracks", {})
+    geladen = st.session_state.setdefault("leg_tracks_trips", set())
+    if trip_hash not in geladen:
         try:
-            tree = ET.parse(XML_FILE)
-            root = tree.getroot()
-            xml_text = ET.tostring(root, encoding="utf-8").decode("utf-8")
-        except (FileNotFoundError, ET.ParseError) as e:
-            st.error(f"Fehler beim Einlesen von '{XML_FILE}': {e}")
-            return
+            with st.spinner("Lade Streckenverlauf …"):
+                tracks.update(leg_tracks_aus_trip_xml(projektion()))
+        except (requests.HTTPError, QuotaErschoepft, OJPFehler):
+            st.warning("Streckenverlauf gerade nicht verfügbar – zeige direkte Verbindungslinien.")
+            return None
+        geladen.add(trip_hash)
+    return tracks
 
-    path = parse_xml_and_extract_path_from_string(xml_text)
 
-    if not path:
-        st.error("Keine Route/Koordinaten gefunden. Die Karte bleibt leer.")
+@st.fragment
+def _karte(xml_text, trip_hash: str, projektion=None):
+    """
+    Zeichnet die Karte. Als Fragment läuft beim Umschalten der Hervorhebung oder der
+    Streckenführung nur dieser Teil neu – nicht das ganze Skript (kein neuer LLM-Aufruf
+    in der done-Stage).
+    """
+    genau = projektion is not None and st.toggle("Genaue Streckenführung", key="karte_genau")
+    tracks = _leg_tracks(trip_hash, projektion) if genau else None
+    daten = karten_daten(trip_hash, xml_text, tracks is not None, tracks)
+    if "fehler" in daten:
+        st.error(daten["fehler"])
         return
 
-    # Min/Max für Bounding-Box
-    lons = [pt[0] for pt in path]
-    lats = [pt[1] for pt in path]
-    lon_min, lon_max = min(lons), max(lons)
-    lat_min, lat_max = min(lats), max(lats)
-
-    # Mittelpunkt berechnen
-    center_lon = (lon_min + lon_max) / 2
-    center_lat = (lat_min + lat_max) / 2
-
-    # Zoom-Level approximativ berechnen, um die gesamte Strecke sehen zu können
-    lon_span = lon_max - lon_min
-    lat_span = lat_max - lat_min
-
-    if lon_span == 0 or lat_span == 0:
-        zoom_level = 12
-    else:
-        zoom_lon = math.log2(360.0 / lon_span)
-        zoom_lat = math.log2(180.0 / lat_span)
-        zoom_level = min(zoom_lon, zoom_lat) - 1
-        zoom_level = max(5, min(zoom_level, 14))
-
-    # PathLayer: dicke, rote Linie
+    trips = daten["trips"]
+    auswahl = 0
+    if len(trips) > 1:
+        auswahl = st.radio(
+            "Verbindung hervorheben",
+            range(len(trips)),
+            format_func=lambda i: f"{trips[i]['name']} ({trips[i]['dauer']})",
+            horizontal=True,
+            key="karte_hervorheben",
+        )
+    gewaehlt = trips[auswahl]
+
+    # Alle Verbindungen in einem PathLayer: jeder Pfad wird genau einmal übertragen
+    alle_layer = pdk.Layer(
+        "PathLayer",
+        data=trips,
+        get_path="path",
+        get_width=120,
+        get_color="color",
+        opacity=0.35,
+        pickable=True,
+    )
+
+    # Hervorgehobene Verbindung: dicke Linie in ihrer Farbe darüber
     path_layer = pdk.Layer(
         "PathLayer",
-        data=[{"path": path}],
+        data=[gewaehlt],
         get_path="path",
         get_width=300,
-        get_color=[220, 20, 60],
+        get_color="color",
         opacity=1.0,
     )
 
     # ScatterplotLayer: Start-/Endpunkt als Pixel-Kreise
-    start_point = {"position": path[0], "color": [0, 128, 0], "radius": 5}
-    end_point   = {"position": path[-1], "color": [0, 0, 255], "radius": 5}
+    start_point = {"position": gewaehlt["path"][0], "color": [0, 128, 0], "radius": 5}
+    end_point   = {"position": gewaehlt["path"][-1], "color": [0, 0, 255], "radius": 5}
 
     scatter_layer = pdk.Layer(
         "ScatterplotLayer",
@@ -164,22 +146,73 @@ def show_reiseweg(xml_text: str = None):
         pickable=False,
     )
 
-    view_state = pdk.ViewState(
-        latitude=center_lat,
-        longitude=center_lon,
-        zoom=zoom_level,
-        pitch=0,
-    )
+    view_state = pdk.ViewState(pitch=0, **daten["ansicht"])
 
     deck = pdk.Deck(
-        layers=[path_layer, scatter_layer],
+        layers=[alle_layer, path_layer, scatter_layer],
         initial_view_state=view_state,
         map_style="mapbox://styles/mapbox/light-v10",
+        tooltip={"text": "{name} ({dauer})"},
     )
 
     st.pydeck_chart(deck)
 
 
+def show_reiseweg(xml_text: str = None, trip_hash: str = None, projektion=None):
+    """
+    Zeigt in Streamlit die pydeck-Karte mit allen Verbindungen an; eine davon
+    (standardmässig die schnellste) ist hervorgehoben und per Auswahl umschaltbar.
+    Erwartet den OJP-XML-String als Parameter. Wird kein XML-String übergeben,
+    versucht es fallback-weise, 'response.xml' einzulesen (Legacy).
+    `trip_hash` (einmal pro Trip berechnet) spart das Hashen des XML bei jedem Rerun.
+    `projektion` (ohne Argumente aufrufbar, liefert dieselbe Antwort mit Leg-Projektion)
+    schaltet die Option "Genaue Streckenführung" frei.
+    """
+    # Wenn xml_text nicht übergeben wurde, versuchen, aus Datei zu laden (fallback)
+    if xml_text is None:
+        XML_FILE = "response.xml"
+        try:
+            with open(XML_FILE, "rb") as f:
+                xml_text = f.read()
+        except FileNotFoundError as e:
+            st.error(f"Fehler beim Einlesen von '{XML_FILE}': {e}")
+            return
+
+    _karte(xml_text, trip_hash or trip_schluessel(xml_text), projektion)
+
+
+@st.cache_resource(ttl=60 * 60, show_spinner=False)
+def poi_index() -> PoiIndex:
+    """Gitter-Index über den lokalen POI-Cache (OSM-Extrakt, siehe poi_index.py), stündlich neu."""
+    return PoiIndex.aus_sqlite()
+
+
+def show_shops_an_haltestellen(xml_text, trip_hash: str = None, radius_m: float = 300):
+    """
+    Shops im Umkreis `radius_m` um jede Haltestelle der schnellsten Verbindung, alle
+    Haltestellen in einer Abfrage. Nutzt die schon für die Karte geparsten Koordinaten
+    (karten_daten, gleicher Cache-Eintrag). Ohne importierten POI-Extrakt erscheint nichts.
+    """
+    index = poi_index()
+    if not len(index):
+        return
+    daten = karten_daten(trip_hash or trip_schluessel(xml_text), xml_text)
+    if "fehler" in daten:
+        return
+    haltestellen = daten["trips"][0]["path"]
+    halt, poi, distanz = index.umkreis(haltestellen, radius_m)
+
+    with st.expander(f"🛍️ Einkaufen in der Nähe der Haltestellen ({len(poi)} im Umkreis von {radius_m:.0f} m)"):
+        if not len(poi):
+            st.info("Keine Einkaufsmöglichkeiten in der Nähe der Haltestellen gefunden.")
+            return
+        st.dataframe(pd.DataFrame({
+            "Halt": halt + 1,
+            "Name": index.namen[poi],
+            "Typ": index.typen[poi],
+            "Distanz (m)": distanz.round().astype(int),
+        }), hide_index=True)
+
 
 if __name__ == "__main__":
     # Beispiel: Wenn man streamlit_karte.py direkt ausführt, kann man die Datei 'response.xml' anzeigen lassen
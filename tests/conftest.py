@@ -0,0 +1,61 @@
+# tests/conftest.py
+
+import re
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import pytest
+
+import ojp_client
+from trip_cache import TripCache
+
+DATUM = "2025-06-02"
+
+
+class _Antwort:
+    def __init__(self, xml_text: str):
+        self.content = xml_text.encode("utf-8")
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+
+def _trip_xml(abfahrten):
+    results = "".join(f"""
+      <ojp:TripResult><ojp:Trip>
+        <ojp:StartTime>{DATUM}T{zeit}Z</ojp:StartTime><ojp:EndTime>{DATUM}T{zeit}Z</ojp:EndTime>
+        <ojp:TripLeg><ojp:TimedLeg><ojp:Service>
+          <ojp:OperatingDayRef>{DATUM}</ojp:OperatingDayRef><ojp:JourneyRef>{ref}</ojp:JourneyRef>
+        </ojp:Service></ojp:TimedLeg></ojp:TripLeg>
+      </ojp:Trip></ojp:TripResult>""" for zeit, ref in abfahrten)
+    return f"""<OJP xmlns="http://www.siri.org.uk/siri" xmlns:ojp="http://www.vdv.de/ojp">
+  <OJPResponse><ServiceDelivery><ojp:OJPTripDelivery>{results}
+  </ojp:OJPTripDelivery></ServiceDelivery></OJPResponse></OJP>"""
+
+
+def _journeys(xml_text):
+    root = ET.fromstring(xml_text)
+    return [j.text for j in root.iter(f"{{{ojp_client.ns['ojp']}}}JourneyRef")]
+
+
+@pytest.fixture
+def fahrplan(monkeypatch):
+    """
+    Fake-OJP hinter ojp_client.trip_request: pro Anfrage die nächsten `anzahl` Trips ab bzw.
+    (Ankunft) bis DepArrTime aus `abfahrten` [(HH:MM:SS, JourneyRef)]. Leere Caches pro Test.
+    """
+    plan = SimpleNamespace(abfahrten=[], anfragen=[], journeys=_journeys, antwort=_Antwort)
+
+    def trip_request(xml_body, api_key):
+        ab = re.search(r"<ojp:DepArrTime>\d{4}-\d{2}-\d{2}T([\d:]+)Z", xml_body).group(1)
+        anzahl = int(re.search(r"<ojp:NumberOfResults>(\d+)<", xml_body).group(1))
+        plan.anfragen.append(ab)
+        if "kein DepArrTime beim Origin" in xml_body:
+            return _Antwort(_trip_xml([a for a in plan.abfahrten if a[0] <= ab][-anzahl:]))
+        return _Antwort(_trip_xml([a for a in plan.abfahrten if a[0] >= ab][:anzahl]))
+
+    monkeypatch.setattr(ojp_client, "trip_request", trip_request)
+    monkeypatch.setattr(ojp_client, "trip_cache", TripCache())
+    ojp_client._seiten_cache.clear()
+    return plan
@@ -0,0 +1,44 @@
+# tests/test_api_service.py
+
+import pytest
+
+from api_service import Fehler, _pruefe_reise, _span_name, _verlauf
+
+GUELTIG = {"start": "Luzern", "ziel": "Zürich HB", "datum": "2025-06-02", "uhrzeit": "14:00"}
+
+
+def _scope(pfad, methode="GET"):
+    return {"type": "http", "method": methode, "path": pfad, "root_path": "", "headers": []}
+
+
+def test_gueltige_reise_geht_durch():
+    _pruefe_reise(dict(GUELTIG, uhrzeit_bis="24:00", typ="ankunft"))
+
+
+@pytest.mark.parametrize("feld, wert", [
+    ("uhrzeit", "25:99"), ("uhrzeit", 8), ("uhrzeit_bis", "99"), ("datum", "garbage"),
+    ("datum", 20250602), ("datum", "2025-02-30"), ("typ", "umsteigen"), ("start", ["Luzern"]),
+])
+def test_ungueltiges_feld_ergibt_400(feld, wert):
+    with pytest.raises(Fehler) as e:
+        _pruefe_reise(dict(GUELTIG, **{feld: wert}))
+    assert e.value.status == 400
+    assert f"'{feld}'" in e.value.meldung
+
+
+@pytest.mark.parametrize("messages", [["x"], [{"role": "user"}], [{"role": 1, "content": "x"}], [], "x"])
+def test_ungueltiger_verlauf_ergibt_400(messages):
+    with pytest.raises(Fehler) as e:
+        _verlauf({"messages": messages})
+    assert e.value.status == 400
+
+
+def test_verlauf_ohne_fremde_rollen():
+    verlauf = _verlauf({"messages": [{"role": "system", "content": "x"}, {"role": "user", "content": "Luzern"}]})
+    assert verlauf == [{"role": "user", "content": "Luzern"}]
+
+
+def test_span_nach_routen_vorlage():
+    assert _span_name(_scope("/v1/trips", "POST")) == "api./v1/trips"
+    assert _span_name(_scope("/v1/trips")) == "api./v1/trips"          # falsche Methode → 405, gleiche Serie
+    assert _span_name(_scope("/wp-admin/../x?y")) == "api.unbekannt"
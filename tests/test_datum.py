@@ -0,0 +1,28 @@
+# tests/test_datum.py
+
+import pytest
+
+from oev_core.datum import normalisiere_uhrzeit
+
+
+@pytest.mark.parametrize("roh, erwartet", [
+    ("8", "08:00:00"),
+    ("830", "08:30:00"),
+    ("8:30", "08:30:00"),
+    ("14:05:07", "14:05:07"),
+    ("0", "00:00:00"),
+])
+def test_uhrzeit_gueltig(roh, erwartet):
+    assert normalisiere_uhrzeit(roh) == erwartet
+
+
+@pytest.mark.parametrize("roh", ["24", "24:00", "24:00:00"])
+def test_uhrzeit_24_uhr_ist_ende_des_tages(roh):
+    # "zwischen 22 und 24 Uhr": das LLM liefert uhrzeit_bis = 24:00:00
+    assert normalisiere_uhrzeit(roh) == "23:59:59"
+
+
+@pytest.mark.parametrize("roh", ["25:99", "23:60", "24:01", "12:00:60", "abc", "", None])
+def test_uhrzeit_ungueltig_gibt_standard(roh):
+    assert normalisiere_uhrzeit(roh) == "08:00:00"
+    assert normalisiere_uhrzeit(roh, standard=None) is None
@@ -0,0 +1,33 @@
+# tests/test_fenster_suche.py
+
+import pytest
+
+import ojp_client
+from ojp_client import OJPFehler, trip_fenster_suche
+
+DATUM = "2025-06-02"
+
+
+def test_gleiche_minute_ueber_seitengrenze(fahrplan):
+    fahrplan.abfahrten += [("08:00:00", "a"), ("08:10:00", "b"), ("08:10:00", "c"),
+                           ("08:15:00", "d"), ("08:30:00", "e")]
+    xml_text = trip_fenster_suche("1", "A", "2", "B", DATUM, "08:00:00", "08:20:00", "key", anzahl=2)
+    # "c" fährt in derselben Minute wie die letzte Abfahrt der ersten Seite
+    assert fahrplan.journeys(xml_text) == ["a", "b", "c", "d"]
+    assert fahrplan.anfragen == ["08:00:00", "08:10:00", "08:11:00"]
+
+
+def test_ankunft_blaettert_rueckwaerts(fahrplan):
+    fahrplan.abfahrten += [("08:00:00", "a"), ("08:10:00", "b")]
+    xml_text = trip_fenster_suche("1", "A", "2", "B", DATUM, "07:00:00", "09:00:00", "key",
+                                  typ="ankunft", anzahl=5)
+    assert fahrplan.journeys(xml_text) == ["a", "b"]
+
+
+def test_fehlerantwort_ohne_trip_delivery(fahrplan, monkeypatch):
+    fehler = """<OJP xmlns="http://www.siri.org.uk/siri"><OJPResponse><ServiceDelivery>
+      <ErrorCondition><Description>TRIP_NOTRIPFOUND</Description></ErrorCondition>
+    </ServiceDelivery></OJPResponse></OJP>"""
+    monkeypatch.setattr(ojp_client, "trip_request", lambda xml_body, api_key: fahrplan.antwort(fehler))
+    with pytest.raises(OJPFehler, match="TRIP_NOTRIPFOUND"):
+        trip_fenster_suche("1", "A", "2", "B", DATUM, "08:00:00", "09:00:00", "key")
@@ -0,0 +1,94 @@
+# tests/test_geocoding.py
+
+import sqlite3
+
+import pytest
+
+import geocoding
+import rate_limiter
+from geocoding import Geocoder, LokalBackend, normalisiere_adresse, profile_geocodieren
+
+BERN = (46.94883, 7.43913)
+
+
+class ZaehlendesBackend(LokalBackend):
+    """LokalBackend, das Aufrufe und die Priorität des Aufrufers mitschreibt."""
+
+    def __init__(self, fehler=None):
+        super().__init__()
+        self.aufrufe = []
+        self.fehler = fehler
+
+    def geocode(self, adresse):
+        self.aufrufe.append((adresse, rate_limiter._prioritaet.get()))
+        if self.fehler:
+            raise self.fehler
+        return super().geocode(adresse)
+
+
+@pytest.fixture
+def pfad(tmp_path):
+    return str(tmp_path / "geocoding.sqlite")
+
+
+def test_normalisierung():
+    assert normalisiere_adresse("Musterstr. 1 ,3000  Bern") == "musterstrasse 1, 3000 bern"
+    assert normalisiere_adresse("  Große Str.5;; Basel ") == "grosse strasse5, basel"
+
+
+def test_wiederholte_adresse_ohne_zweiten_backend_aufruf(pfad):
+    backend = ZaehlendesBackend()
+    geocoder = Geocoder(backend, pfad)
+    assert geocoder.koordinaten("Bahnhofplatz 1, 3011 Bern") == BERN
+    assert geocoder.koordinaten("bahnhofplatz 1 ,3011  BERN") == BERN
+    assert len(backend.aufrufe) == 1
+    # Dauerhaft: ein neuer Geocoder (z. B. nächster Prozess) auf derselben Datei fragt nicht nochmals
+    neu = ZaehlendesBackend()
+    assert Geocoder(neu, pfad).koordinaten("Bahnhofplatz 1, 3011 Bern") == BERN
+    assert neu.aufrufe == []
+
+
+def test_nicht_gefunden_nur_einen_tag(pfad, monkeypatch):
+    backend = ZaehlendesBackend()
+    geocoder = Geocoder(backend, pfad)
+    assert geocoder.koordinaten("Gibtsnicht 9, 9999 Nirgends") == (None, None)
+    assert geocoder.koordinaten("Gibtsnicht 9, 9999 Nirgends") == (None, None)
+    assert len(backend.aufrufe) == 1
+    monkeypatch.setattr(geocoding, "NEGATIV_TTL_S", -1)
+    geocoder.koordinaten("Gibtsnicht 9, 9999 Nirgends")
+    assert len(backend.aufrufe) == 2
+
+
+def test_backend_fehler_wird_nicht_gecacht(pfad):
+    geocoder = Geocoder(ZaehlendesBackend(fehler=TimeoutError()), pfad)
+    assert geocoder.koordinaten("Luzern") == (None, None)
+    assert geocoder.statistik()["eintraege"] == 0
+
+
+def test_batch_jede_adresse_einmal_mit_batch_prioritaet(pfad):
+    backend = ZaehlendesBackend()
+    adressen = ["Luzern", "Bern", "luzern ", "Gibtsnicht"]
+    fortschritt = []
+    ergebnis = Geocoder(backend, pfad).batch(adressen, lambda i, n: fortschritt.append((i, n)))
+    assert ergebnis["Luzern"] == ergebnis["luzern "] == (47.05017, 8.31018)
+    assert ergebnis["Gibtsnicht"] == (None, None)
+    assert [a for a, _ in backend.aufrufe] == ["Luzern", "Bern", "Gibtsnicht"]
+    assert {p for _, p in backend.aufrufe} == {rate_limiter.BATCH}
+    assert fortschritt == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_profile_geocodieren(pfad, tmp_path):
+    db = str(tmp_path / "user_data.db")
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE Nutzerprofil (id INTEGER PRIMARY KEY, name TEXT, adresse TEXT)")
+    conn.executemany("INSERT INTO Nutzerprofil (name, adresse) VALUES (?, ?)",
+                     [("A", "Bern"), ("B", "Gibtsnicht"), ("C", None)])
+    conn.commit()
+    conn.close()
+
+    geocoder = Geocoder(ZaehlendesBackend(), pfad)
+    assert profile_geocodieren(db, geocoder) == 1
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT adresse_lat, adresse_lon FROM Nutzerprofil ORDER BY id").fetchall() == [
+        (46.94809, 7.44744), (None, None), (None, None)]
+    conn.close()
@@ -0,0 +1,75 @@
+# tests/test_geometrie.py
+
+import numpy as np
+import pytest
+
+from oev_core.geometrie import (
+    bbox, decode_polyline, douglas_peucker, eindeutige_indizes, encode_polyline, zoom_fuer_bbox,
+)
+from oev_core.karte import kartenansicht
+
+
+def test_polyline_google_beispiel():
+    punkte = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    assert encode_polyline(punkte) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@") == punkte
+
+
+def test_polyline_hin_und_zurueck_auf_1e5():
+    rng = np.random.default_rng(0)
+    punkte = np.column_stack((rng.uniform(5.9, 10.5, 500), rng.uniform(45.8, 47.8, 500)))
+    zurueck = np.asarray(decode_polyline(encode_polyline(punkte)))
+    assert zurueck.shape == punkte.shape
+    assert np.abs(zurueck - punkte).max() <= 0.5e-5 + 1e-12
+
+
+def test_polyline_leer():
+    assert encode_polyline([]) == ""
+    assert decode_polyline("") == []
+
+
+def test_douglas_peucker_behaelt_endpunkte_und_verwirft_kollineare():
+    linie = [[8.30 + i * 0.001, 47.05] for i in range(11)]
+    assert douglas_peucker(linie) == [linie[0], linie[-1]]
+
+
+def test_douglas_peucker_behaelt_abweichung_ueber_toleranz():
+    # Spitze ~111 m neben der Sehne; danach liegen die Nachbarn ~55 m neben ihren Teilsehnen
+    linie = [[8.30, 47.05], [8.305, 47.05], [8.31, 47.051], [8.315, 47.05], [8.32, 47.05]]
+    assert douglas_peucker(linie, toleranz_m=10) == linie
+    assert douglas_peucker(linie, toleranz_m=60) == [linie[0], linie[2], linie[-1]]
+    assert douglas_peucker(linie, toleranz_m=500) == [linie[0], linie[-1]]
+
+
+def test_douglas_peucker_kurze_linien_unveraendert():
+    assert douglas_peucker([[8.3, 47.0], [8.4, 47.1]]) == [[8.3, 47.0], [8.4, 47.1]]
+    assert douglas_peucker([]) == []
+
+
+def test_eindeutige_indizes_erste_vorkommen_in_reihenfolge():
+    punkte = [[8.3, 47.05], [8.54, 47.37], [8.3, 47.05], [8.3000000001, 47.05], [-8.3, -47.05]]
+    assert eindeutige_indizes(punkte).tolist() == [0, 1, 4]
+    assert eindeutige_indizes([]).tolist() == []
+
+
+def test_zoom_ganze_schweiz_und_obergrenze():
+    schweiz = bbox([[5.96, 45.82], [10.49, 47.81]])
+    assert 5 <= zoom_fuer_bbox(schweiz) < 8
+    assert zoom_fuer_bbox(bbox([[8.3, 47.05], [8.3001, 47.0501]])) == 14
+
+
+def test_zoom_einzelner_punkt():
+    assert zoom_fuer_bbox(bbox([[8.3, 47.05]])) == 12
+    assert kartenansicht([[8.3, 47.05]] * 3) == {"longitude": 8.3, "latitude": 47.05, "zoom": 12}
+
+
+def test_zoom_linie_ohne_breite():
+    # Nord-Süd-Linie über ~2 Grad: der Zoom folgt der Breite, nicht punkt_zoom
+    assert zoom_fuer_bbox(bbox([[8.3, 46.0], [8.3, 48.0]])) == pytest.approx(np.log2(90) - 1)
+
+
+def test_leere_eingabe():
+    with pytest.raises(ValueError):
+        bbox([])
+    with pytest.raises(ValueError):
+        kartenansicht(np.empty((0, 2)))
@@ -0,0 +1,51 @@
+# tests/test_llm_cache.py
+
+import time
+
+import pytest
+
+from llm_cache import LLMAntwortCache, prompt_schluessel
+from llm_gateway import FakeLLM, LLMGateway
+
+MESSAGES = [{"role": "system", "content": "Du bist ein Reiseplaner."}, {"role": "user", "content": "Hallo"}]
+
+
+def test_schluessel_enthaelt_modell_nachrichten_und_parameter():
+    basis = prompt_schluessel("gpt-4o", MESSAGES)
+    assert prompt_schluessel("gpt-4o-mini", MESSAGES) != basis
+    assert prompt_schluessel("gpt-4o", MESSAGES[:1] + [{"role": "user", "content": "Hallo!"}]) != basis
+    assert prompt_schluessel("gpt-4o", MESSAGES[:1] + [{"role": "assistant", "content": "Hallo"}]) != basis
+    assert prompt_schluessel("gpt-4o", MESSAGES, max_tokens=10) != basis
+    # Leerzeichen am Rand und Reihenfolge der Parameter zählen nicht
+    assert prompt_schluessel("gpt-4o", MESSAGES[:1] + [{"role": "user", "content": " Hallo\n"}]) == basis
+    assert (prompt_schluessel("gpt-4o", MESSAGES, a=1, b=2) == prompt_schluessel("gpt-4o", MESSAGES, b=2, a=1))
+
+
+@pytest.mark.parametrize("sqlite", [False, True])
+def test_ttl_ablauf_entfernt(tmp_path, sqlite):
+    cache = LLMAntwortCache(sqlite_pfad=str(tmp_path / "llm.sqlite") if sqlite else None)
+    cache.put("k", "Antwort", ttl_s=0.05)
+    assert cache.get("k") == "Antwort"
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.statistik()["eintraege"] == 0
+
+
+def test_lru_obergrenze():
+    cache = LLMAntwortCache(max_eintraege=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key, ttl_s=60)
+    assert cache.get("a") is None
+    assert cache.get("c") == "c"
+
+
+def test_nur_deterministische_aufrufe_gecacht():
+    fake = FakeLLM()
+    gateway = LLMGateway(client=fake, cache=LLMAntwortCache())
+    for _ in range(2):
+        gateway.text(MESSAGES, cache_ttl_s=60, temperature=0.7)
+    assert len(fake.aufrufe) == 2
+    for _ in range(2):
+        gateway.text(MESSAGES, cache_ttl_s=60, temperature=0)
+    assert len(fake.aufrufe) == 3
+    assert gateway.cache.statistik()["eintraege"] == 1
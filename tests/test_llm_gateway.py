@@ -0,0 +1,79 @@
+# tests/test_llm_gateway.py
+
+import threading
+
+import pytest
+
+from llm_cache import LLMAntwortCache
+from llm_gateway import FakeLLM, LLMGateway, LLMNichtVerfuegbar
+
+MESSAGES = [{"role": "system", "content": "Du bist ein Reiseplaner."}, {"role": "user", "content": "Hallo"}]
+
+
+def _gateway(fake, **kwargs):
+    gateway = LLMGateway(client=fake, modell="gross", fallback_modell="klein", cache=LLMAntwortCache(), **kwargs)
+    gateway._wartezeit = lambda versuch, fehler: 0.0     # Tests ohne Backoff-Pausen
+    return gateway
+
+
+def test_wiederholung_dann_erfolg():
+    fake = FakeLLM(fehler=[TimeoutError(), ConnectionError()])
+    gateway = _gateway(fake, versuche=3)
+    assert gateway.text(MESSAGES) == "OK"
+    assert [a["model"] for a in fake.aufrufe] == ["gross"] * 3
+    s = gateway.statistik()
+    assert (s["aufrufe"], s["wiederholungen"], s["fallbacks"], s["fehler"]) == (1, 2, 0, 0)
+
+
+def test_nach_allen_versuchen_fallback_modell():
+    fake = FakeLLM(fehler=[TimeoutError()] * 3)
+    gateway = _gateway(fake, versuche=3)
+    assert gateway.chat(MESSAGES).model == "klein"
+    assert [a["model"] for a in fake.aufrufe] == ["gross"] * 3 + ["klein"]
+    assert gateway.statistik()["fallbacks"] == 1
+    # Während der Abkühlzeit geht der nächste Aufruf gleich ans Fallback-Modell
+    assert gateway.chat(MESSAGES).model == "klein"
+    assert gateway.statistik()["fallback_aktiv"]
+
+
+def test_fallback_antwortet_auch_nicht():
+    gateway = _gateway(FakeLLM(fehler=[TimeoutError()] * 4), versuche=3)
+    with pytest.raises(LLMNichtVerfuegbar):
+        gateway.chat(MESSAGES)
+    assert gateway.statistik()["fehler"] == 1
+
+
+def test_nicht_wiederholbarer_fehler_geht_durch():
+    gateway = _gateway(FakeLLM(fehler=[ValueError("kaputt")]), versuche=3)
+    with pytest.raises(ValueError):
+        gateway.chat(MESSAGES)
+
+
+def test_gleichzeitige_identische_aufrufe_ein_upstream_aufruf():
+    fake = FakeLLM(latenz_s=0.2)
+    gateway = _gateway(fake)
+    start = threading.Barrier(8)
+    antworten = []
+
+    def aufruf():
+        start.wait()
+        antworten.append(gateway.text(MESSAGES, cache_ttl_s=60))
+
+    threads = [threading.Thread(target=aufruf) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert antworten == ["OK"] * 8
+    assert len(fake.aufrufe) == 1
+    assert gateway.statistik()["aufrufe"] == 1
+
+
+def test_zaehler_unter_last():
+    gateway = _gateway(FakeLLM())
+    threads = [threading.Thread(target=lambda: [gateway.chat(MESSAGES) for _ in range(50)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert gateway.statistik()["aufrufe"] == 400
@@ -0,0 +1,78 @@
+# tests/test_llm_router.py
+
+import math
+from types import SimpleNamespace
+
+from llm_cache import LLMAntwortCache
+from llm_gateway import FakeLLM, LLMGateway
+from llm_router import BESTAETIGUNG, DIALOG, EXTRAKTION, ModellRouter
+
+SLOTS_JSON = '{"start": "Luzern", "ziel": "Zürich HB", "datum": "2025-06-02", "uhrzeit": "14:00:00"}'
+
+
+class LogprobLLM(FakeLLM):
+    """FakeLLM mit festen Antworten und mittlerer Token-Wahrscheinlichkeit pro Modell."""
+
+    def __init__(self, antworten: dict, wahrscheinlichkeit: dict):
+        super().__init__()
+        self.antworten = antworten
+        self.wahrscheinlichkeit = wahrscheinlichkeit
+
+    def create(self, model, messages, **kwargs):
+        self.antwort = self.antworten[model]
+        response = super().create(model, messages, **kwargs)
+        if kwargs.get("logprobs"):
+            token = SimpleNamespace(logprob=math.log(self.wahrscheinlichkeit[model]))
+            response.choices[0].logprobs = SimpleNamespace(content=[token] * 5)
+        return response
+
+
+def _router(antworten, wahrscheinlichkeit=None):
+    fake = LogprobLLM(antworten, wahrscheinlichkeit or {"klein": 0.95, "gross": 0.95})
+    gateway = LLMGateway(client=fake, modell="gross", fallback_modell=None, cache=LLMAntwortCache())
+    return ModellRouter(gateway, klein="klein", min_konfidenz=0.75), fake
+
+
+def _verlauf(eingabe):
+    return [{"role": "system", "content": "Du bist ein Reiseplaner."}, {"role": "user", "content": eingabe}]
+
+
+def _modelle(fake):
+    return [a["model"] for a in fake.aufrufe]
+
+
+def test_sichere_antwort_des_kleinen_modells_bleibt():
+    router, fake = _router({"klein": SLOTS_JSON, "gross": "gross"})
+    assert router.text(_verlauf("Luzern nach Zürich HB morgen 14 Uhr"), EXTRAKTION) == SLOTS_JSON
+    assert _modelle(fake) == ["klein"]
+    assert router.statistik()[0]["eskalationen"] == 0
+
+
+def test_niedrige_konfidenz_eskaliert():
+    router, fake = _router({"klein": "Wohin möchtest du?", "gross": "Wohin soll es gehen?"},
+                           {"klein": 0.5, "gross": 0.95})
+    assert router.text(_verlauf("Ich will nach"), EXTRAKTION) == "Wohin soll es gehen?"
+    assert _modelle(fake) == ["klein", "gross"]
+    assert router.statistik()[0]["eskalationen"] == 1
+
+
+def test_kaputtes_slot_json_eskaliert():
+    for kaputt in ('{"start": "Luzern", "ziel": ', '{"start": "Luzern", "ziel": "Zürich HB"}'):
+        router, fake = _router({"klein": kaputt, "gross": SLOTS_JSON})
+        assert router.text(_verlauf("Luzern nach Zürich HB morgen 14 Uhr"), EXTRAKTION) == SLOTS_JSON
+        assert _modelle(fake) == ["klein", "gross"]
+
+
+def test_frage_in_bestaetigung_geht_an_den_dialog():
+    router, fake = _router({"klein": "Gern!", "gross": "Nimm den IR70 um 07:09."})
+    verlauf = _verlauf("Welchen Zug soll ich nehmen?")
+    assert router.route(BESTAETIGUNG, verlauf) == DIALOG
+    assert router.text(verlauf, BESTAETIGUNG) == "Nimm den IR70 um 07:09."
+    assert _modelle(fake) == ["gross"]
+    assert "logprobs" not in fake.aufrufe[0]
+
+
+def test_kurze_bestaetigung_bleibt_beim_kleinen_modell():
+    router, fake = _router({"klein": "Gute Reise!", "gross": "gross"})
+    assert router.text(_verlauf("Danke"), BESTAETIGUNG) == "Gute Reise!"
+    assert _modelle(fake) == ["klein"]
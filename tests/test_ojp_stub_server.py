@@ -0,0 +1,18 @@
+# tests/test_ojp_stub_server.py
+
+import xml.etree.ElementTree as ET
+
+from ojp_stub_server import FIXTURES_DIR, _lade_fixtures, location_antwort, ns
+
+
+def _namen(antwort: bytes):
+    return [t.text for t in ET.fromstring(antwort).findall('.//ojp:StopPlaceName/ojp:Text', ns)]
+
+
+def test_location_treffer():
+    assert _namen(location_antwort(_lade_fixtures(FIXTURES_DIR, 'location'), "zürich")) == [
+        "Zürich HB", "Zürich Flughafen"]
+
+
+def test_location_ohne_treffer_ist_leer():
+    assert _namen(location_antwort(_lade_fixtures(FIXTURES_DIR, 'location'), "Gibtsnicht")) == []
@@ -0,0 +1,99 @@
+# tests/test_poi_cache.py
+
+import threading
+import time
+
+import pytest
+
+from poi_cache import PoiKachelCache, kachel, kachel_bbox, kacheln_im_umkreis, quadkey, umkreis_bbox
+
+LUZERN = (8.31031, 47.04824)
+
+
+def _mitte(xy):
+    b = kachel_bbox(*xy)
+    return (b[0] + b[2]) / 2, (b[1] + b[3]) / 2
+
+
+def test_kachel_und_quadkey():
+    assert kachel(0.0, 0.0, 1) == (1, 1)
+    assert kachel(-180.0, 85.0, 1) == (0, 0)
+    assert kachel(179.9999, -89.9, 2) == (3, 3)              # Rand: in die letzte Kachel geklemmt
+    assert quadkey(3, 5, 3) == "213"                         # Beispiel aus der Bing-Maps-Doku
+    assert quadkey(*kachel(*LUZERN)).startswith(quadkey(*kachel(*LUZERN, zoom=10), zoom=10))
+
+
+def test_punkt_liegt_in_seiner_kachel():
+    lon_min, lat_min, lon_max, lat_max = kachel_bbox(*kachel(*LUZERN))
+    assert lon_min <= LUZERN[0] < lon_max and lat_min <= LUZERN[1] < lat_max
+
+
+def test_kacheln_im_umkreis():
+    assert kacheln_im_umkreis(*_mitte(kachel(*LUZERN)), 50) == [kachel(*LUZERN)]
+    kacheln = kacheln_im_umkreis(*LUZERN, 1000)
+    assert kachel(*LUZERN) in kacheln
+    xs, ys = {x for x, _ in kacheln}, {y for _, y in kacheln}
+    # Lückenloses Rechteck, ~2 km Box bei ~800 m Kacheln
+    assert len(kacheln) == len(xs) * len(ys) and 3 <= len(xs) <= 4 and 3 <= len(ys) <= 5
+    lon_min, lat_min, lon_max, lat_max = umkreis_bbox(*LUZERN, 1000)
+    for x, y in kacheln:
+        b = kachel_bbox(x, y)
+        assert b[0] < lon_max and b[2] > lon_min and b[1] < lat_max and b[3] > lat_min
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = PoiKachelCache(sqlite_pfad=str(tmp_path / "poi.sqlite"))
+    cache.abfragen = []
+
+    def overpass(box):
+        cache.abfragen.append(box)
+        time.sleep(getattr(cache, "latenz_s", 0))
+        return [
+            {"type": "node", "id": 1, "lat": LUZERN[1] + 0.001, "lon": LUZERN[0],
+             "tags": {"name": "Bäckerei", "shop": "bakery"}},
+            {"type": "way", "id": 2, "center": {"lat": LUZERN[1], "lon": LUZERN[0] + 0.0005},
+             "tags": {"shop": "kiosk"}},
+        ]
+
+    monkeypatch.setattr(cache, "_overpass", overpass)
+    return cache
+
+
+def test_zweite_abfrage_ohne_overpass(cache):
+    erste = cache.shops_im_umkreis(*LUZERN, 300)
+    assert [s["Name"] for s in erste] == ["Unbenannter Shop", "Bäckerei"]   # nach Distanz
+    assert len(cache.abfragen) == 1
+    assert cache.shops_im_umkreis(*LUZERN, 300) == erste
+    assert cache.shops_im_umkreis(*LUZERN, 50) == erste[:1]
+    assert len(cache.abfragen) == 1
+    assert cache.statistik()["kachel_geladen"] == len(kacheln_im_umkreis(*LUZERN, 300))
+
+
+def test_abgelaufene_kacheln_werden_neu_geladen(cache):
+    cache.ttl_s = 0
+    cache.shops_im_umkreis(*LUZERN, 300)
+    cache.shops_im_umkreis(*LUZERN, 300)
+    assert len(cache.abfragen) == 2
+
+
+def test_gleichzeitige_sessions_eine_abfrage(cache):
+    cache.latenz_s = 0.2
+    threads = [threading.Thread(target=cache.shops_im_umkreis, args=(*LUZERN, 300)) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert len(cache.abfragen) == 1
+
+
+def test_geladene_kacheln_warten_nicht_auf_fremde_abfrage(cache):
+    cache.shops_im_umkreis(*LUZERN, 300)
+    cache.latenz_s = 1.0
+    fremd = threading.Thread(target=cache.shops_im_umkreis, args=(8.5402, 47.3782, 300))   # Zürich HB
+    fremd.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    cache.shops_im_umkreis(*LUZERN, 300)
+    assert time.monotonic() - start < 0.5
+    fremd.join(5)
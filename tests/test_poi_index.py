@@ -0,0 +1,53 @@
+# tests/test_poi_index.py
+
+import json
+
+import numpy as np
+
+from oev_core.geometrie import haversine_m
+from poi_index import PoiIndex, importiere_extrakt
+
+
+def test_umkreis_wie_brute_force():
+    rng = np.random.default_rng(1)
+    lon, lat = rng.uniform(8.2, 8.6, 3000), rng.uniform(46.9, 47.4, 3000)
+    haltestellen = np.array([[8.31031, 47.04824], [8.54022, 47.37818], [8.4, 47.2], [9.5, 47.5]])
+    index = PoiIndex(lon, lat, zelle_m=250)
+
+    halt, poi, distanz = index.umkreis(haltestellen, 700)
+
+    erwartet = []
+    for i, h in enumerate(haltestellen):
+        d = haversine_m(np.column_stack((lon, lat)), h)
+        erwartet += sorted((i, float(d[j]), int(j)) for j in np.flatnonzero(d <= 700))
+    assert [(int(h), float(d), int(p)) for h, d, p in zip(halt, distanz, poi)] == erwartet
+    assert not (halt == 3).any()                       # ausserhalb des Gitters: keine Treffer
+
+
+def test_leerer_index_und_keine_punkte():
+    assert all(len(a) == 0 for a in PoiIndex([], []).umkreis([[8.3, 47.0]], 500))
+    assert all(len(a) == 0 for a in PoiIndex([8.3], [47.0]).umkreis([], 500))
+
+
+def test_import_und_index_aus_sqlite(tmp_path):
+    extrakt = tmp_path / "shops.geojsonseq"
+    features = [
+        {"type": "Feature", "properties": {"@type": "node", "@id": 1, "shop": "bakery", "name": "Bäckerei"},
+         "geometry": {"type": "Point", "coordinates": [8.31031, 47.04824]}},
+        {"type": "Feature", "properties": {"@type": "way", "@id": 2, "amenity": "cafe"},
+         "geometry": {"type": "Polygon", "coordinates": [[[8.3, 47.0], [8.302, 47.0], [8.302, 47.002], [8.3, 47.002]]]}},
+        {"type": "Feature", "properties": {"@type": "node", "@id": 3, "highway": "bus_stop"},
+         "geometry": {"type": "Point", "coordinates": [8.3, 47.0]}},
+    ]
+    extrakt.write_text("\n".join("\x1e" + json.dumps(f) for f in features), encoding="utf-8")
+    pfad = str(tmp_path / "poi.sqlite")
+
+    assert importiere_extrakt(str(extrakt), pfad) == 2
+    index = PoiIndex.aus_sqlite(pfad)
+    assert sorted(index.typen) == ["bakery", "cafe"]
+    _, poi, _ = index.umkreis([[8.301, 47.001]], 200)
+    assert list(index.namen[poi]) == ["Unbenannter Shop"]
+
+
+def test_index_ohne_poi_cache(tmp_path):
+    assert len(PoiIndex.aus_sqlite(str(tmp_path / "fehlt.sqlite"))) == 0
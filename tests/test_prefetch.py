@@ -0,0 +1,71 @@
+# tests/test_prefetch.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import prefetch
+from prefetch import SpekulativeSuche
+
+LUZERN_ZUERICH = {"start": "Luzern", "ziel": "Zürich HB", "datum": "2025-06-02", "uhrzeit": "14:00:00"}
+LUZERN_BERN = dict(LUZERN_ZUERICH, ziel="Bern")
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake-Ortssuche (blockiert, solange `frei` nicht gesetzt ist) und Fake-Trip-Anfrage."""
+    u = type("Upstream", (), {})()
+    u.frei, u.gestartet = threading.Event(), threading.Event()
+    u.orte, u.trips = [], []
+
+    def stop_place_lookup(name, api_key):
+        u.orte.append(name)
+        u.gestartet.set()
+        assert u.frei.wait(5)
+        return [(f"id-{name}", name)]
+
+    def trip_abfrage(start_id, start_name, ziel_id, ziel_name, datum, uhrzeit, api_key, typ):
+        u.trips.append((start_name, ziel_name))
+
+    monkeypatch.setattr(prefetch, "stop_place_lookup", stop_place_lookup)
+    monkeypatch.setattr(prefetch, "trip_abfrage", trip_abfrage)
+    return u
+
+
+def _delta(vorher):
+    return {k: v - vorher[k] for k, v in prefetch.statistik().items() if v != vorher[k]}
+
+
+def test_laufende_veraltete_suche_wird_verworfen(upstream):
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        suche, vorher = SpekulativeSuche("key", pool), prefetch.statistik()
+        assert suche.beobachten(LUZERN_ZUERICH)
+        assert upstream.gestartet.wait(5)             # alte Suche steckt in der Ortssuche
+        assert suche.beobachten(LUZERN_BERN)
+        upstream.frei.set()
+    # Die alte Suche läuft zu Ende, macht aber keine Trip-Anfrage mehr; nur die neue fragt an
+    assert upstream.trips == [("Luzern", "Bern")]
+    assert _delta(vorher)["verworfen"] == 1
+
+
+def test_wartende_veraltete_suche_wird_abgebrochen(upstream):
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        belegt = pool.submit(upstream.frei.wait, 5)    # einziger Worker belegt: Suche wartet
+        suche, vorher = SpekulativeSuche("key", pool), prefetch.statistik()
+        suche.beobachten(LUZERN_ZUERICH)
+        suche.beobachten(LUZERN_BERN)
+        upstream.frei.set()
+        belegt.result()
+    assert upstream.orte == ["Luzern", "Bern"]
+    assert upstream.trips == [("Luzern", "Bern")]
+    assert _delta(vorher) == {"gestartet": 2, "abgebrochen": 1, "haltestellen": 2, "trips": 1}
+
+
+def test_gleiche_slots_starten_nichts(upstream):
+    upstream.frei.set()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        suche = SpekulativeSuche("key", pool)
+        assert suche.beobachten(LUZERN_ZUERICH)
+        assert not suche.beobachten(dict(LUZERN_ZUERICH))
+    assert upstream.trips == [("Luzern", "Zürich HB")]
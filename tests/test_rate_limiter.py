@@ -0,0 +1,108 @@
+# tests/test_rate_limiter.py
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from rate_limiter import BATCH, QuotaErschoepft, TokenBucket, _retry_after_s, gedrosselt, prioritaet
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    def neu(rate_pro_min, kapazitaet=1, **kwargs):
+        return TokenBucket("test", rate_pro_min, kapazitaet, sqlite_pfad=str(tmp_path / "rate.sqlite"), **kwargs)
+    return neu
+
+
+def _dauer(fn, *args, **kwargs):
+    start = time.monotonic()
+    fn(*args, **kwargs)
+    return time.monotonic() - start
+
+
+def test_auffuellen_nach_rate(bucket):
+    b = bucket(600)                       # 10 Tokens/s
+    assert _dauer(b.acquire) < 0.05
+    assert 0.05 < _dauer(b.acquire) < 0.5
+    assert b.metriken()["erteilt"] == 2
+
+
+def test_zustand_gilt_fuer_alle_prozesse(bucket):
+    bucket(1).acquire()
+    with pytest.raises(QuotaErschoepft):
+        bucket(1).acquire(timeout=0.2)    # zweites Objekt, gleiche Datei: kein Token mehr
+
+
+def test_timeout_wirft_quota_erschoepft(bucket):
+    b = bucket(1)
+    b.acquire()
+    start = time.monotonic()
+    with pytest.raises(QuotaErschoepft):
+        b.acquire(timeout=0.2)
+    assert time.monotonic() - start < 0.5  # Wartezeit länger als Frist: sofort abgelehnt
+    assert b.metriken()["abgelehnt"] == 1
+
+
+def test_tagesquota(bucket):
+    b = bucket(600, tages_quota=1)
+    b.acquire()
+    with pytest.raises(QuotaErschoepft, match="Tagesquota"):
+        b.acquire()
+
+
+def test_interaktiv_vor_batch(bucket):
+    b = bucket(300)                       # ein Token alle 0.2 s
+    b.acquire()
+    reihenfolge = []
+
+    def batch():
+        with prioritaet(BATCH):
+            b.acquire()
+        reihenfolge.append("batch")
+
+    def interaktiv():
+        b.acquire()
+        reihenfolge.append("interaktiv")
+
+    t_batch = threading.Thread(target=batch)
+    t_batch.start()
+    time.sleep(0.05)                      # Batch wartet schon, bevor die interaktive Anfrage kommt
+    t_interaktiv = threading.Thread(target=interaktiv)
+    t_interaktiv.start()
+    t_batch.join(5)
+    t_interaktiv.join(5)
+    assert reihenfolge == ["interaktiv", "batch"]
+
+
+def test_drosseln_sperrt_den_bucket(bucket):
+    b = bucket(6000, kapazitaet=10)
+    b.drosseln(0.3)
+    assert 0.25 < _dauer(b.acquire) < 1.0
+    assert b.metriken()["gedrosselt_429"] == 1
+
+
+def test_429_mit_retry_after_wird_wiederholt(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_SQLITE", str(tmp_path / "rate.sqlite"))
+    monkeypatch.setitem(rate_limiter.LIMITS, "ojp", {"rate_pro_min": 6000, "tages_quota": 100})
+    antworten = [SimpleNamespace(status_code=429, headers={"Retry-After": "0.3"}),
+                 SimpleNamespace(status_code=200, headers={})]
+    start = time.monotonic()
+    resp = gedrosselt("test-429", "ojp", antworten.pop, 0)
+    assert resp.status_code == 200
+    assert 0.25 < time.monotonic() - start < 1.0
+
+
+def test_retry_after_formate():
+    assert _retry_after_s("120") == 120
+    assert _retry_after_s("1.5") == 1.5
+    in_10s = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10), usegmt=True)
+    assert 8 < _retry_after_s(in_10s) <= 10
+    assert _retry_after_s("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert _retry_after_s("bald") == 30.0
+    assert _retry_after_s(None) == 30.0
+    assert _retry_after_s("inf") == 30.0
@@ -0,0 +1,80 @@
+# tests/test_singleflight.py
+
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+import ojp_client
+from singleflight import SingleFlight
+
+
+def _parallel(anzahl, fn):
+    """`fn` in `anzahl` Threads gleichzeitig; gibt Ergebnisse bzw. Exceptions zurück."""
+    start = threading.Barrier(anzahl)
+    ergebnisse = []
+
+    def lauf(i):
+        start.wait()
+        try:
+            ergebnisse.append(fn(i))
+        except Exception as e:
+            ergebnisse.append(e)
+
+    threads = [threading.Thread(target=lauf, args=(i,)) for i in range(anzahl)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return ergebnisse
+
+
+def test_gleichzeitige_aufrufe_teilen_eine_ausfuehrung():
+    flight, aufrufe = SingleFlight(), []
+
+    def langsam():
+        aufrufe.append(1)
+        time.sleep(0.2)
+        return "xml"
+
+    assert _parallel(8, lambda i: flight.do("k", langsam)) == ["xml"] * 8
+    assert len(aufrufe) == 1
+    assert (flight.ausgefuehrt, flight.geteilt) == (1, 7)
+
+
+def test_exception_erreicht_alle_wartenden():
+    flight = SingleFlight()
+
+    def kaputt():
+        time.sleep(0.2)
+        raise ValueError("upstream")
+
+    ergebnisse = _parallel(5, lambda i: flight.do("k", kaputt))
+    assert len(ergebnisse) == 5
+    assert all(isinstance(e, ValueError) for e in ergebnisse)
+    assert flight.ausgefuehrt == 1
+
+
+def test_nach_abschluss_nichts_gecacht():
+    flight, aufrufe = SingleFlight(), []
+    for _ in range(2):
+        flight.do("k", aufrufe.append, 1)
+    assert len(aufrufe) == 2
+    with pytest.raises(KeyError):
+        flight.do("k", {}.__getitem__, "fehlt")
+    assert flight.do("k", lambda: "wieder frei") == "wieder frei"
+
+
+def test_ortssuche_teilt_nur_mit_gleichem_key(monkeypatch):
+    aufrufe = []
+
+    def location_request(ort_name, api_key, requestor_ref):
+        aufrufe.append(api_key)
+        time.sleep(0.2)
+        return [("8505000", "Luzern")]
+
+    monkeypatch.setattr(ojp_client, "_location_request", location_request)
+    monkeypatch.setattr(ojp_client, "_orte_cache", OrderedDict())
+    _parallel(6, lambda i: ojp_client.stop_place_lookup("Luzern", f"key-{i % 2}"))
+    assert sorted(aufrufe) == ["key-0", "key-1"]
@@ -0,0 +1,62 @@
+# tests/test_teil_reiseinfos.py
+
+import pytest
+
+from oev_core import teil_reiseinfos
+
+
+def _nutzer(*texte):
+    return [{"role": "user", "content": t} for t in texte]
+
+
+def test_start_ziel_zeit_datum():
+    assert teil_reiseinfos(_nutzer("Ich möchte am 2025-06-02 um 10 Uhr von Luzern nach Engelberg fahren.")) == {
+        "start": "Luzern", "ziel": "Engelberg", "uhrzeit": "10:00:00", "datum": "2025-06-02"}
+
+
+def test_satzende_beendet_ortsnamen():
+    slots = teil_reiseinfos(_nutzer("von Bern nach Thun. Ab 8 Uhr"))
+    assert slots["start"] == "Bern"
+    assert slots["ziel"] == "Thun"
+    assert slots["uhrzeit"] == "08:00:00"
+
+
+@pytest.mark.parametrize("text, start, ziel", [
+    ("von St. Gallen nach Zürich HB", "St. Gallen", "Zürich HB"),
+    ("von Muri b. Bern nach Affoltern am Albis", "Muri b. Bern", "Affoltern am Albis"),
+    ("nach Rapperswil-Jona", None, "Rapperswil-Jona"),
+])
+def test_mehrteilige_ortsnamen(text, start, ziel):
+    slots = teil_reiseinfos(_nutzer(text))
+    assert slots.get("start") == start
+    assert slots.get("ziel") == ziel
+
+
+@pytest.mark.parametrize("text", ["bis Montag", "nach Hause", "ab Juni", "bis Freitag Abend", "nach Mittag"])
+def test_keine_orte(text):
+    slots = teil_reiseinfos(_nutzer(text))
+    assert "start" not in slots and "ziel" not in slots
+
+
+def test_spaetere_nennung_ueberschreibt():
+    assert teil_reiseinfos(_nutzer("nach Bern", "nein, doch nach Basel SBB"))["ziel"] == "Basel SBB"
+
+
+def test_ortsname_als_antwort_auf_rueckfrage():
+    verlauf = [
+        {"role": "assistant", "content": "Wohin möchtest du reisen?"},
+        {"role": "user", "content": "Zürich HB"},
+        {"role": "assistant", "content": "Und von wo fährst du los?"},
+        {"role": "user", "content": "St. Gallen."},
+        {"role": "assistant", "content": "Wann?"},
+        {"role": "user", "content": "am 3.7.2025 um 14:30, ich muss spätestens dort sein"},
+    ]
+    assert teil_reiseinfos(verlauf) == {"ziel": "Zürich HB", "start": "St. Gallen", "uhrzeit": "14:30:00",
+                                        "datum": "2025-07-03", "typ": "ankunft"}
+
+
+def test_zeitfenster_und_fremde_rollen():
+    verlauf = [{"role": "system", "content": "von Genf nach Lugano"}] + _nutzer("zwischen 8 und 11 Uhr")
+    slots = teil_reiseinfos(verlauf)
+    assert slots["fenster"] is True
+    assert "start" not in slots
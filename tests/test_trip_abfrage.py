@@ -0,0 +1,41 @@
+# tests/test_trip_abfrage.py
+
+from ojp_client import trip_abfrage
+
+DATUM = "2025-06-02"
+
+
+def test_abfahrt_nicht_vor_gewuenschter_zeit(fahrplan):
+    fahrplan.abfahrten += [("08:55:00", "a"), ("08:58:00", "b"), ("09:05:00", "c")]
+    xml_text = trip_abfrage("1", "A", "2", "B", DATUM, "08:57:00", "key")
+    # Angefragt wird der Bucket-Anfang, geliefert nur ab 08:57
+    assert fahrplan.anfragen == ["08:55:00"]
+    assert fahrplan.journeys(xml_text) == ["b", "c"]
+
+
+def test_ankunft_nicht_nach_gewuenschter_zeit(fahrplan):
+    fahrplan.abfahrten += [("08:50:00", "a"), ("08:56:00", "b"), ("08:59:00", "c")]
+    xml_text = trip_abfrage("1", "A", "2", "B", DATUM, "08:57:00", "key", typ="ankunft")
+    assert fahrplan.anfragen == ["09:00:00"]
+    assert fahrplan.journeys(xml_text) == ["a", "b"]
+
+
+def test_gleicher_bucket_aus_dem_cache(fahrplan):
+    fahrplan.abfahrten += [("08:55:00", "a"), ("08:58:00", "b"), ("09:05:00", "c")]
+    trip_abfrage("1", "A", "2", "B", DATUM, "08:55:00", "key")
+    xml_text = trip_abfrage("1", "A", "2", "B", DATUM, "08:59:00", "key")
+    assert fahrplan.anfragen == ["08:55:00"]
+    assert fahrplan.journeys(xml_text) == ["c"]
+
+
+def test_nichts_uebrig_fragt_genaue_zeit(fahrplan):
+    fahrplan.abfahrten += [("08:55:00", "a"), ("08:56:00", "b"), ("09:30:00", "c")]
+    xml_text = trip_abfrage("1", "A", "2", "B", DATUM, "08:58:00", "key", anzahl=2)
+    assert fahrplan.anfragen == ["08:55:00", "08:58:00"]
+    assert fahrplan.journeys(xml_text) == ["c"]
+
+
+def test_ungueltige_zeit_geht_ungecacht_an_ojp(fahrplan):
+    fahrplan.abfahrten += [("08:55:00", "a")]
+    trip_abfrage("1", "A", "2", "B", DATUM, "25:99:00", "key")
+    assert fahrplan.anfragen == ["25:99:00"]
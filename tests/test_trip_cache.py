@@ -0,0 +1,51 @@
+# tests/test_trip_cache.py
+
+from datetime import datetime, timedelta
+
+from google.transit import gtfs_realtime_pb2
+
+from trip_cache import TripCache
+
+XML = "<ojp:StopPointRef>8505000:0:6</ojp:StopPointRef><ojp:StopPointRef>ch:1:sloid:3000:5:8</ojp:StopPointRef>"
+MORGEN = datetime.now() + timedelta(days=1)
+
+
+def _feed(stop_id, delay=0, ausfall=False):
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    tu = feed.entity.add(id="1").trip_update
+    tu.trip.trip_id = "t1"
+    if ausfall:
+        tu.trip.schedule_relationship = gtfs_realtime_pb2.TripDescriptor.CANCELED
+    stu = tu.stop_time_update.add(stop_id=stop_id)
+    stu.departure.delay = delay
+    return feed
+
+
+def test_verspaetung_ab_schwelle_invalidiert():
+    cache = TripCache()
+    cache.put("a", XML, MORGEN)
+    assert cache.invalidiere_aus_feed(_feed("8503000:0:3", delay=120)) == 0
+    assert cache.get("a") == XML
+    assert cache.invalidiere_aus_feed(_feed("8503000:0:3", delay=300)) == 1
+    assert cache.get("a") is None
+
+
+def test_ausfall_invalidiert():
+    cache = TripCache()
+    cache.put("a", XML, MORGEN)
+    cache.invalidiere_aus_feed(_feed("8505000", ausfall=True))
+    assert cache.get("a") is None
+
+
+def test_invalidierung_erreicht_lru_anderer_prozesse(tmp_path):
+    pfad = str(tmp_path / "trips.sqlite")
+    schreiber, leser = TripCache(sqlite_pfad=pfad), TripCache(sqlite_pfad=pfad)
+    schreiber.put("a", XML, MORGEN)
+    schreiber.put("b", "<ojp:StopPointRef>8507000</ojp:StopPointRef>", MORGEN)
+    assert leser.get("a") == XML                 # liegt jetzt auch im LRU des Lesers
+    assert leser.get("b") is not None
+
+    schreiber.invalidiere_haltestellen({"8503000"})
+    assert leser.get("a") is None
+    assert leser.get("b") is not None            # nicht betroffen, aus der zweiten Stufe neu gelesen
@@ -0,0 +1,26 @@
+# tests/test_trip_digest.py
+
+from oev_core import trip_digest
+
+
+def _fahrt(ab: str, an: str, linie: str = "IR70"):
+    return [{"type": "ride", "line": linie, "dep_sta": "Luzern", "dep_time": ab, "dep_quay": "6",
+             "arr_sta": "Zürich HB", "arr_time": an, "arr_quay": "12"}]
+
+
+def test_alle_angezeigten_alternativen():
+    alts = [_fahrt(f"{8 + i:02d}:09:00", f"{8 + i:02d}:51:00") for i in range(7)]
+    digest = trip_digest(_fahrt("07:09:00", "07:51:00"), alts)
+    assert "Alternative 7: 14:09–14:51" in digest
+    assert "nicht aufgeführt" not in digest
+
+
+def test_gekuerzt_mit_hinweis():
+    alts = [_fahrt(f"{8 + i:02d}:09:00", f"{8 + i:02d}:51:00") for i in range(7)]
+    digest = trip_digest(_fahrt("07:09:00", "07:51:00"), alts, max_alternativen=4)
+    assert "Alternative 4:" in digest and "Alternative 5:" not in digest
+    assert digest.endswith("Weitere 3 Alternativen nicht aufgeführt.")
+
+
+def test_ohne_verbindungen():
+    assert trip_digest([], []) == "Es wurden keine Verbindungen gefunden."
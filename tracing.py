@@ -0,0 +1,260 @@
+# tracing.py
+#
+# Leichte Latenz-Messung pro Stufe: verschachtelte Spans mit Dauer und Payload-Grösse,
+# gesammelt in einer Registry im Prozess. Ausgabe als Debug-Sidebar in Streamlit,
+# als JSON-Logzeilen (TRACE_JSON_LOG=1) oder im Prometheus-Textformat (TRACE_METRICS_PORT).
+# Ist opentelemetry installiert, wird jeder Span zusätzlich dorthin gemeldet.
+
+import contextvars
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # OpenTelemetry ist optional
+    otel_trace = None
+
+logger = logging.getLogger("oev.trace")
+if os.environ.get("TRACE_JSON_LOG"):
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Streamlit steuert st.rerun()/st.stop() über Exceptions – das sind keine Fehler
+_KONTROLLFLUSS = {"RerunException", "StopException"}
+
+_aktiver_span = contextvars.ContextVar("aktiver_span", default=None)
+_sitzung = contextvars.ContextVar("sitzung", default=None)
+_span_ids = itertools.count(1)
+
+# ------------------------- 1) Span & Registry -------------------------
+
+class Span:
+    """Ein gemessener Abschnitt. Attribute (z. B. Bytes, Status) per `setze()` ergänzen."""
+
+    __slots__ = ("name", "span_id", "eltern_id", "sitzung", "attribute", "start", "dauer_ms", "fehler")
+
+    def __init__(self, name: str, eltern_id=None, sitzung=None, **attribute):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.eltern_id = eltern_id
+        self.sitzung = sitzung
+        self.attribute = attribute
+        self.start = time.time()
+        self.dauer_ms = None
+        self.fehler = None
+
+    def setze(self, **attribute):
+        self.attribute.update(attribute)
+
+    def als_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "eltern_id": self.eltern_id,
+            "sitzung": self.sitzung,
+            "start": round(self.start, 3),
+            "dauer_ms": round(self.dauer_ms, 3) if self.dauer_ms is not None else None,
+            "fehler": self.fehler,
+            **self.attribute,
+        }
+
+
+class Registry:
+    """Letzte Spans (Ringpuffer) und Kennzahlen pro Span-Name, threadsicher."""
+
+    def __init__(self, max_spans: int = 2000, max_werte: int = 1000):
+        self._lock = threading.Lock()
+        self._spans = deque(maxlen=max_spans)
+        self._dauern: dict[str, deque] = {}
+        self._max_werte = max_werte
+        self._anzahl: dict[str, int] = {}
+        self._summe_s: dict[str, float] = {}
+        self._fehler: dict[str, int] = {}
+        self._bytes: dict[tuple[str, str], int] = {}
+
+    def aufzeichnen(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+            name = span.name
+            self._dauern.setdefault(name, deque(maxlen=self._max_werte)).append(span.dauer_ms)
+            self._anzahl[name] = self._anzahl.get(name, 0) + 1
+            self._summe_s[name] = self._summe_s.get(name, 0.0) + span.dauer_ms / 1000
+            if span.fehler:
+                self._fehler[name] = self._fehler.get(name, 0) + 1
+            for richtung in ("anfrage_bytes", "antwort_bytes"):
+                if richtung in span.attribute:
+                    k = (name, richtung)
+                    self._bytes[k] = self._bytes.get(k, 0) + int(span.attribute[richtung])
+
+    def letzte(self, n: int = 50, sitzung=None) -> list[dict]:
+        with self._lock:
+            spans = [s for s in self._spans if sitzung is None or s.sitzung == sitzung]
+        return [s.als_dict() for s in spans[-n:]]
+
+    def statistik(self) -> list[dict]:
+        with self._lock:
+            werte = {name: sorted(d) for name, d in self._dauern.items()}
+            anzahl, fehler, bytes_ = dict(self._anzahl), dict(self._fehler), dict(self._bytes)
+
+        def perzentil(w, p):
+            return w[min(len(w) - 1, int(p * len(w)))]
+
+        return [{
+            "name": name,
+            "anzahl": anzahl[name],
+            "fehler": fehler.get(name, 0),
+            "p50_ms": round(perzentil(w, 0.50), 2),
+            "p95_ms": round(perzentil(w, 0.95), 2),
+            "max_ms": round(w[-1], 2),
+            "anfrage_bytes": bytes_.get((name, "anfrage_bytes"), 0),
+            "antwort_bytes": bytes_.get((name, "antwort_bytes"), 0),
+        } for name, w in sorted(werte.items())]
+
+    def prometheus_text(self) -> str:
+        """Kennzahlen im Prometheus-Textformat (Summary pro Span-Name)."""
+        with self._lock:
+            werte = {name: sorted(d) for name, d in self._dauern.items()}
+            anzahl, summe = dict(self._anzahl), dict(self._summe_s)
+            fehler, bytes_ = dict(self._fehler), dict(self._bytes)
+
+        zeilen = [
+            "# HELP oev_span_dauer_sekunden Dauer der Pipeline-Stufen und externen Aufrufe",
+            "# TYPE oev_span_dauer_sekunden summary",
+        ]
+        for name, w in sorted(werte.items()):
+            for q in (0.5, 0.95, 0.99):
+                wert = w[min(len(w) - 1, int(q * len(w)))] / 1000
+                zeilen.append(f'oev_span_dauer_sekunden{{span="{name}",quantile="{q}"}} {wert:.6f}')
+            zeilen.append(f'oev_span_dauer_sekunden_sum{{span="{name}"}} {summe[name]:.6f}')
+            zeilen.append(f'oev_span_dauer_sekunden_count{{span="{name}"}} {anzahl[name]}')
+        zeilen += ["# HELP oev_span_fehler_total Spans mit Fehler", "# TYPE oev_span_fehler_total counter"]
+        for name in sorted(werte):
+            zeilen.append(f'oev_span_fehler_total{{span="{name}"}} {fehler.get(name, 0)}')
+        zeilen += ["# HELP oev_span_bytes_total Payload-Grösse externer Aufrufe", "# TYPE oev_span_bytes_total counter"]
+        for (name, richtung), n in sorted(bytes_.items()):
+            zeilen.append(f'oev_span_bytes_total{{span="{name}",richtung="{richtung.split("_")[0]}"}} {n}')
+        return "\n".join(zeilen) + "\n"
+
+
+registry = Registry()
+
+# ------------------------- 2) API -------------------------
+
+def setze_sitzung(sitzung: str = None) -> str:
+    """
+    Ordnet alle folgenden Spans dieses Threads einer Sitzung zu (in Streamlit zu Beginn
+    jedes Durchlaufs mit einer in st.session_state gemerkten ID aufrufen).
+    """
+    sitzung = sitzung or uuid.uuid4().hex[:12]
+    _sitzung.set(sitzung)
+    return sitzung
+
+
+def aktuelle_sitzung():
+    return _sitzung.get()
+
+
+@contextmanager
+def span(name: str, **attribute):
+    """
+    Misst den Block als Span. Verschachtelte Spans verweisen auf ihren Eltern-Span.
+
+        with tracing.span("ojp.trip", anfrage_bytes=len(body)) as sp:
+            resp = requests.post(...)
+            sp.setze(antwort_bytes=len(resp.content), status=resp.status_code)
+    """
+    eltern = _aktiver_span.get()
+    s = Span(name, eltern.span_id if eltern else None, _sitzung.get(), **attribute)
+    token = _aktiver_span.set(s)
+    otel_cm = otel_trace.get_tracer("oev").start_as_current_span(name) if otel_trace else None
+    otel_span = otel_cm.__enter__() if otel_cm else None
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        if type(e).__name__ not in _KONTROLLFLUSS:
+            s.fehler = type(e).__name__
+        raise
+    finally:
+        s.dauer_ms = (time.perf_counter() - t0) * 1000
+        _aktiver_span.reset(token)
+        registry.aufzeichnen(s)
+        if otel_span is not None:
+            for k, v in s.attribute.items():
+                if isinstance(v, (str, bool, int, float)):
+                    otel_span.set_attribute(k, v)
+            otel_cm.__exit__(None, None, None)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(s.als_dict(), ensure_ascii=False, default=str))
+
+# ------------------------- 3) Ausgabe: Streamlit & Prometheus -------------------------
+
+def debug_sidebar(titel: str = "🔧 Debug: Latenzen"):
+    """Zeigt die letzten Spans dieser Sitzung und die Kennzahlen pro Stufe in der Sidebar."""
+    import streamlit as st
+
+    with st.sidebar.expander(titel, expanded=False):
+        sitzung = aktuelle_sitzung()
+        spans = registry.letzte(100, sitzung=sitzung)
+        st.caption(f"Sitzung {sitzung or '–'}: letzte {len(spans)} Spans (neueste unten)")
+        if spans:
+            st.dataframe(
+                [{k: v for k, v in s.items() if k not in ("sitzung", "start")} for s in spans],
+                hide_index=True,
+            )
+        st.caption("Alle Durchläufe dieses Prozesses")
+        st.dataframe(registry.statistik(), hide_index=True)
+
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+
+def starte_metrics_server(port: int, host: str = "127.0.0.1"):
+    """
+    Startet einmal pro Prozess einen HTTP-Server mit /metrics (Prometheus) und /spans (JSON).
+    Weitere Aufrufe (z. B. bei jedem Streamlit-Rerun) geben den laufenden Server zurück.
+    """
+    global _metrics_server
+    with _metrics_lock:
+        if _metrics_server is not None:
+            return _metrics_server
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, typ = registry.prometheus_text().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/spans":
+                    body, typ = json.dumps(registry.letzte(500), default=str).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", typ)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        _metrics_server = server
+        return server
+
+
+if os.environ.get("TRACE_METRICS_PORT"):
+    starte_metrics_server(int(os.environ["TRACE_METRICS_PORT"]))
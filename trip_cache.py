@@ -0,0 +1,271 @@
+# trip_cache.py
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+try:
+    import redis
+except ImportError:  # Redis ist optional
+    redis = None
+
+# ------------------------- 1) Hilfsfunktionen -------------------------
+
+def _uic(ref: str) -> str:
+    """
+    Normalisiert Haltestellen-Referenzen auf die UIC-Nummer, damit OJP und GTFS-RT vergleichbar sind:
+      'ch:1:sloid:3000:5:8' → '8503000', '8503000:0:3' → '8503000', '8503000' → '8503000'
+    """
+    m = re.match(r'^ch:1:sloid:(\d+)', ref)
+    if m:
+        return '85' + m.group(1).zfill(5)
+    return ref.split(':', 1)[0]
+
+
+def _haltestellen_aus_xml(xml_text: str) -> set[str]:
+    """Alle StopPointRef/StopPlaceRef der Antwort als UIC-Nummern (ohne XML-Parse, nur Regex)."""
+    refs = re.findall(r'<(?:\w+:)?Stop(?:Point|Place)Ref>([^<]+)</', xml_text)
+    return {_uic(r.strip()) for r in refs}
+
+
+def zeit_bucket(datum: str, uhrzeit: str, typ: str = "abfahrt", bucket_min: int = 5) -> datetime:
+    """
+    Rundet den gewünschten Zeitpunkt auf den Bucket: bei Abfahrt abwärts, bei Ankunft aufwärts.
+    So deckt die Antwort für den Bucket jede Anfrage innerhalb des Buckets ab.
+    """
+    dt = datetime.fromisoformat(f"{datum}T{uhrzeit}")
+    unten = dt.replace(second=0, microsecond=0) - timedelta(minutes=(dt.hour * 60 + dt.minute) % bucket_min)
+    if typ != "abfahrt" and unten != dt:
+        return unten + timedelta(minutes=bucket_min)
+    return unten
+
+
+MAX_TTL_S = 6 * 60 * 60
+
+
+def ttl_fuer(abfahrt: datetime, jetzt: datetime = None) -> int:
+    """Kurze TTL für baldige Abfahrten (Echtzeit ändert sich), lange für künftige Tage."""
+    jetzt = jetzt or datetime.now()
+    delta = abfahrt - jetzt
+    if delta < timedelta(hours=2):
+        return 60
+    if delta < timedelta(hours=24):
+        return 10 * 60
+    return MAX_TTL_S
+
+# ------------------------- 2) Cache mit optionaler zweiter Stufe -------------------------
+
+class TripCache:
+    """
+    Geteilter Cache für OJP-Trip-Antworten, Schlüssel (start, ziel, typ, Zeit-Bucket).
+
+    Stufe 1 ist ein LRU im Prozess. Optional kommt eine lokale zweite Stufe dazu,
+    die mehrere Prozesse teilen: SQLite-Datei (`sqlite_pfad`) oder Redis (`redis_url`).
+    Die zweite Stufe führt einen Invalidierungszähler: Jeder LRU-Eintrag merkt sich den
+    Stand beim Schreiben bzw. Lesen, und nach einer Invalidierung in einem anderen Prozess
+    wird er bei seinem nächsten Treffer aus der zweiten Stufe neu gelesen.
+    """
+
+    def __init__(self, max_eintraege: int = 512, bucket_min: int = 5,
+                 sqlite_pfad: str = None, redis_url: str = None):
+        self.max_eintraege = max_eintraege
+        self.bucket_min = bucket_min
+        # key → (ablauf, xml, haltestellen, generation)
+        self._lru: "OrderedDict[str, tuple[float, str, set, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.treffer = 0
+        self.fehlschlaege = 0
+
+        self._sqlite_pfad = sqlite_pfad
+        if sqlite_pfad:
+            with self._sqlite() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS trip_cache (
+                        key         TEXT PRIMARY KEY,
+                        xml         TEXT NOT NULL,
+                        haltestellen TEXT NOT NULL,   -- JSON-Liste von UIC-Nummern
+                        ablauf      REAL NOT NULL
+                    )
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS trip_cache_meta (
+                        name TEXT PRIMARY KEY,
+                        wert INTEGER NOT NULL
+                    )
+                """)
+
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                raise RuntimeError("redis_url gesetzt, aber das Paket 'redis' ist nicht installiert.")
+            self._redis = redis.Redis.from_url(redis_url)
+
+    @classmethod
+    def aus_umgebung(cls) -> "TripCache":
+        """Konfiguration über TRIP_CACHE_SQLITE, TRIP_CACHE_REDIS_URL und TRIP_CACHE_BUCKET_MIN."""
+        return cls(
+            bucket_min=int(os.environ.get("TRIP_CACHE_BUCKET_MIN", "5")),
+            sqlite_pfad=os.environ.get("TRIP_CACHE_SQLITE") or None,
+            redis_url=os.environ.get("TRIP_CACHE_REDIS_URL") or None,
+        )
+
+    def _sqlite(self):
+        return sqlite3.connect(self._sqlite_pfad, timeout=5)
+
+    def key(self, start_id, ziel_id, typ, bucket: datetime) -> str:
+        return f"{start_id}|{ziel_id}|{typ}|{bucket:%Y-%m-%dT%H:%M}"
+
+    # ---------- Lesen / Schreiben ----------
+
+    def get(self, key: str):
+        jetzt = time.time()
+        generation = self._generation()
+        with self._lock:
+            eintrag = self._lru.get(key)
+            if eintrag and eintrag[0] > jetzt and eintrag[3] == generation:
+                self._lru.move_to_end(key)
+                self.treffer += 1
+                return eintrag[1]
+            self._lru.pop(key, None)
+
+        eintrag = self._get_zweite_stufe(key, jetzt, generation)
+        with self._lock:
+            if eintrag:
+                self._lru[key] = eintrag
+                self._lru_kuerzen()
+                self.treffer += 1
+                return eintrag[1]
+            self.fehlschlaege += 1
+        return None
+
+    def put(self, key: str, xml_text: str, abfahrt: datetime):
+        ttl = ttl_fuer(abfahrt)
+        haltestellen = _haltestellen_aus_xml(xml_text)
+        eintrag = (time.time() + ttl, xml_text, haltestellen, self._generation())
+        with self._lock:
+            self._lru[key] = eintrag
+            self._lru.move_to_end(key)
+            self._lru_kuerzen()
+
+        if self._sqlite_pfad:
+            with self._sqlite() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO trip_cache (key, xml, haltestellen, ablauf) VALUES (?, ?, ?, ?)",
+                    (key, xml_text, json.dumps(sorted(haltestellen)), eintrag[0])
+                )
+        if self._redis is not None:
+            pipe = self._redis.pipeline()
+            pipe.setex(f"tripcache:{key}", ttl, xml_text)
+            for uic in haltestellen:
+                pipe.sadd(f"tripcache:stop:{uic}", key)
+                pipe.expire(f"tripcache:stop:{uic}", MAX_TTL_S)
+            pipe.execute()
+
+    def _get_zweite_stufe(self, key, jetzt, generation):
+        if self._redis is not None:
+            xml_text = self._redis.get(f"tripcache:{key}")
+            ttl = self._redis.ttl(f"tripcache:{key}")
+            if xml_text is not None and ttl and ttl > 0:
+                xml_text = xml_text.decode("utf-8")
+                return (jetzt + ttl, xml_text, _haltestellen_aus_xml(xml_text), generation)
+        if self._sqlite_pfad:
+            with self._sqlite() as conn:
+                row = conn.execute(
+                    "SELECT xml, haltestellen, ablauf FROM trip_cache WHERE key = ? AND ablauf > ?",
+                    (key, jetzt)
+                ).fetchone()
+            if row:
+                return (row[2], row[0], set(json.loads(row[1])), generation)
+        return None
+
+    def _generation(self):
+        """Invalidierungszähler der zweiten Stufe (ein Lesezugriff); ohne zweite Stufe None."""
+        if self._redis is not None:
+            return int(self._redis.get("tripcache:generation") or 0)
+        if self._sqlite_pfad:
+            with self._sqlite() as conn:
+                row = conn.execute("SELECT wert FROM trip_cache_meta WHERE name = 'generation'").fetchone()
+            return row[0] if row else 0
+        return None
+
+    def _generation_erhoehen(self):
+        if self._redis is not None:
+            self._redis.incr("tripcache:generation")
+        if self._sqlite_pfad:
+            with self._sqlite() as conn:
+                conn.execute(
+                    "INSERT INTO trip_cache_meta (name, wert) VALUES ('generation', 1) "
+                    "ON CONFLICT(name) DO UPDATE SET wert = wert + 1"
+                )
+
+    def _lru_kuerzen(self):
+        while len(self._lru) > self.max_eintraege:
+            self._lru.popitem(last=False)
+
+    # ---------- Invalidierung ----------
+
+    def invalidiere_haltestellen(self, uics: set[str]) -> int:
+        """Entfernt alle Einträge, deren Verbindungen eine der Haltestellen berühren."""
+        if not uics:
+            return 0
+        with self._lock:
+            betroffen = [k for k, (_, _, h, _) in self._lru.items() if h & uics]
+            for k in betroffen:
+                del self._lru[k]
+        anzahl = len(betroffen)
+
+        geteilt = 0
+        if self._sqlite_pfad:
+            with self._sqlite() as conn:
+                rows = conn.execute("SELECT key, haltestellen FROM trip_cache").fetchall()
+                keys = [(k,) for k, h in rows if set(json.loads(h)) & uics]
+                conn.executemany("DELETE FROM trip_cache WHERE key = ?", keys)
+                geteilt += len(keys)
+        if self._redis is not None:
+            for uic in uics:
+                keys = self._redis.smembers(f"tripcache:stop:{uic}")
+                if keys:
+                    geteilt += self._redis.delete(*[b"tripcache:" + k for k in keys])
+        # Jeder noch gültige Eintrag steht auch in der zweiten Stufe: nur wenn dort etwas
+        # wegfiel, können andere Prozesse betroffene Einträge im LRU haben
+        if geteilt:
+            self._generation_erhoehen()
+        return anzahl + geteilt
+
+    def invalidiere_aus_feed(self, feed, schwelle_s: int = 300) -> int:
+        """
+        Wertet einen GTFS-RT FeedMessage aus: Haltestellen mit Ausfall, ausgelassenem Halt
+        oder Verspätung ab `schwelle_s` gelten als gestört; zugehörige Trips fliegen aus dem Cache.
+        """
+        gestoert = set()
+        for entity in feed.entity:
+            if not entity.HasField('trip_update'):
+                continue
+            tu = entity.trip_update
+            # TripDescriptor.CANCELED = 3
+            ausfall = tu.trip.schedule_relationship == 3
+            for stu in tu.stop_time_update:
+                # StopTimeUpdate.SKIPPED = 1
+                if ausfall or stu.schedule_relationship == 1:
+                    gestoert.add(_uic(stu.stop_id))
+                    continue
+                for ev in (stu.arrival, stu.departure):
+                    if ev.HasField('delay') and ev.delay >= schwelle_s:
+                        gestoert.add(_uic(stu.stop_id))
+                        break
+        return self.invalidiere_haltestellen(gestoert)
+
+    def statistik(self) -> dict:
+        with self._lock:
+            gesamt = self.treffer + self.fehlschlaege
+            return {
+                'eintraege': len(self._lru),
+                'treffer': self.treffer,
+                'fehlschlaege': self.fehlschlaege,
+                'trefferquote': self.treffer / gesamt if gesamt else 0.0,
+            }